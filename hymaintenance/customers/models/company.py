@@ -1,6 +1,8 @@
 import os
 
+from django.db import connections
 from django.db import models
+from django.db import transaction
 from django.urls import reverse
 from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy as _
@@ -10,6 +12,44 @@ def _get_logo_file_path(instance, filename):
     return os.path.join("upload", instance.slug_name, "logo", filename)
 
 
+def can_return_rows_from_update(connection):
+    if connection.vendor == "postgresql":
+        return True
+    # since SQLite 3.35
+    return connection.vendor == "sqlite" and connection.Database.sqlite_version_info >= (3, 35, 0)
+
+
+class CompanyManager(models.Manager):
+    def allocate_issues_numbers(self, company_id, count=1):
+        """Increments the issues counter of the company and returns the range of the allocated issues numbers.
+
+        The counter is incremented and read in a single statement when the database supports UPDATE ... RETURNING,
+        so its row is locked by this statement only, outside of a transaction. Several numbers can be allocated at
+        once, for the issues created in bulk.
+        """
+        connection = connections[self.db]
+        if can_return_rows_from_update(connection):
+            quote_name = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE {table} SET {counter} = {counter} + %s WHERE {id} = %s RETURNING {counter}".format(
+                        table=quote_name(self.model._meta.db_table),
+                        counter=quote_name("issues_counter"),
+                        id=quote_name("id"),
+                    ),
+                    [count, company_id],
+                )
+                row = cursor.fetchone()
+            if row is None:
+                raise self.model.DoesNotExist("Company matching query does not exist.")
+            last_number = row[0]
+        else:
+            with transaction.atomic(using=self.db):
+                self.filter(id=company_id).update(issues_counter=models.F("issues_counter") + count)
+                last_number = self.filter(id=company_id).values_list("issues_counter", flat=True).get()
+        return range(last_number - count + 1, last_number + 1)
+
+
 class Company(models.Model):
     name = models.CharField(_("Name"), max_length=255)
     slug_name = models.SlugField(editable=False, unique=True, max_length=255)
@@ -28,6 +68,8 @@ class Company(models.Model):
     logo = models.ImageField(_("Logo"), null=True, blank=True, max_length=200, upload_to=_get_logo_file_path)
     displayed_month_number = models.PositiveIntegerField(default=6)
 
+    objects = CompanyManager()
+
     def __str__(self):
         return self.name
 
@@ -276,6 +276,37 @@ class MaintenanceUser(AbstractBaseUser, PermissionsMixin):
         """Returns True if the user is an OperatorUser or an AdminUser, else False"""
         return self.is_staff or self.is_superuser
 
+    def can_operate_company(self, company):
+        """Returns True if the user is an AdminUser or an OperatorUser of the given company, else False
+
+        The answer is kept by the user instance, which lives as long as the request for the logged user.
+
+        Args:
+            company: Company instance
+        Returns:
+            True if the user can operate the company, else False.
+        """
+        if self.has_admin_permissions():
+            return True
+        if not self.has_operator_permissions():
+            return False
+        operated_companies = self.__dict__.setdefault("_operated_companies", {})
+        if company.id not in operated_companies:
+            operated_companies[company.id] = self.operator_for.through.objects.filter(
+                maintenanceuser_id=self.id, company_id=company.id
+            ).exists()
+        return operated_companies[company.id]
+
+    def can_manage_company(self, company):
+        """Returns True if the user can operate the given company or is one of its ManagerUsers, else False
+
+        Args:
+            company: Company instance
+        Returns:
+            True if the user can at least manage the company, else False.
+        """
+        return self.company_id == company.id or self.can_operate_company(company)
+
 
 def get_full_name(*, first_name: str, last_name: str) -> str:
     """Formates the full name from the first and last names
@@ -1,8 +1,14 @@
 
+from concurrent.futures import ThreadPoolExecutor
+
+from maintenance.models import MaintenanceIssue
 from maintenance.tests.factories import MaintenanceContractFactory
 from maintenance.tests.factories import MaintenanceIssueFactory
 
+from django.db import connection
+from django.db import connections
 from django.test import TestCase
+from django.test import TransactionTestCase
 
 from ...models import Company
 from ..factories import CompanyFactory
@@ -34,6 +40,28 @@ class CompanyTestCase(TestCase):
         company = Company.objects.filter(name="Black Mesa").first()
         self.assertEqual(1, company.issues_counter)
 
+    def test_allocate_issues_numbers(self):
+        company = Company.objects.create(name="Black Mesa")
+
+        self.assertEqual(range(1, 2), Company.objects.allocate_issues_numbers(company.id))
+        self.assertEqual(range(2, 12), Company.objects.allocate_issues_numbers(company.id, 10))
+        self.assertEqual(11, Company.objects.get(id=company.id).issues_counter)
+
+    def test_allocate_issues_numbers_of_a_missing_company(self):
+        with self.assertRaises(Company.DoesNotExist):
+            Company.objects.allocate_issues_numbers(0)
+
+    def test_issues_with_preallocated_numbers(self):
+        company = Company.objects.create(name="Black Mesa")
+        contract = MaintenanceContractFactory(company=company)
+        numbers = Company.objects.allocate_issues_numbers(company.id, 2)
+
+        issues = [MaintenanceIssueFactory(company=company, contract=contract, company_issue_number=n) for n in numbers]
+        issue = MaintenanceIssueFactory(company=company, contract=contract)
+
+        self.assertEqual([1, 2, 3], [issue.company_issue_number for issue in (*issues, issue)])
+        self.assertEqual(3, Company.objects.get(id=company.id).issues_counter)
+
     def test_if_slug_name_is_created(self):
         company = Company.objects.create(name="Black Mesa")
         self.assertEqual("black-mesa", company.slug_name)
@@ -108,3 +136,52 @@ class CompanyTestCase(TestCase):
         company = CompanyFactory(is_archived=False)
         company.archive()
         self.assertTrue(Company.objects.get(id=company.id).is_archived)
+
+
+class CompanyIssuesNumbersConcurrencyTestCase(TransactionTestCase):
+    WRITERS_NUMBER = 8
+    ISSUES_PER_WRITER = 10
+
+    def create_issues(self, company, contract):
+        try:
+            for _ in range(self.ISSUES_PER_WRITER):
+                MaintenanceIssueFactory(company=company, contract=contract)
+        finally:
+            connections.close_all()
+
+    def allocate_issues_numbers(self, company_id, count):
+        try:
+            return Company.objects.allocate_issues_numbers(company_id, count)
+        finally:
+            connections.close_all()
+
+    def test_interleaved_allocations_have_distinct_numbers(self):
+        company = Company.objects.create(name="Black Mesa")
+
+        # each thread allocates through its own connection
+        with ThreadPoolExecutor(1) as executor:
+            first = Company.objects.allocate_issues_numbers(company.id, 3)
+            second = executor.submit(self.allocate_issues_numbers, company.id, 2).result()
+            third = Company.objects.allocate_issues_numbers(company.id)
+            fourth = executor.submit(self.allocate_issues_numbers, company.id, 4).result()
+
+        self.assertEqual([range(1, 4), range(4, 6), range(6, 7), range(7, 11)], [first, second, third, fourth])
+        self.assertEqual(10, Company.objects.get(id=company.id).issues_counter)
+
+    def test_concurrent_issues_have_distinct_numbers(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("the threads cannot write concurrently in an in-memory SQLite database")
+        company = Company.objects.create(name="Black Mesa")
+        contract = MaintenanceContractFactory(company=company)
+
+        with ThreadPoolExecutor(self.WRITERS_NUMBER) as executor:
+            futures = [executor.submit(self.create_issues, company, contract) for _ in range(self.WRITERS_NUMBER)]
+            for future in futures:
+                future.result()
+
+        issues_number = self.WRITERS_NUMBER * self.ISSUES_PER_WRITER
+        self.assertEqual(
+            list(range(1, issues_number + 1)),
+            sorted(MaintenanceIssue.objects.filter(company=company).values_list("company_issue_number", flat=True)),
+        )
+        self.assertEqual(issues_number, Company.objects.get(id=company.id).issues_counter)
@@ -3,6 +3,7 @@ from django.test import TestCase
 from ...models import MaintenanceUser
 from ..factories import AdminOperatorUserFactory
 from ..factories import AdminUserFactory
+from ..factories import CompanyFactory
 from ..factories import ManagerUserFactory
 from ..factories import OperatorUserFactory
 
@@ -153,3 +154,33 @@ class MaintenanceUserTestCase(TestCase):
         self.assertTrue(adminOp.has_operator_or_admin_permissions())
         self.assertTrue(operator.has_operator_or_admin_permissions())
         self.assertFalse(manager.has_operator_or_admin_permissions())
+
+    def test_can_operate_company(self):
+        company = CompanyFactory()
+        other_company = CompanyFactory(name="Aperture Science")
+        operator = OperatorUserFactory()
+        operator.operator_for.add(company)
+        operator = MaintenanceUser.objects.get(id=operator.id)
+
+        self.assertTrue(AdminUserFactory().can_operate_company(company))
+        self.assertFalse(ManagerUserFactory(company=company).can_operate_company(company))
+        with self.assertNumQueries(2):
+            self.assertTrue(operator.can_operate_company(company))
+            self.assertFalse(operator.can_operate_company(other_company))
+            # the answers are kept by the user instance
+            self.assertTrue(operator.can_operate_company(company))
+            self.assertFalse(operator.can_operate_company(other_company))
+
+    def test_can_manage_company(self):
+        company = CompanyFactory()
+        other_company = CompanyFactory(name="Aperture Science")
+        operator = OperatorUserFactory()
+        operator.operator_for.add(company)
+        manager = ManagerUserFactory(company=company)
+
+        self.assertTrue(AdminUserFactory().can_manage_company(other_company))
+        self.assertTrue(operator.can_manage_company(company))
+        self.assertFalse(operator.can_manage_company(other_company))
+        with self.assertNumQueries(0):
+            self.assertTrue(manager.can_manage_company(company))
+            self.assertFalse(manager.can_manage_company(other_company))
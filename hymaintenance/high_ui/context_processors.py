@@ -2,4 +2,4 @@ from .models import GeneralInformation
 
 
 def context_data_footer(request):
-    return {"general_info": GeneralInformation.objects.all().first()}
+    return {"general_info": GeneralInformation.objects.get_cached()}
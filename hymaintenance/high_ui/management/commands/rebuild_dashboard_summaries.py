@@ -0,0 +1,92 @@
+from customers.models import Company
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db.models import F
+from django.db.models import Q
+from django.utils.translation import gettext as _
+
+from ...models import CompanyDashboardSummary
+
+
+DEFAULT_CHUNK_SIZE = 500
+
+SUMMARY_FIELDS = ("contracts", "operators_number", "managers_number", "consumers_number", "last_activity_date")
+
+
+class Command(BaseCommand):
+    help = _(
+        """This command computes again the dashboard summaries of the companies:
+           * all of them, or only the missing and stale ones with --stale
+           * with --check, nothing is written and the command fails if a summary is missing, stale or wrong"""
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--company",
+            action="append",
+            dest="companies",
+            metavar="SLUG_NAME",
+            help=_("Only the summary of this company, can be repeated"),
+        )
+        parser.add_argument("--stale", action="store_true", help=_("Only the missing and stale summaries"))
+        parser.add_argument("--check", action="store_true", help=_("Report the outdated summaries without writing"))
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=_("Number of summaries computed and written at once"),
+        )
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options["companies"]:
+            companies = companies.filter(slug_name__in=options["companies"])
+        if options["check"]:
+            outdated_summaries = check_dashboard_summaries(companies, options["chunk_size"])
+            for slug_name, reason in outdated_summaries:
+                self.stdout.write(_("Company {}: {}").format(slug_name, reason))
+            if outdated_summaries:
+                raise CommandError(_("{} dashboard summaries are outdated.").format(len(outdated_summaries)))
+            self.stdout.write(self.style.SUCCESS(_("The dashboard summaries are up to date.")))
+            return
+
+        if options["stale"]:
+            companies = get_companies_with_outdated_summary(companies)
+        rebuilt_number = rebuild_dashboard_summaries(companies, options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(_("{} dashboard summaries are computed.").format(rebuilt_number)))
+
+
+def get_companies_with_outdated_summary(companies):
+    return companies.filter(
+        Q(dashboard_summary__isnull=True)
+        | Q(dashboard_summary__changed_at__gte=F("dashboard_summary__computed_at"))
+    )
+
+
+def rebuild_dashboard_summaries(companies, chunk_size=DEFAULT_CHUNK_SIZE):
+    company_ids = list(companies.order_by("id").values_list("id", flat=True))
+    for index in range(0, len(company_ids), chunk_size):
+        CompanyDashboardSummary.objects.rebuild(company_ids[index:index + chunk_size])
+    return len(company_ids)
+
+
+def check_dashboard_summaries(companies, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Returns the slug name of the companies whose summary is outdated, with the reason."""
+    outdated_summaries = []
+    companies = list(companies.select_related("dashboard_summary").order_by("id"))
+    for index in range(0, len(companies), chunk_size):
+        chunk = companies[index:index + chunk_size]
+        computed_summaries = CompanyDashboardSummary.objects.compute([company.id for company in chunk])
+        for company in chunk:
+            if not hasattr(company, "dashboard_summary"):
+                outdated_summaries.append((company.slug_name, _("missing summary")))
+            elif company.dashboard_summary.is_stale():
+                outdated_summaries.append((company.slug_name, _("stale summary")))
+            elif any(
+                getattr(company.dashboard_summary, field) != getattr(computed_summaries[company.id], field)
+                for field in SUMMARY_FIELDS
+            ):
+                # modified without any signal, by a bulk update for instance
+                outdated_summaries.append((company.slug_name, _("wrong summary")))
+    return outdated_summaries
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.13 on 2026-10-18 09:34
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0024_alter_maintenanceuser_options'),
+        ('high_ui', '0003_auto_20190218_1152'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyDashboardSummary',
+            fields=[
+                ('company', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='dashboard_summary',
+                    serialize=False,
+                    to='customers.company',
+                )),
+                ('contracts', models.JSONField(default=list)),
+                ('operators_number', models.PositiveIntegerField(default=0)),
+                ('managers_number', models.PositiveIntegerField(default=0)),
+                ('consumers_number', models.PositiveIntegerField(default=0)),
+                ('last_activity_date', models.DateField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField()),
+                ('changed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
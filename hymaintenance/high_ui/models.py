@@ -1,12 +1,230 @@
+import threading
+import weakref
+
 from customers.fields import LowerCaseEmailField
+from customers.models import Company
+from customers.models import MaintenanceUser
+from maintenance.models import MaintenanceConsumer
+from maintenance.models import MaintenanceContract
+from maintenance.models import MaintenanceCredit
+from maintenance.models import MaintenanceIssue
+from maintenance.models import MaintenanceType
+from toolkit.cache import ReferenceDataCache
 
 from django.db import models
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Max
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 
 
+class GeneralInformationManager(models.Manager):
+    def get_cached(self):
+        """Returns the general information of the maintainer, without querying it at each request."""
+        return general_information_cache.get()
+
+
 class GeneralInformation(models.Model):
     name = models.CharField(_("Name"), max_length=255)
     email = LowerCaseEmailField(_("Email address"), max_length=255)
     address = models.TextField(_("postal address"))
     website = models.CharField(_("Website"), max_length=255)
     phone = models.CharField(_("phone number"), max_length=25, blank=True, null=True)
+
+    objects = GeneralInformationManager()
+
+
+general_information_cache = ReferenceDataCache(
+    "general_information", lambda: GeneralInformation.objects.order_by("id").first()
+)
+
+
+@receiver(post_save, sender=GeneralInformation, dispatch_uid="general_information_changes_cache")
+@receiver(post_delete, sender=GeneralInformation, dispatch_uid="general_information_deletion_changes_cache")
+def invalidate_general_information_cache(sender, **kwargs):
+    general_information_cache.invalidate_on_commit()
+
+
+def get_count_subquery(queryset, outer_field):
+    counted = queryset.filter(**{outer_field: OuterRef("pk")}).order_by().values(outer_field)
+    return Coalesce(Subquery(counted.annotate(count=Count("*")).values("count")), 0)
+
+
+class CompanyDashboardSummaryManager(models.Manager):
+    def filter_stale(self, **kwargs):
+        return self.get_queryset().filter(changed_at__gte=F("computed_at"), **kwargs)
+
+    def mark_changed(self, *args, **kwargs):
+        self.get_queryset().filter(*args, **kwargs).update(changed_at=now())
+
+    def compute(self, company_ids):
+        """Returns the summaries of the given companies computed from the live data, without saving them."""
+        computed_at = now()
+        companies = (
+            Company.objects.filter(id__in=company_ids)
+            .annotate(
+                operators_number=get_count_subquery(
+                    MaintenanceUser.operator_for.through.objects.filter(
+                        maintenanceuser__is_staff=True, maintenanceuser__is_active=True
+                    ),
+                    "company",
+                ),
+                managers_number=get_count_subquery(
+                    MaintenanceUser.objects.filter(is_staff=False, is_superuser=False, is_active=True), "company"
+                ),
+                consumers_number=get_count_subquery(MaintenanceConsumer.objects.filter(is_used=True), "company"),
+                last_activity_date=Subquery(
+                    MaintenanceIssue._base_manager.filter(company=OuterRef("pk"), is_deleted=False)
+                    .order_by()
+                    .values("company")
+                    .annotate(last_date=Max("date"))
+                    .values("last_date")
+                ),
+            )
+            .values("id", "operators_number", "managers_number", "consumers_number", "last_activity_date")
+        )
+        summaries = {}
+        for company in companies:
+            company_id = company.pop("id")
+            summaries[company_id] = self.model(company_id=company_id, computed_at=computed_at, **company)
+
+        maintenance_types_names = MaintenanceType.objects.get_cached_names()
+        contracts = MaintenanceContract.objects.filter_enabled(company_id__in=summaries).values(
+            "company_id", "counter_name", "maintenance_type_id", "total_type", "consumed_minutes", "credited_hours"
+        )
+        for contract in contracts:
+            summaries[contract["company_id"]].contracts.append(
+                {
+                    "counter_name": contract["counter_name"]
+                    or maintenance_types_names.get(contract["maintenance_type_id"], ""),
+                    "total_type": contract["total_type"],
+                    "consumed_minutes": contract["consumed_minutes"],
+                    "credited_hours": contract["credited_hours"],
+                }
+            )
+        return summaries
+
+    def rebuild(self, company_ids):
+        summaries = self.compute(company_ids)
+        existing_ids = set(self.get_queryset().filter(company_id__in=summaries).values_list("company_id", flat=True))
+        self.bulk_update(
+            [summary for company_id, summary in summaries.items() if company_id in existing_ids],
+            [field.name for field in self.model._meta.concrete_fields if field.name not in ("company", "changed_at")],
+        )
+        # built by a concurrent request meanwhile, they are as up to date as these ones
+        self.bulk_create(
+            [summary for company_id, summary in summaries.items() if company_id not in existing_ids],
+            ignore_conflicts=True,
+        )
+        return summaries
+
+
+class CompanyDashboardSummary(models.Model):
+    """What the dashboard displays for a company, computed once instead of at each display.
+
+    A summary is stale when the data it is computed from was modified after its computation,
+    it is computed again when the dashboard is displayed.
+    """
+
+    company = models.OneToOneField(
+        Company, on_delete=models.CASCADE, primary_key=True, related_name="dashboard_summary"
+    )
+    # name and counters of the enabled contracts
+    contracts = models.JSONField(default=list)
+    operators_number = models.PositiveIntegerField(default=0)
+    managers_number = models.PositiveIntegerField(default=0)
+    consumers_number = models.PositiveIntegerField(default=0)
+    last_activity_date = models.DateField(null=True, blank=True)
+    computed_at = models.DateTimeField()
+    changed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = CompanyDashboardSummaryManager()
+
+    def is_stale(self):
+        return self.changed_at is not None and self.changed_at >= self.computed_at
+
+
+def mark_dashboard_summaries_changed(*args, **kwargs):
+    # once committed, so a summary computed meanwhile from the previous data is known as stale
+    transaction.on_commit(lambda: CompanyDashboardSummary.objects.mark_changed(*args, **kwargs))
+
+
+class ChangedCompanies:
+    """Companies modified by a transaction, their summaries are marked with a single UPDATE once committed."""
+
+    def __init__(self):
+        self.ids = set()
+        self.marked = False
+
+    def __call__(self):
+        self.marked = True
+        CompanyDashboardSummary.objects.mark_changed(company_id__in=self.ids)
+
+
+# only referenced by the callbacks of the transaction, it is released when they are discarded by a rollback
+_changed_companies = threading.local()
+
+
+def mark_companies_dashboard_summaries_changed(company_ids):
+    changed_companies = getattr(_changed_companies, "ref", lambda: None)()
+    if changed_companies is None or changed_companies.marked:
+        changed_companies = ChangedCompanies()
+        _changed_companies.ref = weakref.ref(changed_companies)
+        changed_companies.ids.update(company_ids)
+        transaction.on_commit(changed_companies)
+    else:
+        changed_companies.ids.update(company_ids)
+
+
+@receiver(post_save, sender=MaintenanceIssue, dispatch_uid="issue_changes_dashboard_summary")
+@receiver(post_delete, sender=MaintenanceIssue, dispatch_uid="issue_deletion_changes_dashboard_summary")
+@receiver(post_save, sender=MaintenanceCredit, dispatch_uid="credit_changes_dashboard_summary")
+@receiver(post_delete, sender=MaintenanceCredit, dispatch_uid="credit_deletion_changes_dashboard_summary")
+@receiver(post_save, sender=MaintenanceContract, dispatch_uid="contract_changes_dashboard_summary")
+@receiver(post_delete, sender=MaintenanceContract, dispatch_uid="contract_deletion_changes_dashboard_summary")
+@receiver(post_save, sender=MaintenanceConsumer, dispatch_uid="consumer_changes_dashboard_summary")
+@receiver(post_delete, sender=MaintenanceConsumer, dispatch_uid="consumer_deletion_changes_dashboard_summary")
+def company_data_changes_dashboard_summary(sender, instance, **kwargs):
+    mark_companies_dashboard_summaries_changed([instance.company_id])
+
+
+@receiver(post_save, sender=MaintenanceUser, dispatch_uid="user_changes_dashboard_summary")
+def user_changes_dashboard_summary(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        # saved at each login
+        return
+    mark_dashboard_summaries_changed(Q(company_id=instance.company_id) | Q(company__managed_by=instance))
+
+
+@receiver(pre_delete, sender=MaintenanceUser, dispatch_uid="user_deletion_changes_dashboard_summary")
+def user_deletion_changes_dashboard_summary(sender, instance, **kwargs):
+    # the operated companies are not known anymore once deleted
+    company_ids = [instance.company_id, *instance.operator_for.values_list("id", flat=True)]
+    mark_companies_dashboard_summaries_changed(company_ids)
+
+
+@receiver(m2m_changed, sender=MaintenanceUser.operator_for.through, dispatch_uid="operators_change_dashboard_summary")
+def operators_change_dashboard_summary(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action in ("post_add", "post_remove", "pre_clear"):
+            mark_companies_dashboard_summaries_changed([instance.id])
+    elif action in ("post_add", "post_remove"):
+        mark_companies_dashboard_summaries_changed(pk_set)
+    elif action == "pre_clear":
+        mark_companies_dashboard_summaries_changed(instance.operator_for.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=MaintenanceType, dispatch_uid="maintenance_type_changes_dashboard_summary")
+def maintenance_type_changes_dashboard_summary(sender, instance, **kwargs):
+    mark_dashboard_summaries_changed()
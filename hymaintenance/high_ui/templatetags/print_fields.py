@@ -20,17 +20,30 @@ def pretty_print_minutes_tag(value, use_long_minute_format=False):
     return pretty_print_minutes(value, use_long_minute_format)
 
 
-@register.simple_tag
-def pretty_print_contract_counter(contract):
+def pretty_print_counter(total_type, consumed_minutes, credited_hours):
     counter = ""
-    if contract.total_type == AVAILABLE_TOTAL_TIME:
-        counter = pretty_print_minutes(contract.get_number_remaining_minutes())
-        counter += " /&nbsp;" + str(contract.get_number_contract_hours()) + "h"
-    elif contract.total_type == CONSUMMED_TOTAL_TIME:
-        counter = pretty_print_minutes(contract.get_number_consumed_minutes())
+    if total_type == AVAILABLE_TOTAL_TIME:
+        counter = pretty_print_minutes(credited_hours * 60 - consumed_minutes)
+        counter += " /&nbsp;" + str(credited_hours) + "h"
+    elif total_type == CONSUMMED_TOTAL_TIME:
+        counter = pretty_print_minutes(consumed_minutes)
     return mark_safe(counter)
 
 
+@register.simple_tag
+def pretty_print_contract_counter(contract):
+    return pretty_print_counter(
+        contract.total_type, contract.get_number_consumed_minutes(), contract.get_number_contract_hours()
+    )
+
+
+@register.simple_tag
+def pretty_print_contract_summary_counter(contract_summary):
+    return pretty_print_counter(
+        contract_summary["total_type"], contract_summary["consumed_minutes"], contract_summary["credited_hours"]
+    )
+
+
 @register.filter
 def print_operator_projects(operator_id):
     operator = MaintenanceUser.objects.get(id=operator_id)
@@ -0,0 +1,65 @@
+from io import StringIO
+
+from customers.tests.factories import CompanyFactory
+from customers.tests.factories import ManagerUserFactory
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.timezone import now
+
+from ..models import CompanyDashboardSummary
+
+
+class RebuildDashboardSummariesCommandTestCase(TestCase):
+    def test_rebuild_all_the_summaries(self):
+        companies = CompanyFactory.create_batch(size=3)
+        out = StringIO()
+
+        call_command("rebuild_dashboard_summaries", "--chunk-size", "2", stdout=out)
+
+        self.assertIn("3 dashboard summaries are computed.", out.getvalue())
+        self.assertEqual(3, CompanyDashboardSummary.objects.filter(company__in=companies).count())
+
+    def test_rebuild_the_stale_summaries(self):
+        company1, company2, company3 = CompanyFactory.create_batch(size=3)
+        CompanyDashboardSummary.objects.rebuild([company1.id, company2.id])
+        CompanyDashboardSummary.objects.mark_changed(company=company2)
+        ManagerUserFactory(company=company1)
+        ManagerUserFactory(company=company2)
+        out = StringIO()
+
+        call_command("rebuild_dashboard_summaries", "--stale", stdout=out)
+
+        self.assertIn("2 dashboard summaries are computed.", out.getvalue())
+        self.assertEqual(0, CompanyDashboardSummary.objects.get(company=company1).managers_number)
+        self.assertEqual(1, CompanyDashboardSummary.objects.get(company=company2).managers_number)
+        self.assertTrue(CompanyDashboardSummary.objects.filter(company=company3).exists())
+
+    def test_check(self):
+        company1, company2, company3 = CompanyFactory.create_batch(size=3)
+        call_command("rebuild_dashboard_summaries", stdout=StringIO())
+        out = StringIO()
+
+        call_command("rebuild_dashboard_summaries", "--check", stdout=out)
+        self.assertIn("The dashboard summaries are up to date.", out.getvalue())
+
+        CompanyDashboardSummary.objects.filter(company=company1).delete()
+        CompanyDashboardSummary.objects.filter(company=company2).update(changed_at=now())
+        CompanyDashboardSummary.objects.filter(company=company3).update(managers_number=10)
+        out = StringIO()
+
+        with self.assertRaisesMessage(CommandError, "3 dashboard summaries are outdated."):
+            call_command("rebuild_dashboard_summaries", "--check", stdout=out)
+        self.assertIn(f"Company {company1.slug_name}: missing summary", out.getvalue())
+        self.assertIn(f"Company {company2.slug_name}: stale summary", out.getvalue())
+        self.assertIn(f"Company {company3.slug_name}: wrong summary", out.getvalue())
+        self.assertFalse(CompanyDashboardSummary.objects.filter(company=company1).exists())
+
+    def test_company_filter(self):
+        company1, company2 = CompanyFactory.create_batch(size=2)
+
+        call_command("rebuild_dashboard_summaries", "--company", company2.slug_name, stdout=StringIO())
+
+        self.assertFalse(CompanyDashboardSummary.objects.filter(company=company1).exists())
+        self.assertTrue(CompanyDashboardSummary.objects.filter(company=company2).exists())
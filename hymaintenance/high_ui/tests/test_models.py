@@ -0,0 +1,170 @@
+from datetime import timedelta
+
+from customers.tests.factories import ManagerUserFactory
+from customers.tests.factories import OperatorUserFactory
+from maintenance.models import MaintenanceIssue
+from maintenance.models import MaintenanceType
+from maintenance.models.counters import defer_contracts_counters_updates
+from maintenance.tests.factories import MaintenanceConsumerFactory
+from maintenance.tests.factories import MaintenanceIssueFactory
+from maintenance.tests.factories import create_project
+
+from django.db import DatabaseError
+from django.db import connection
+from django.db import transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from ..models import CompanyDashboardSummary
+
+
+class CompanyDashboardSummaryTestCase(TestCase):
+    def create_company(self):
+        # committed, the changes of the tests are marked apart
+        with self.captureOnCommitCallbacks(execute=True):
+            company, contract1, contract2, contract3 = create_project(
+                contract1={"credit_counter": True}, contract3={"disabled": True}
+            )
+            operator = OperatorUserFactory()
+            operator.operator_for.add(company)
+            OperatorUserFactory(is_active=False).operator_for.add(company)
+            ManagerUserFactory.create_batch(company=company, size=2)
+            ManagerUserFactory(company=company, is_active=False)
+            MaintenanceConsumerFactory.create_batch(company=company, size=3)
+            MaintenanceIssueFactory(company=company, contract=contract1, number_minutes=30, date=now().date())
+            MaintenanceIssueFactory(company=company, contract=contract2, number_minutes=45, date=now().date())
+            MaintenanceIssueFactory(
+                company=company, contract=contract2, date=now().date() + timedelta(days=10), is_deleted=True
+            )
+        return company, operator
+
+    def test_compute(self):
+        company, _ = self.create_company()
+
+        summary = CompanyDashboardSummary.objects.compute([company.id])[company.id]
+
+        self.assertEqual(
+            [
+                {"counter_name": "Maintenance", "total_type": 0, "consumed_minutes": 30, "credited_hours": 20},
+                {"counter_name": "Support", "total_type": 1, "consumed_minutes": 45, "credited_hours": 0},
+            ],
+            summary.contracts,
+        )
+        self.assertEqual(1, summary.operators_number)
+        self.assertEqual(2, summary.managers_number)
+        self.assertEqual(3, summary.consumers_number)
+        self.assertEqual(now().date(), summary.last_activity_date)
+
+    def test_rebuild(self):
+        company, _ = self.create_company()
+        MaintenanceType.objects.get_cached()
+
+        with self.assertNumQueries(4):
+            CompanyDashboardSummary.objects.rebuild([company.id])
+
+        summary = CompanyDashboardSummary.objects.get(company=company)
+        self.assertEqual(2, summary.managers_number)
+        self.assertFalse(summary.is_stale())
+
+        ManagerUserFactory(company=company)
+        CompanyDashboardSummary.objects.rebuild([company.id])
+
+        summary.refresh_from_db()
+        self.assertEqual(3, summary.managers_number)
+
+    def assertSummaryChanged(self, company, changed=True):
+        summary = CompanyDashboardSummary.objects.get(company=company)
+        self.assertEqual(changed, summary.is_stale())
+        CompanyDashboardSummary.objects.rebuild([company.id])
+
+    def test_changes_of_a_transaction_mark_the_summaries_at_once(self):
+        company, _ = self.create_company()
+        with self.captureOnCommitCallbacks(execute=True):
+            other_company, other_contract, _, _ = create_project()
+        CompanyDashboardSummary.objects.rebuild([company.id, other_company.id])
+        contract = company.contracts.first()
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                with defer_contracts_counters_updates():
+                    for _ in range(3):
+                        MaintenanceIssue.objects.create(company=company, contract=contract, date=now().date())
+                        MaintenanceIssue.objects.create(
+                            company=other_company, contract=other_contract, date=now().date()
+                        )
+
+        summaries_table = CompanyDashboardSummary._meta.db_table
+        self.assertEqual(
+            1, len([query for query in queries if query["sql"].startswith('UPDATE "{}"'.format(summaries_table))])
+        )
+        self.assertSummaryChanged(company)
+        self.assertSummaryChanged(other_company)
+
+    def test_changes_mark_the_summary_as_stale(self):
+        company, operator = self.create_company()
+        CompanyDashboardSummary.objects.rebuild([company.id])
+        contract = company.contracts.first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MaintenanceIssueFactory(company=company, contract=contract)
+        self.assertSummaryChanged(company)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            contract.counter_name = "Nouveau nom"
+            contract.save()
+        self.assertSummaryChanged(company)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            operator.is_active = False
+            operator.save()
+        self.assertSummaryChanged(company)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            operator.operator_for.clear()
+        self.assertSummaryChanged(company)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            company.managed_by.add(OperatorUserFactory())
+        self.assertSummaryChanged(company)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MaintenanceConsumerFactory(company=company)
+        self.assertSummaryChanged(company)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            maintenance_type = MaintenanceType.objects.get(id=1)
+            maintenance_type.save()
+        self.assertSummaryChanged(company)
+
+    def test_unrelated_changes_do_not_mark_the_summary_as_stale(self):
+        company, operator = self.create_company()
+        other_company, _ = self.create_company()
+        CompanyDashboardSummary.objects.rebuild([company.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MaintenanceIssueFactory(company=other_company, contract=other_company.contracts.first())
+            operator.last_login = now()
+            operator.save(update_fields=["last_login"])
+        self.assertSummaryChanged(company, changed=False)
+
+    def test_changes_after_a_rollback_are_marked(self):
+        company, _ = self.create_company()
+        CompanyDashboardSummary.objects.rebuild([company.id])
+        contract = company.contracts.first()
+
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                MaintenanceIssue.objects.create(company=company, contract=contract, date=now().date())
+                raise DatabaseError()
+        with self.captureOnCommitCallbacks(execute=True):
+            MaintenanceIssue.objects.create(company=company, contract=contract, date=now().date())
+        self.assertSummaryChanged(company)
+
+    def test_rolled_back_changes_do_not_mark_the_summary_as_stale(self):
+        company, _ = self.create_company()
+        CompanyDashboardSummary.objects.rebuild([company.id])
+
+        with self.captureOnCommitCallbacks(execute=False):
+            MaintenanceIssueFactory(company=company, contract=company.contracts.first())
+        self.assertSummaryChanged(company, changed=False)
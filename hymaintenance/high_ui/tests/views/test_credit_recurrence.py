@@ -2,12 +2,14 @@ from customers.tests.factories import AdminUserFactory
 from customers.tests.factories import ManagerUserFactory
 from customers.tests.factories import OperatorUserFactory
 from maintenance.models import MaintenanceContract
+from maintenance.models.contract import RECURRENCE_SCHEDULE_LENGTH
 from maintenance.models.contract import get_next_month_date
 from maintenance.tests.factories import create_project
 
 from django.test import RequestFactory
 from django.test import TestCase
 from django.urls import reverse
+from django.utils.timezone import datetime
 from django.utils.timezone import now
 
 from ...views.project import EmailAlertUpdateView
@@ -236,3 +238,65 @@ class ProjectCreditRecurrenceDetailViewTestCase(TestCase):
         )
 
         self.assertEqual(response.status_code, 403)
+
+
+class ProjectCreditRecurrenceScheduleViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.start_date = datetime(day=31, month=1, year=2022).date()
+        cls.company, cls.contract1, cls.contract2, cls.contract3 = create_project(
+            contract1={"monthly_recurrence": True, "recurrence_start_date": cls.start_date},
+            contract2={},
+            contract3={"annual_recurrence": True, "recurrence_start_date": cls.start_date, "visible": False},
+        )
+        cls.manager = ManagerUserFactory(company=cls.company)
+        cls.operator = OperatorUserFactory()
+        cls.operator.operator_for.add(cls.company)
+        cls.url = reverse("high_ui:project-credit_recurrence_schedule", args=[cls.company.slug_name])
+
+    def test_unlogged_user_cannot_see_the_schedule(self):
+        response = self.client.get(self.url)
+
+        self.assertRedirects(response, reverse("login") + "?next=" + self.url)
+
+    def test_manager_cannot_see_other_company_schedule(self):
+        self.client.force_login(ManagerUserFactory(email="gordon.freeman@blackmesa.com"))
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_manager_sees_the_schedule_of_the_visible_contracts(self):
+        self.client.force_login(self.manager)
+        response = self.client.get(self.url, {"occurrences": 2})
+
+        self.assertEqual(
+            {
+                "contracts": [
+                    {
+                        "id": self.contract1.id,
+                        "counter_name": self.contract1.get_counter_name(),
+                        "occurrences": [
+                            {"date": "2022-01-31", "credited_hours": 40, "remaining_hours": 40},
+                            {"date": "2022-02-28", "credited_hours": 60, "remaining_hours": 60},
+                        ],
+                    }
+                ]
+            },
+            response.json(),
+        )
+
+    def test_operator_sees_the_schedule_of_all_the_contracts(self):
+        self.client.force_login(self.operator)
+        response = self.client.get(self.url)
+
+        contracts = response.json()["contracts"]
+        self.assertEqual([self.contract1.id, self.contract3.id], [contract["id"] for contract in contracts])
+        self.assertEqual(RECURRENCE_SCHEDULE_LENGTH, len(contracts[0]["occurrences"]))
+        self.assertEqual("2023-01-31", contracts[1]["occurrences"][1]["date"])
+
+    def test_invalid_occurrences_number(self):
+        self.client.force_login(self.manager)
+        for occurrences in ("0", "1000", "many"):
+            response = self.client.get(self.url, {"occurrences": occurrences})
+
+            self.assertEqual(response.status_code, 400)
@@ -1,13 +1,22 @@
+from datetime import date
+
 from customers.tests.factories import AdminOperatorUserFactory
 from customers.tests.factories import AdminUserFactory
 from customers.tests.factories import CompanyFactory
 from customers.tests.factories import ManagerUserFactory
 from customers.tests.factories import OperatorUserFactory
+from freezegun import freeze_time
+from maintenance.management.commands.recurrence import check_and_apply_credit_recurrence
+from maintenance.tests.factories import MaintenanceConsumerFactory
+from maintenance.tests.factories import MaintenanceIssueFactory
+from maintenance.tests.factories import create_project
 
 from django.test import RequestFactory
 from django.test import TestCase
 from django.urls import reverse
+from django.utils.timezone import now
 
+from ...models import CompanyDashboardSummary
 from ...views.dashboard import DashboardView
 
 
@@ -87,10 +96,15 @@ class DashboardTestCase(TestCase):
 
         self.assertEqual(1, self.company.managed_by.count())
         self.assertEqual(response.status_code, 200)
-        self.assertContains(response, "Op2 Op2")
-        self.assertNotContains(response, "Op1 Op1")
+        self.assertContains(response, self.company.name)
         self.assertNotContains(response, archive_company.name)
 
+        response = self.client.get(
+            reverse("high_ui:project-dashboard_users", kwargs={"company_name": self.company.slug_name})
+        )
+
+        self.assertEqual(["Op2 Op2"], response.json()["operators"])
+
     def test_operator_admin_user_can_seen_all_companies(self):
         admin = AdminOperatorUserFactory(email="other.man@blackmesa.com", password="azerty")
         other_company = CompanyFactory(name="Black Mesa")
@@ -120,3 +134,106 @@ class DashboardTestCase(TestCase):
         self.assertContains(response, self.company.name)
         self.assertContains(response, other_company.name)
         self.assertNotContains(response, archive_company.name)
+
+    def test_dashboard_displays_the_summaries_computed_again_when_stale(self):
+        admin = AdminUserFactory(email="other.man@blackmesa.com", password="azerty")
+        with self.captureOnCommitCallbacks(execute=True):
+            company, contract, _, _ = create_project(company={"name": "Black Mesa"})
+        self.client.login(username=admin.email, password="azerty")
+
+        response = self.client.get(self.page_url)
+
+        summary = CompanyDashboardSummary.objects.get(company=company)
+        companies = {company.id: company for company in response.context["companies"]}
+        self.assertEqual(summary.contracts, companies[company.id].dashboard_summary.contracts)
+        self.assertContains(response, "Maintenance")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MaintenanceIssueFactory(company=company, contract=contract, number_minutes=90, date=now().date())
+        response = self.client.get(self.page_url)
+
+        self.assertContains(response, "1h30")
+        self.assertEqual(90, CompanyDashboardSummary.objects.get(company=company).contracts[0]["consumed_minutes"])
+
+    @freeze_time("2021-02-01")
+    def test_dashboard_displays_the_credits_of_the_recurrences(self):
+        admin = AdminUserFactory(email="other.man@blackmesa.com", password="azerty")
+        with self.captureOnCommitCallbacks(execute=True):
+            company, contract, _, _ = create_project(
+                company={"name": "Black Mesa"},
+                contract1={"monthly_recurrence": True, "recurrence_start_date": date(2021, 2, 1)},
+            )
+        self.client.login(username=admin.email, password="azerty")
+        self.client.get(self.page_url)
+        summary = CompanyDashboardSummary.objects.get(company=company)
+        self.assertEqual(contract.credited_hours, summary.contracts[0]["credited_hours"])
+
+        with freeze_time("2021-03-01"), self.captureOnCommitCallbacks(execute=True):
+            check_and_apply_credit_recurrence()
+        response = self.client.get(self.page_url)
+
+        credited_hours = summary.contracts[0]["credited_hours"]
+        contract.refresh_from_db()
+        self.assertGreater(contract.credited_hours, credited_hours)
+        companies = {company.id: company for company in response.context["companies"]}
+        summary = companies[company.id].dashboard_summary
+        self.assertEqual(contract.credited_hours, summary.contracts[0]["credited_hours"])
+
+    def test_dashboard_pagination(self):
+        admin = AdminUserFactory(email="other.man@blackmesa.com", password="azerty")
+        companies = [self.company] + [CompanyFactory(name=f"Black Mesa {index:02}") for index in range(25)]
+        companies.sort(key=lambda company: company.slug_name)
+        self.client.login(username=admin.email, password="azerty")
+
+        response = self.client.get(self.page_url)
+
+        self.assertEqual(companies[:20], response.context["companies"])
+        self.assertIsNone(response.context["previous_cursor"])
+        self.assertEqual(companies[19].slug_name, response.context["next_cursor"])
+        self.assertContains(response, f"?after={companies[19].slug_name}")
+
+        response = self.client.get(self.page_url, {"after": response.context["next_cursor"]})
+
+        self.assertEqual(companies[20:], response.context["companies"])
+        self.assertEqual(companies[20].slug_name, response.context["previous_cursor"])
+        self.assertIsNone(response.context["next_cursor"])
+
+        response = self.client.get(self.page_url, {"before": response.context["previous_cursor"]})
+
+        self.assertEqual(companies[:20], response.context["companies"])
+        self.assertIsNone(response.context["previous_cursor"])
+        self.assertEqual(companies[19].slug_name, response.context["next_cursor"])
+
+
+class DashboardCompanyUsersTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CompanyFactory(name="Aperture Science")
+        cls.operator = OperatorUserFactory(
+            email="gordon.freeman@blackmesa.com", password="azerty", first_name="Gordon", last_name="Freeman"
+        )
+        cls.operator.operator_for.add(cls.company)
+        OperatorUserFactory(first_name="Adrian", last_name="Shephard", is_active=False).operator_for.add(cls.company)
+        ManagerUserFactory(company=cls.company, first_name="Cave", last_name="Johnson")
+        ManagerUserFactory(company=cls.company, first_name="Caroline", last_name="Glados", is_active=False)
+        MaintenanceConsumerFactory(company=cls.company, name="Chell")
+        MaintenanceConsumerFactory(company=cls.company, name="Wheatley", is_used=False)
+        cls.url = reverse("high_ui:project-dashboard_users", kwargs={"company_name": cls.company.slug_name})
+
+    def test_operator_gets_the_users_of_the_company(self):
+        self.client.login(username="gordon.freeman@blackmesa.com", password="azerty")
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(
+            {"operators": ["Gordon Freeman"], "managers": ["Cave Johnson"], "consumers": ["Chell"]}, response.json()
+        )
+
+    def test_other_operators_and_managers_cannot_get_the_users(self):
+        OperatorUserFactory(email="other.man@blackmesa.com", password="azerty")
+        ManagerUserFactory(email="cave.johnson@aperture-science.com", password="azerty", company=self.company)
+
+        for email in ("other.man@blackmesa.com", "cave.johnson@aperture-science.com"):
+            self.client.login(username=email, password="azerty")
+            response = self.client.get(self.url)
+            self.assertEqual(403, response.status_code)
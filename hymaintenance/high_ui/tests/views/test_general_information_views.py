@@ -83,3 +83,5 @@ class GeneralInformationUpdateViewTestCase(TestCase):
         self.assertEqual(address, infos.address)
         self.assertEqual(phone, infos.phone)
         self.assertEqual(website, infos.website)
+        # the page after the update displays the cached general information
+        self.assertEqual(name, response.context["general_info"].name)
@@ -1,3 +1,4 @@
+import datetime
 import os
 from shutil import rmtree
 from tempfile import TemporaryDirectory
@@ -172,6 +173,74 @@ class IssueCreateViewTestCase(TestCase):
             )
 
 
+class IssueSearchViewTestCase(TestCase):
+    def setUp(self):
+        self.company, self.contract, self.hidden_contract, _ = create_project(contract2={"visible": False})
+        for day in range(1, 26):
+            MaintenanceIssueFactory(
+                company=self.company,
+                contract=self.contract,
+                subject="Portal {}".format(day),
+                date=datetime.date(2019, 12, day),
+            )
+        MaintenanceIssueFactory(
+            company=self.company, contract=self.contract, subject="Portal archived", is_deleted=True
+        )
+        MaintenanceIssueFactory(
+            company=self.company, contract=self.hidden_contract, subject="Portal hidden", date=datetime.date(2020, 1, 1)
+        )
+        other_company, other_contract, _, _ = create_project()
+        MaintenanceIssueFactory(company=other_company, contract=other_contract, subject="Portal elsewhere")
+        self.url = reverse("high_ui:project-search_issues", args=[self.company.slug_name])
+        AdminUserFactory(email="gordon.freeman@blackmesa.com", password="azerty")
+
+    def test_search_is_paginated(self):
+        self.client.login(username="gordon.freeman@blackmesa.com", password="azerty")
+
+        response = self.client.get(self.url, {"q": "portal"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(20, len(response.context["issues"]))
+        self.assertEqual("Portal hidden", response.context["issues"][0].subject)
+        self.assertIsNone(response.context["previous_offset"])
+        self.assertContains(response, "?q=portal&amp;offset=20")
+
+        response = self.client.get(self.url, {"q": "portal", "offset": 20})
+
+        self.assertEqual(
+            ["Portal 5", "Portal 4", "Portal 3", "Portal 2", "Portal 1"],
+            [issue.subject for issue in response.context["issues"][1:]],
+        )
+        self.assertEqual(0, response.context["previous_offset"])
+        self.assertIsNone(response.context["next_offset"])
+
+    def test_manager_does_not_find_the_issues_of_the_hidden_contracts(self):
+        ManagerUserFactory(email="chell@aperture-science.com", password="azerty", company=self.company)
+        self.client.login(username="chell@aperture-science.com", password="azerty")
+
+        response = self.client.get(self.url, {"q": "hidden"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([], response.context["issues"])
+
+    def test_manager_cannot_search_the_issues_of_other_company(self):
+        ManagerUserFactory(email="chell@aperture-science.com", password="azerty")
+        self.client.login(username="chell@aperture-science.com", password="azerty")
+
+        response = self.client.get(self.url, {"q": "portal"})
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_empty_search_and_invalid_offset(self):
+        self.client.login(username="gordon.freeman@blackmesa.com", password="azerty")
+
+        response = self.client.get(self.url)
+        self.assertEqual([], response.context["issues"])
+
+        response = self.client.get(self.url, {"q": "portal", "offset": "twenty"})
+        self.assertEqual(response.status_code, 404)
+
+
 class IssueUpdateViewTestCase(TestCase):
     @classmethod
     def setUpTestData(cls):
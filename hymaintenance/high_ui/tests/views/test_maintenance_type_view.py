@@ -77,3 +77,5 @@ class MaintenanceTypeUpdateViewTestCase(TestCase):
         maintenance_types = MaintenanceType.objects.order_by("id")
         for count, maintenance_type in enumerate(maintenance_types):
             self.assertEqual(names[count], maintenance_type.name)
+        # the cached maintenance types are the modified ones
+        self.assertEqual(names, [maintenance_type.name for maintenance_type in MaintenanceType.objects.get_cached()])
@@ -14,6 +14,9 @@ from maintenance.tests.factories import create_project
 
 from django.test import TestCase
 from django.urls import reverse
+from django.utils.timezone import now
+
+from ...models import CompanyDashboardSummary
 
 
 class ViewsPerformancesTestCase(TestCase):
@@ -53,15 +56,37 @@ class ViewsPerformancesTestCase(TestCase):
         cls.manager = MaintenanceUser.objects.filter(company=cls.company).first()
         cls.operator = MaintenanceUser.objects.filter(operator_for=cls.company, is_superuser=False).first()
         cls.credit = MaintenanceCredit.objects.filter(company=cls.company).first()
+        CompanyDashboardSummary.objects.rebuild(Company.objects.values_list("id", flat=True))
 
     def test_dashboard_view(self):
         url = reverse("high_ui:dashboard")
         self.client.force_login(self.admin)
-        with self.assertNumQueries(1091):
+        with self.assertNumQueries(6):
             response = self.client.get(url)
             response.render()
             self.assertEqual(response.status_code, 200)
 
+    def test_dashboard_view_does_not_depend_on_companies_number(self):
+        company, _, _, _ = create_project()
+        ManagerUserFactory.create_batch(company=company, size=3)
+        MaintenanceConsumerFactory.create_batch(company=company, size=3)
+        self.admin.operator_for.add(company)
+        CompanyDashboardSummary.objects.rebuild([company.id])
+
+        url = reverse("high_ui:dashboard")
+        self.client.force_login(self.admin)
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+            response.render()
+            self.assertEqual(response.status_code, 200)
+
+    def test_dashboard_company_users_view(self):
+        url = reverse("high_ui:project-dashboard_users", kwargs={"company_name": self.company.slug_name})
+        self.client.force_login(self.operator)
+        with self.assertNumQueries(7):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
     def test_account_update_view(self):
         url = reverse("high_ui:update_user")
         self.client.force_login(self.admin)
@@ -153,7 +178,7 @@ class ViewsPerformancesTestCase(TestCase):
     def test_project_create_view(self):
         url = reverse("high_ui:create_project")
         self.client.force_login(self.admin)
-        with self.assertNumQueries(16):
+        with self.assertNumQueries(7):
             response = self.client.get(url)
             response.render()
             self.assertEqual(response.status_code, 200)
@@ -161,11 +186,40 @@ class ViewsPerformancesTestCase(TestCase):
     def test_project_detail_view(self):
         url = reverse("high_ui:project_details", kwargs={"company_name": self.company.slug_name})
         self.client.force_login(self.admin)
-        with self.assertNumQueries(12):
+        with self.assertNumQueries(13):
+            response = self.client.get(url)
+            response.render()
+            self.assertEqual(response.status_code, 200)
+
+    def test_project_detail_view_as_operator(self):
+        url = reverse("high_ui:project_details", kwargs={"company_name": self.company.slug_name})
+        operator = MaintenanceUser.objects.filter(is_staff=True, is_superuser=False).first()
+        self.client.force_login(operator)
+        with self.assertNumQueries(14):
+            response = self.client.get(url)
+            response.render()
+            self.assertEqual(response.status_code, 200)
+
+    def test_project_history_events_view(self):
+        url = reverse(
+            "high_ui:project-history_events",
+            kwargs={"company_name": self.company.slug_name, "year": now().year, "month": now().month},
+        )
+        self.client.force_login(self.admin)
+        with self.assertNumQueries(7):
             response = self.client.get(url)
             response.render()
             self.assertEqual(response.status_code, 200)
 
+    def test_project_export_events_view(self):
+        url = reverse("high_ui:project-export_events", kwargs={"company_name": self.company.slug_name})
+        self.client.force_login(self.admin)
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            # the events are fetched while the file is written, by chunks of the same query
+            self.assertEqual(81, len(b"".join(response.streaming_content).splitlines()))
+
     def test_project_contact_update_view(self):
         url = reverse("high_ui:project-contact", kwargs={"company_name": self.company.slug_name})
         self.client.force_login(self.admin)
@@ -177,7 +231,7 @@ class ViewsPerformancesTestCase(TestCase):
     def test_project_update_view(self):
         url = reverse("high_ui:update_project", kwargs={"company_name": self.company.slug_name})
         self.client.force_login(self.admin)
-        with self.assertNumQueries(30):
+        with self.assertNumQueries(18):
             response = self.client.get(url)
             response.render()
             self.assertEqual(response.status_code, 200)
@@ -185,7 +239,7 @@ class ViewsPerformancesTestCase(TestCase):
     def test_project_customize_view(self):
         url = reverse("high_ui:customize_project", kwargs={"company_name": self.company.slug_name})
         self.client.force_login(self.admin)
-        with self.assertNumQueries(10):
+        with self.assertNumQueries(11):
             response = self.client.get(url)
             response.render()
             self.assertEqual(response.status_code, 200)
@@ -203,7 +257,7 @@ class ViewsPerformancesTestCase(TestCase):
             "high_ui:project-issue_details", kwargs={"company_name": self.company.slug_name, "company_issue_number": 1}
         )
         self.client.force_login(self.admin)
-        with self.assertNumQueries(15):
+        with self.assertNumQueries(12):
             response = self.client.get(url)
             response.render()
             self.assertEqual(response.status_code, 200)
@@ -213,7 +267,7 @@ class ViewsPerformancesTestCase(TestCase):
             "high_ui:project-update_issue", kwargs={"company_name": self.company.slug_name, "company_issue_number": 1}
         )
         self.client.force_login(self.admin)
-        with self.assertNumQueries(40):
+        with self.assertNumQueries(38):
             response = self.client.get(url)
             response.render()
             self.assertEqual(response.status_code, 200)
@@ -317,7 +371,7 @@ class ViewsPerformancesTestCase(TestCase):
     def test_project_email_alert_update_view(self):
         url = reverse("high_ui:project-update_email_alert", kwargs={"company_name": self.company.slug_name})
         self.client.force_login(self.admin)
-        with self.assertNumQueries(10):
+        with self.assertNumQueries(11):
             response = self.client.get(url)
             response.render()
             self.assertEqual(response.status_code, 200)
@@ -325,7 +379,7 @@ class ViewsPerformancesTestCase(TestCase):
     def test_project_counter_reset_view(self):
         url = reverse("high_ui:project-reset_counters", kwargs={"company_name": self.company.slug_name})
         self.client.force_login(self.admin)
-        with self.assertNumQueries(8):
+        with self.assertNumQueries(9):
             response = self.client.get(url)
             response.render()
             self.assertEqual(response.status_code, 200)
@@ -333,7 +387,7 @@ class ViewsPerformancesTestCase(TestCase):
     def test_project_credit_recurrence_update_view(self):
         url = reverse("high_ui:project-update_credit_recurrence", kwargs={"company_name": self.company.slug_name})
         self.client.force_login(self.admin)
-        with self.assertNumQueries(8):
+        with self.assertNumQueries(9):
             response = self.client.get(url)
             response.render()
             self.assertEqual(response.status_code, 200)
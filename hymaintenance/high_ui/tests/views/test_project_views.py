@@ -11,6 +11,7 @@ from freezegun.api import FakeDate
 from maintenance.forms.project import INACTIF_CONTRACT_INPUT
 from maintenance.models import MaintenanceContract
 from maintenance.models import MaintenanceCredit
+from maintenance.models import MaintenanceType
 from maintenance.models.contract import AVAILABLE_TOTAL_TIME
 from maintenance.models.contract import CONSUMMED_TOTAL_TIME
 from maintenance.tests.factories import MaintenanceCreditFactory
@@ -729,6 +730,36 @@ class GetContextDataProjectDetailsSpecificTestCase(TestCase):
 
         self.assertEqual(history[event_month], expected_info)
 
+    def test_history_available_contract__past_months_events(self):
+        company, contract, _, _ = create_project(
+            contract1={"credit_counter": True, "start": datetime.date(2019, 1, 1)},
+            contract2={"disabled": True},
+            contract3={"disabled": True}
+        )
+        MaintenanceIssueFactory(company=company, contract=contract, number_minutes=12, date=datetime.date(2019, 12, 5))
+        MaintenanceIssueFactory(company=company, contract=contract, number_minutes=20, date=datetime.date(2019, 12, 31))
+        MaintenanceIssueFactory(
+            company=company, contract=contract, number_minutes=30, date=datetime.date(2019, 12, 6), is_deleted=True
+        )
+        MaintenanceCreditFactory(company=company, contract=contract, hours_number=10, date=datetime.date(2019, 10, 1))
+        contracts = MaintenanceContract.objects.filter_enabled(company=company)
+
+        view = ProjectDetailsView()
+        view.company = company
+
+        history = view.get_history(contracts)
+
+        december = history[datetime.date(2019, 12, 1)]
+        self.assertEqual(2, december["events_count"])
+        # the events of the past months are loaded on demand
+        self.assertEqual([], december["events"])
+        self.assertEqual((32, 0), (december["contracts"][str(contract.id)]["consumed"],
+                                   december["contracts"][str(contract.id)]["credited"]))
+        october = history[datetime.date(2019, 10, 1)]
+        self.assertEqual(1, october["events_count"])
+        self.assertEqual((0, 10), (october["contracts"][str(contract.id)]["consumed"],
+                                   october["contracts"][str(contract.id)]["credited"]))
+
     def test_history_available_contract__one_future_issue(self):
         company, contract, _, _ = create_project(
             contract1={"credit_counter": True, "start": datetime.date(2019, 1, 1)},
@@ -1132,6 +1163,17 @@ class GetContextDataProjectDetailsGeneralTestCase(TestCase):
 
         self.assertEqual(forecast[expected_month]['events'], expected_events_info)
 
+    def test_get_forecast_events_in_a_single_query(self):
+        view = ProjectDetailsView()
+        view.company = self.company
+        contracts = list(self.contracts)
+        MaintenanceType.objects.get_cached()
+
+        with self.assertNumQueries(1):
+            forecast = view.get_forecast(contracts)
+
+        self.assertEqual(2, forecast[datetime.date(2022, 2, 1)]['events_count'])
+
     def test_get_context_data(self):
         form_url = reverse("high_ui:project_details", args=[self.company.slug_name])
         factory = RequestFactory()
@@ -1152,6 +1194,179 @@ class GetContextDataProjectDetailsGeneralTestCase(TestCase):
         self.assertEqual(6, len(context["history"]))
 
 
+@freeze_time("2020, 2, 29")
+class ProjectHistoryEventsViewTestCase(TestCase):
+    def setUp(self):
+        self.company, self.contract, _, _ = create_project(contract1={"start": datetime.date(2019, 1, 1)})
+        for day in range(1, 26):
+            MaintenanceIssueFactory(
+                company=self.company, contract=self.contract, number_minutes=day, date=datetime.date(2019, 12, day)
+            )
+        self.url = reverse("high_ui:project-history_events", args=[self.company.slug_name, 2019, 12])
+        AdminUserFactory(email="gordon.freeman@blackmesa.com", password="azerty")
+
+    def test_manager_cannot_see_the_events_of_other_company(self):
+        self.client.logout()
+        ManagerUserFactory(email="chell@aperture-science.com", password="azerty")
+
+        self.client.login(username="chell@aperture-science.com", password="azerty")
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_events_are_paginated(self):
+        self.client.login(username="gordon.freeman@blackmesa.com", password="azerty")
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(20, len(response.context["events"]))
+        self.assertEqual(datetime.date(2019, 12, 25), response.context["events"][0]["date"])
+        self.assertContains(response, 'data-events-url="{}?offset=20"'.format(self.url))
+
+        response = self.client.get(self.url, {"offset": 20})
+
+        self.assertEqual(
+            [datetime.date(2019, 12, day) for day in range(5, 0, -1)],
+            [event["date"] for event in response.context["events"]],
+        )
+        self.assertNotContains(response, "data-events-url")
+
+    def test_invalid_offset(self):
+        self.client.login(username="gordon.freeman@blackmesa.com", password="azerty")
+
+        response = self.client.get(self.url, {"offset": "twenty"})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_the_events_of_the_current_month_are_displayed_with_the_project(self):
+        for day in range(1, 26):
+            MaintenanceIssueFactory(
+                company=self.company, contract=self.contract, number_minutes=day, date=datetime.date(2020, 2, day)
+            )
+        self.client.login(username="gordon.freeman@blackmesa.com", password="azerty")
+
+        response = self.client.get(reverse("high_ui:project_details", args=[self.company.slug_name]))
+
+        history = response.context["history"]
+        self.assertEqual(25, history[datetime.date(2020, 2, 1)]["events_count"])
+        self.assertEqual(20, len(history[datetime.date(2020, 2, 1)]["events"]))
+        self.assertEqual(25, history[datetime.date(2019, 12, 1)]["events_count"])
+        self.assertEqual([], history[datetime.date(2019, 12, 1)]["events"])
+        current_month_url = reverse("high_ui:project-history_events", args=[self.company.slug_name, 2020, 2])
+        self.assertContains(response, 'data-events-url="{}?offset=20"'.format(current_month_url))
+        self.assertContains(response, 'data-events-url="{}?offset=0"'.format(self.url))
+
+
+class ProjectEventsExportViewTestCase(TestCase):
+    def setUp(self):
+        self.company, self.contract, self.other_contract, _ = create_project(
+            contract1={"start": datetime.date(2019, 1, 1)}, contract2={"counter_name": "Hotline", "visible": False}
+        )
+        MaintenanceIssueFactory(
+            company=self.company,
+            contract=self.contract,
+            subject="Portal gun",
+            number_minutes=30,
+            date=datetime.date(2019, 4, 2),
+        )
+        MaintenanceIssueFactory(
+            company=self.company,
+            contract=self.other_contract,
+            subject="Turrets",
+            number_minutes=45,
+            date=datetime.date(2019, 5, 3),
+        )
+        MaintenanceCreditFactory(
+            company=self.company, contract=self.contract, subject="", hours_number=8, date=datetime.date(2019, 4, 2)
+        )
+        self.url = reverse("high_ui:project-export_events", args=[self.company.slug_name])
+        AdminUserFactory(email="gordon.freeman@blackmesa.com", password="azerty")
+
+    def get_rows(self, response):
+        self.assertEqual("text/csv", response["Content-Type"])
+        return b"".join(response.streaming_content).decode().splitlines()
+
+    def test_export_the_events_of_the_project(self):
+        self.client.login(username="gordon.freeman@blackmesa.com", password="azerty")
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filename="{}-export.csv"'.format(self.company.slug_name), response["Content-Disposition"])
+        rows = self.get_rows(response)
+        self.assertEqual(7, len(rows[0].split(",")))
+        self.assertEqual(
+            [
+                "Issue,1,2019-04-02,Maintenance,Portal gun,30,",
+                "Credit,,2019-04-02,Maintenance,,,8",
+                "Issue,2,2019-05-03,Hotline,Turrets,45,",
+            ],
+            rows[1:],
+        )
+
+    def test_export_escapes_the_formulas(self):
+        self.contract.counter_name = "@SUM(A1:A2)"
+        self.contract.save()
+        MaintenanceIssueFactory(
+            company=self.company, contract=self.other_contract, subject="=HYPERLINK(\"evil\")", number_minutes=15
+        )
+        MaintenanceIssueFactory(company=self.company, contract=self.other_contract, subject="-2+3", number_minutes=15)
+        MaintenanceCreditFactory(company=self.company, contract=self.contract, subject="+1", hours_number=1)
+        self.client.login(username="gordon.freeman@blackmesa.com", password="azerty")
+
+        rows = self.get_rows(self.client.get(self.url))
+
+        self.assertIn("Issue,1,2019-04-02,'@SUM(A1:A2),Portal gun,30,", rows)
+        self.assertTrue(any(row.endswith(",Hotline,\"'=HYPERLINK(\"\"evil\"\")\",15,") for row in rows))
+        self.assertTrue(any(row.endswith(",Hotline,'-2+3,15,") for row in rows))
+        self.assertTrue(any(row.endswith(",'@SUM(A1:A2),'+1,,1") for row in rows))
+
+    def test_export_escapes_the_formulas_after_a_tab_or_a_carriage_return(self):
+        MaintenanceIssueFactory(company=self.company, contract=self.other_contract, subject="\t=1+1", number_minutes=15)
+        MaintenanceCreditFactory(company=self.company, contract=self.contract, subject="\r=1+1", hours_number=1)
+        self.client.login(username="gordon.freeman@blackmesa.com", password="azerty")
+
+        response = self.client.get(self.url)
+        content = b"".join(response.streaming_content).decode()
+
+        self.assertIn(",Hotline,'\t=1+1,15,\r\n", content)
+        self.assertIn(",Maintenance,\"'\r=1+1\",,1\r\n", content)
+
+    def test_export_filters(self):
+        self.client.login(username="gordon.freeman@blackmesa.com", password="azerty")
+
+        response = self.client.get(self.url, {"start": "2019-04-03", "end": "2019-12-31"})
+        self.assertEqual(["Issue,2,2019-05-03,Hotline,Turrets,45,"], self.get_rows(response)[1:])
+
+        response = self.client.get(self.url, {"contracts": [self.contract.id]})
+        self.assertEqual(
+            ["Issue,1,2019-04-02,Maintenance,Portal gun,30,", "Credit,,2019-04-02,Maintenance,,,8"],
+            self.get_rows(response)[1:],
+        )
+
+        response = self.client.get(self.url, {"start": "2019-05-01", "end": "2019-04-01"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_manager_does_not_export_the_hidden_contracts(self):
+        ManagerUserFactory(email="chell@aperture-science.com", password="azerty", company=self.company)
+        self.client.login(username="chell@aperture-science.com", password="azerty")
+
+        response = self.client.get(self.url)
+        self.assertEqual(3, len(self.get_rows(response)))
+
+        response = self.client.get(self.url, {"contracts": [self.other_contract.id]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_manager_cannot_export_the_events_of_other_company(self):
+        ManagerUserFactory(email="chell@aperture-science.com", password="azerty")
+        self.client.login(username="chell@aperture-science.com", password="azerty")
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 403)
+
+
 class ProjectListArchiveViewTestCase(TestCase):
     @classmethod
     def setUpTestData(cls):
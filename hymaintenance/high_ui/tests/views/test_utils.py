@@ -17,7 +17,7 @@ from ...views.base import get_maintenance_types
 class GetMaintenanceTypesTestCase(TestCase):
     def test_get_all_maintenance_types(self):
         context = get_maintenance_types()
-        self.assertEqual(3, context["maintenance_types"].count())
+        self.assertEqual(3, len(context["maintenance_types"]))
 
 
 class PreviousPageFunctiorTestCase(TestCase):
@@ -6,20 +6,25 @@ from .views.credit import CreditChoicesUpdateView
 from .views.credit import CreditCreateView
 from .views.credit import CreditDeleteView
 from .views.credit import CreditUpdateView
+from .views.dashboard import DashboardCompanyUsersView
 from .views.dashboard import DashboardView
 from .views.general_information import GeneralInformationUpdateView
 from .views.issue import IssueArchiveView
 from .views.issue import IssueCreateView
 from .views.issue import IssueDetailView
 from .views.issue import IssueListUnarchiveView
+from .views.issue import IssueSearchView
 from .views.issue import IssueUpdateView
 from .views.maintenance_type import MaintenanceTypeUpdateView
 from .views.project import EmailAlertUpdateView
 from .views.project import ProjectCreateView
 from .views.project import ProjectCreditRecurrenceDetailView
+from .views.project import ProjectCreditRecurrenceScheduleView
 from .views.project import ProjectCreditRecurrenceUpdateView
 from .views.project import ProjectCustomizeView
 from .views.project import ProjectDetailsView
+from .views.project import ProjectEventsExportView
+from .views.project import ProjectHistoryEventsView
 from .views.project import ProjectListArchiveView
 from .views.project import ProjectListUnarchiveView
 from .views.project import ProjectResetCountersView
@@ -70,9 +75,21 @@ urlpatterns = [
     path(r"projects/", ProjectCreateView.as_view(), name="create_project"),
     path(r"projects/<slug:company_name>/", ProjectDetailsView.as_view(), name="project_details"),
     path(r"projects/<slug:company_name>/contact", ContactView.as_view(), name="project-contact"),
+    path(
+        r"projects/<slug:company_name>/history/<int:year>/<int:month>/events/",
+        ProjectHistoryEventsView.as_view(),
+        name="project-history_events",
+    ),
+    path(r"projects/<slug:company_name>/export/", ProjectEventsExportView.as_view(), name="project-export_events"),
+    path(
+        r"projects/<slug:company_name>/dashboard-users/",
+        DashboardCompanyUsersView.as_view(),
+        name="project-dashboard_users",
+    ),
     path(r"projects/<slug:company_name>/update/", ProjectUpdateView.as_view(), name="update_project"),
     path(r"projects/<slug:company_name>/customize/", ProjectCustomizeView.as_view(), name="customize_project"),
     path(r"projects/<slug:company_name>/issues/", IssueCreateView.as_view(), name="project-create_issue"),
+    path(r"projects/<slug:company_name>/issues/search/", IssueSearchView.as_view(), name="project-search_issues"),
     path(
         r"projects/<slug:company_name>/issues/<int:company_issue_number>/",
         IssueDetailView.as_view(),
@@ -154,6 +171,11 @@ urlpatterns = [
         ProjectCreditRecurrenceDetailView.as_view(),
         name="project-credit_recurrence_details",
     ),
+    path(
+        r"projects/<slug:company_name>/credit-recurrence-schedule/",
+        ProjectCreditRecurrenceScheduleView.as_view(),
+        name="project-credit_recurrence_schedule",
+    ),
     path(r"operators/", OperatorUserCreateView.as_view(), name="create_operator"),
     path(r"operators/update/", OperatorUsersListUpdateView.as_view(), name="update_operators"),
     path(r"operators/archive/", OperatorUsersListArchiveView.as_view(), name="archive_operators"),
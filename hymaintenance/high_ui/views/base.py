@@ -7,12 +7,13 @@ from maintenance.models.contract import AVAILABLE_TOTAL_TIME
 
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 
 
 def get_maintenance_types():
-    context = {"maintenance_types": MaintenanceType.objects.all().order_by("id")}
+    context = {"maintenance_types": MaintenanceType.objects.get_cached()}
     return context
 
 
@@ -34,12 +35,34 @@ def get_context_data_dashboard_header(user):
     return context
 
 
+def get_project_contracts(user, company):
+    if user.has_operator_or_admin_permissions():
+        return MaintenanceContract.objects.filter_enabled().filter(company=company)
+    return MaintenanceContract.objects.filter_enabled_and_visible().filter(company=company)
+
+
+def paginate_by_offset(request, get_rows, per_page):
+    """Returns the rows of the page at the offset of the query string, the previous and the next offsets.
+
+    get_rows(offset, limit) fetches one more row than the page, to know if there are other ones after it
+    without counting all of them.
+    """
+    try:
+        offset = int(request.GET.get("offset", 0))
+    except ValueError:
+        raise Http404
+    if offset < 0:
+        raise Http404
+
+    rows = list(get_rows(offset, per_page + 1))
+    previous_offset = max(offset - per_page, 0) if offset else None
+    next_offset = offset + per_page if len(rows) > per_page else None
+    return rows[:per_page], previous_offset, next_offset
+
+
 def get_context_data_project_header(user, company):
     context = {}
-    if user.has_operator_or_admin_permissions():
-        context["contracts"] = MaintenanceContract.objects.filter_enabled().filter(company=company)
-    else:
-        context["contracts"] = MaintenanceContract.objects.filter_enabled_and_visible().filter(company=company)
+    context["contracts"] = get_project_contracts(user, company)
     context["add_credits"] = (
         True if context["contracts"].filter(total_type=AVAILABLE_TOTAL_TIME, disabled=False).count() else False
     )
@@ -79,11 +102,9 @@ class IsAdminTestMixin(LoginRequiredMixin, UserPassesTestMixin):
 
 class IsAtLeastAllowedOperatorTestMixin(IsAdminTestMixin):
     def test_func(self):
-        return super().test_func() or (
-            self.user.has_operator_permissions() and self.company in self.user.operator_for.all()
-        )
+        return super().test_func() or self.user.can_operate_company(self.company)
 
 
 class IsAtLeastAllowedManagerTestMixin(IsAtLeastAllowedOperatorTestMixin):
     def test_func(self):
-        return super().test_func() or (self.company == self.user.company)
+        return super().test_func() or self.user.can_manage_company(self.company)
@@ -1,14 +1,59 @@
 from customers.models import Company
+from customers.models import MaintenanceUser
 from customers.models.user import get_active_companies_of_operator
+from maintenance.models import MaintenanceConsumer
 
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import F
+from django.http import JsonResponse
 from django.shortcuts import redirect
 from django.views.generic import TemplateView
+from django.views.generic import View
 
+from ..models import CompanyDashboardSummary
+from .base import IsAtLeastAllowedOperatorTestMixin
+from .base import ViewWithCompany
 from .base import get_context_data_dashboard_header
 
 
+COMPANIES_PER_PAGE = 20
+
+
+def update_dashboard_summaries(companies):
+    """Computes again the missing and stale dashboard summaries of companies loaded with their summary."""
+    outdated_companies = [
+        company
+        for company in companies
+        if not hasattr(company, "dashboard_summary") or company.dashboard_summary.is_stale()
+    ]
+    if outdated_companies:
+        summaries = CompanyDashboardSummary.objects.rebuild([company.id for company in outdated_companies])
+        for company in outdated_companies:
+            company.dashboard_summary = summaries[company.id]
+
+
+def paginate_companies(companies, after=None, before=None, companies_number=COMPANIES_PER_PAGE):
+    """Returns a page of companies ordered by slug name, and the cursors of the previous and next pages.
+
+    The page starts after the slug name `after`, or ends before the slug name `before`.
+    """
+    if before:
+        companies = list(companies.filter(slug_name__lt=before).order_by("-slug_name")[:companies_number + 1])
+        has_previous_page = len(companies) > companies_number
+        companies = companies[:companies_number][::-1]
+        has_next_page = True
+    else:
+        if after:
+            companies = companies.filter(slug_name__gt=after)
+        companies = list(companies.order_by("slug_name")[:companies_number + 1])
+        has_next_page = len(companies) > companies_number
+        companies = companies[:companies_number]
+        has_previous_page = bool(after)
+
+    previous_cursor = companies[0].slug_name if companies and has_previous_page else None
+    next_cursor = companies[-1].slug_name if companies and has_next_page else None
+    return companies, previous_cursor, next_cursor
+
+
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = "high_ui/dashboard.html"
 
@@ -22,14 +67,43 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         if self.user.has_operator_or_admin_permissions():
             context = self.get_context_data(**kwargs)
             if self.user.has_admin_permissions():
-                context["companies"] = Company.objects.filter(is_archived=False).order_by(F("slug_name").asc())
+                companies = Company.objects.filter(is_archived=False)
             else:
-                context["companies"] = get_active_companies_of_operator(self.user).order_by(F("slug_name").asc())
-
-            # TODO prefetch the Company relations in one query for all companies:
-            # 1) Company to its MaintenanceConsumers
-            # 2) Company to its MaintenanceUsers
-
+                companies = get_active_companies_of_operator(self.user).prefetch_related(None)
+            companies, context["previous_cursor"], context["next_cursor"] = paginate_companies(
+                companies.select_related("dashboard_summary"),
+                after=request.GET.get("after"),
+                before=request.GET.get("before"),
+            )
+            # everything displayed comes from the summaries, the users are loaded by DashboardCompanyUsersView
+            update_dashboard_summaries(companies)
+            context["companies"] = companies
             return self.render_to_response(context)
 
         return redirect(self.user.company.get_absolute_url())
+
+
+class DashboardCompanyUsersView(IsAtLeastAllowedOperatorTestMixin, ViewWithCompany, View):
+    """Names of the users listed in the dashboard row of a company, loaded once the row is displayed."""
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(
+            {
+                "operators": [
+                    operator.get_full_name()
+                    for operator in MaintenanceUser.objects.get_active_all_types_operator_users_queryset().filter(
+                        operator_for=self.company
+                    )
+                ],
+                "managers": [
+                    manager.get_full_name()
+                    for manager in MaintenanceUser.objects.get_active_manager_users_queryset().filter(
+                        company=self.company
+                    )
+                ],
+                "consumers": [
+                    consumer.name
+                    for consumer in MaintenanceConsumer.objects.get_used_consumers().filter(company=self.company)
+                ],
+            }
+        )
@@ -10,6 +10,7 @@ from django.views.generic import CreateView
 from django.views.generic import DetailView
 from django.views.generic import FormView
 from django.views.generic import RedirectView
+from django.views.generic import TemplateView
 from django.views.generic import UpdateView
 
 from .base import IsAdminTestMixin
@@ -18,6 +19,11 @@ from .base import IsAtLeastAllowedOperatorTestMixin
 from .base import ViewWithCompany
 from .base import get_context_data_dashboard_header
 from .base import get_context_previous_page
+from .base import get_project_contracts
+from .base import paginate_by_offset
+
+
+ISSUES_SEARCH_RESULTS_PER_PAGE = 20
 
 
 class IssueCreateView(ViewWithCompany, IsAtLeastAllowedOperatorTestMixin, CreateView):
@@ -38,6 +44,27 @@ class IssueCreateView(ViewWithCompany, IsAtLeastAllowedOperatorTestMixin, Create
         return kwargs
 
 
+class IssueSearchView(ViewWithCompany, IsAtLeastAllowedManagerTestMixin, TemplateView):
+    """Issues of the project matching the words of the query string, from the most recent one."""
+
+    template_name = "high_ui/issues_search.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get("q", "").strip()
+        issues = (
+            MaintenanceIssue.objects.search(query)
+            .filter(company=self.company, is_deleted=False, contract__in=get_project_contracts(self.user, self.company))
+            .order_by("-date", "-id")
+        )
+        context["query"] = query
+        context["issues"], context["previous_offset"], context["next_offset"] = paginate_by_offset(
+            self.request, lambda offset, limit: issues[offset:offset + limit], ISSUES_SEARCH_RESULTS_PER_PAGE
+        )
+        context.update(get_context_previous_page(self.request))
+        return context
+
+
 class IssueUpdateView(ViewWithCompany, IsAtLeastAllowedOperatorTestMixin, UpdateView):
     form_class = MaintenanceIssueUpdateForm
     template_name = "high_ui/forms/update_issue.html"
@@ -1,3 +1,5 @@
+import csv
+from datetime import date
 from datetime import datetime
 
 from customers.forms.company import ProjectCustomizeForm
@@ -7,22 +9,33 @@ from customers.models import Company
 from dateutil.relativedelta import relativedelta
 from maintenance.forms.email import EmailAlertUpdateForm
 from maintenance.forms.project import ProjectCreateForm
+from maintenance.forms.project import ProjectEventsExportForm
 from maintenance.forms.project import ProjectUpdateForm
 from maintenance.forms.recurrence import RecurrenceContractsModelForm
 from maintenance.forms.recurrence import RecurrenceContractsReadOnlyForm
 from maintenance.formsets.recurrence import RecurrenceContractsModelFormSet
+from maintenance.models import ContractMonthlyRollup
 from maintenance.models import MaintenanceContract
-from maintenance.models import MaintenanceCredit
-from maintenance.models import MaintenanceIssue
 from maintenance.models.contract import AVAILABLE_TOTAL_TIME
+from maintenance.models.contract import RECURRENCE_SCHEDULE_LENGTH
+from maintenance.models.counters import defer_contracts_counters_updates
+from maintenance.models.utils import get_home_events_values
+from maintenance.models.utils import iter_home_events
+from maintenance.models.utils import iter_home_events_by_month
 
 from django import forms
 from django.core.exceptions import PermissionDenied
 from django.forms import modelformset_factory
+from django.http import Http404
+from django.http import HttpResponseBadRequest
+from django.http import JsonResponse
+from django.http import StreamingHttpResponse
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic import DetailView
 from django.views.generic import FormView
+from django.views.generic import TemplateView
 from django.views.generic import UpdateView
+from django.views.generic import View
 
 from .base import IsAdminTestMixin
 from .base import IsAtLeastAllowedManagerTestMixin
@@ -31,6 +44,8 @@ from .base import ViewWithCompany
 from .base import get_context_data_dashboard_header
 from .base import get_context_previous_page
 from .base import get_maintenance_types
+from .base import get_project_contracts
+from .base import paginate_by_offset
 
 
 class ProjectCreateView(IsAdminTestMixin, FormView):
@@ -72,12 +87,36 @@ class ProjectUpdateView(IsAdminTestMixin, ViewWithCompany, FormView):
         return super().form_valid(form)
 
 
+HISTORY_EVENTS_PER_PAGE = 20
+MAX_RECURRENCE_SCHEDULE_LENGTH = 60
+# the spreadsheets run the cells starting with these characters as formulas
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def get_history_month_events(company, contracts, month, offset=0, limit=HISTORY_EVENTS_PER_PAGE):
+    events = get_home_events_values(
+        company,
+        contracts,
+        descending=True,
+        date__gte=month,
+        date__lt=month + relativedelta(months=1),
+        date__lte=datetime.now(),
+    )
+    return [
+        event for _, month_events in iter_home_events_by_month(events[offset:offset + limit]) for event in month_events
+    ]
+
+
 class ProjectDetailsView(ViewWithCompany, IsAtLeastAllowedManagerTestMixin, DetailView):
     template_name = "high_ui/company_details.html"
     model = Company
     slug_url_kwarg = "company_name"
     slug_field = "slug_name"
 
+    def get_object(self, queryset=None):
+        # already fetched to check the permissions
+        return self.company
+
     def initialize_history_data_structure(self, contracts):
         current_month = datetime.strptime(datetime.now().strftime('%m/%Y'), '%m/%Y').date()
         month = None
@@ -88,7 +127,7 @@ class ProjectDetailsView(ViewWithCompany, IsAtLeastAllowedManagerTestMixin, Deta
             for contract in contracts:
                 contracts_info[str(contract.id)] = {
                     "css_class": contract.css_class,
-                    "counter_name": contract.displayed_counter_name,
+                    "counter_name": contract.get_counter_name(),
                     "is_available_time_counter": contract.is_available_time_counter(),
                     "consumed": 0,
                     "credited": 0
@@ -103,63 +142,53 @@ class ProjectDetailsView(ViewWithCompany, IsAtLeastAllowedManagerTestMixin, Deta
     def get_history(self, contracts):
         # initialize section for each months of this history
         last_month, history = self.initialize_history_data_structure(contracts)
+        current_month = datetime.now().date().replace(day=1)
+
+        # counters of the past months, the rollup of the current one also has future events which are not displayed yet
+        rollups = list(
+            ContractMonthlyRollup.objects.filter(contract__in=contracts, month__gte=last_month, month__lt=current_month)
+        )
+        rollups += ContractMonthlyRollup.objects.compute(contracts, date__gte=current_month, date__lte=datetime.now())
+        for rollup in rollups:
+            history[rollup.month]["events_count"] += rollup.event_count
+            history[rollup.month]["contracts"][str(rollup.contract_id)]["consumed"] += rollup.consumed_minutes
+            history[rollup.month]["contracts"][str(rollup.contract_id)]["credited"] += rollup.credited_hours
+
+        # the first events of the current month are displayed at once, the other ones are loaded on demand
+        if history[current_month]["events_count"]:
+            history[current_month]["events"] = get_history_month_events(self.company, contracts, current_month)
 
-        # get passed events lint of the asked months
-        issues = MaintenanceIssue.objects.home_history_values(self.company, contracts, last_month)
-        credits = MaintenanceCredit.objects.home_history_values(self.company, contracts, last_month)
-
-        events = list(issues) + list(credits)
-        events.sort(key=lambda item: item["date"], reverse=True)
+        return history
 
-        # format history info
+    def add_events_to_counters(self, contracts_info, events):
         for event in events:
-            month = datetime.strptime(event["date"].strftime('%m/%Y'), '%m/%Y').date()
-
-            history[month]["events_count"] += 1
-            history[month]["events"].append(event)
-
             if event["type"] == "issue":
-                history[month]["contracts"][str(event["contract"])]["consumed"] += event["number_minutes"]
+                contracts_info[str(event["contract"])]["consumed"] += event["number_minutes"]
             else:
-                history[month]["contracts"][str(event["contract"])]["credited"] += event["hours_number"]
-
-        return history
+                contracts_info[str(event["contract"])]["credited"] += event["hours_number"]
 
     def get_forecast(self, contracts):
         # get future events list
-        issues = MaintenanceIssue.objects.home_forecast_values(self.company, contracts)
-        credits = MaintenanceCredit.objects.home_forecast_values(self.company, contracts)
-
-        events = list(issues) + list(credits)
-        events.sort(key=lambda item: item["date"])
+        events = get_home_events_values(self.company, contracts, date__gt=datetime.now())
 
         # format forecast info
         forecast = {}
-        for event in events:
-            month = datetime.strptime(event["date"].strftime('%m/%Y'), '%m/%Y').date()
-            if month not in forecast:
-                contracts_info = {}
-                for contract in contracts:
-                    contracts_info[str(contract.id)] = {
-                        "css_class": contract.css_class,
-                        "counter_name": contract.displayed_counter_name,
-                        "is_available_time_counter": contract.is_available_time_counter(),
-                        "consumed": 0,
-                        "credited": 0
-                    }
-                forecast[month] = {
-                    "contracts": contracts_info,
-                    "events_count": 1,
-                    "events": [event, ]
+        for month, month_events in iter_home_events_by_month(events):
+            contracts_info = {}
+            for contract in contracts:
+                contracts_info[str(contract.id)] = {
+                    "css_class": contract.css_class,
+                    "counter_name": contract.get_counter_name(),
+                    "is_available_time_counter": contract.is_available_time_counter(),
+                    "consumed": 0,
+                    "credited": 0
                 }
-            else:
-                forecast[month]["events_count"] += 1
-                forecast[month]["events"].append(event)
-
-            if event["type"] == "issue":
-                forecast[month]["contracts"][str(event["contract"])]["consumed"] += event["number_minutes"]
-            else:
-                forecast[month]["contracts"][str(event["contract"])]["credited"] += event["hours_number"]
+            self.add_events_to_counters(contracts_info, month_events)
+            forecast[month] = {
+                "contracts": contracts_info,
+                "events_count": len(month_events),
+                "events": month_events
+            }
 
         return forecast
 
@@ -173,6 +202,86 @@ class ProjectDetailsView(ViewWithCompany, IsAtLeastAllowedManagerTestMixin, Deta
         return context
 
 
+class ProjectHistoryEventsView(ViewWithCompany, IsAtLeastAllowedManagerTestMixin, TemplateView):
+    """Rows of the events of a month of the project history, from the offset given in the query string."""
+
+    template_name = "high_ui/company_details_events.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            month = date(self.kwargs["year"], self.kwargs["month"], 1)
+        except ValueError:
+            raise Http404
+
+        context["month"] = month
+        context["events"], context["previous_offset"], context["next_offset"] = paginate_by_offset(
+            self.request,
+            lambda offset, limit: get_history_month_events(self.company, context["contracts"], month, offset, limit),
+            HISTORY_EVENTS_PER_PAGE,
+        )
+        return context
+
+
+class EchoBuffer:
+    """File-like object given to the csv writer, which returns each written row instead of keeping it."""
+
+    def write(self, value):
+        return value
+
+
+def escape_csv_formula(value):
+    if value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_events_csv_rows(events):
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(
+        (_("Type"), _("Number"), _("Date"), _("Counter"), _("Subject"), _("Time spent (minutes)"), _("Credited hours"))
+    )
+    for event in events:
+        if event["type"] == "issue":
+            yield writer.writerow(
+                (
+                    _("Issue"),
+                    event["company_issue_number"],
+                    event["date"].isoformat(),
+                    escape_csv_formula(event["counter_name"]),
+                    escape_csv_formula(event["subject"]),
+                    event["number_minutes"],
+                    "",
+                )
+            )
+        else:
+            yield writer.writerow(
+                (
+                    _("Credit"),
+                    "",
+                    event["date"].isoformat(),
+                    escape_csv_formula(event["counter_name"]),
+                    escape_csv_formula(event["subject"] or ""),
+                    "",
+                    event["hours_number"],
+                )
+            )
+
+
+class ProjectEventsExportView(ViewWithCompany, IsAtLeastAllowedManagerTestMixin, View):
+    """CSV file of the issues and credits of the project, written while they are fetched by chunks."""
+
+    def get(self, request, *args, **kwargs):
+        form = ProjectEventsExportForm(request.GET, contracts=get_project_contracts(request.user, self.company))
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+
+        events = get_home_events_values(self.company, form.get_contracts(), **form.get_events_filters())
+        response = StreamingHttpResponse(iter_events_csv_rows(iter_home_events(events)), content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="{}-export.csv"'.format(self.company.slug_name)
+        return response
+
+
 class ProjectListArchiveView(IsAdminTestMixin, FormView):
     form_class = ProjectListArchiveForm
     template_name = "high_ui/forms/archive_projects.html"
@@ -308,12 +417,43 @@ class ProjectCreditRecurrenceDetailView(IsAtLeastAllowedManagerTestMixin, Projec
         raise PermissionDenied
 
 
+class ProjectCreditRecurrenceScheduleView(ViewWithCompany, IsAtLeastAllowedManagerTestMixin, View):
+    """Next occurrences of the credit recurrences of the project, with the projected counters of their contracts."""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            occurrences_number = int(request.GET.get("occurrences", RECURRENCE_SCHEDULE_LENGTH))
+        except ValueError:
+            occurrences_number = 0
+        if not 0 < occurrences_number <= MAX_RECURRENCE_SCHEDULE_LENGTH:
+            return HttpResponseBadRequest(
+                _("The number of occurrences must be between 1 and {}.").format(MAX_RECURRENCE_SCHEDULE_LENGTH)
+            )
+
+        contracts = get_project_contracts(request.user, self.company).filter(
+            total_type=AVAILABLE_TOTAL_TIME, has_credit_recurrence=True
+        )
+        return JsonResponse(
+            {
+                "contracts": [
+                    {
+                        "id": contract.id,
+                        "counter_name": contract.get_counter_name(),
+                        "occurrences": contract.get_recurrence_schedule(occurrences_number),
+                    }
+                    for contract in contracts
+                ]
+            }
+        )
+
+
 class ProjectCreditRecurrenceUpdateView(IsAtLeastAllowedOperatorTestMixin, ProjectCreditRecurrenceBaseView):
     form_class = modelformset_factory(
         model=MaintenanceContract, formset=RecurrenceContractsModelFormSet, form=RecurrenceContractsModelForm, extra=0
     )
     template_name = "high_ui/forms/update_credit_recurrence.html"
 
+    @defer_contracts_counters_updates()
     def form_valid(self, form):
         for sub_form in form:
             sub_form.instance.set_recurrence_dates_and_create_all_old_credit_occurrences()
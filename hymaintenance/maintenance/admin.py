@@ -6,6 +6,7 @@ from .models import MaintenanceContract
 from .models import MaintenanceCredit
 from .models import MaintenanceIssue
 from .models import MaintenanceType
+from .models import QueuedEmail
 
 
 class MaintenanceIssueAdmin(admin.ModelAdmin):
@@ -38,4 +39,5 @@ admin.site.register(IncomingChannel)
 admin.site.register(MaintenanceContract, MaintenanceContractAdmin)
 admin.site.register(MaintenanceIssue, MaintenanceIssueAdmin)
 admin.site.register(MaintenanceCredit)
+admin.site.register(QueuedEmail)
 # admin.site.register(MaintenanceAnswer)
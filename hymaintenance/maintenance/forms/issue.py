@@ -1,13 +1,15 @@
 from customers.models import Company
 from toolkit.email import is_credited_hours_min_exceeded
-from toolkit.email import send_email_alert
+from toolkit.email import queue_email_alert
 from toolkit.forms import HyClearableFileInput
 
 from django import forms
+from django.db import transaction
 from django.utils.html import format_html
 from django.utils.translation import ugettext_lazy as _
 
 from ..models import MaintenanceIssue
+from ..models.counters import defer_contracts_counters_updates
 
 
 def duration_in_minutes(duration, duration_type):
@@ -58,9 +60,12 @@ class MaintenanceIssueCreateForm(forms.ModelForm):
         number_minutes = duration_in_minutes(form_data["duration"], form_data["duration_type"])
         self.instance.number_minutes = number_minutes
 
-        issue = super().save(commit)
-        if is_credited_hours_min_exceeded(form_data["contract"]):
-            send_email_alert(form_data["contract"])
+        # the email alert is queued only if the issue is saved
+        with transaction.atomic():
+            issue = super().save(commit)
+            if is_credited_hours_min_exceeded(form_data["contract"]):
+                # sent by the send_queued_emails command, the issue does not wait for the mail server
+                queue_email_alert(form_data["contract"])
         return issue
 
 
@@ -98,6 +103,7 @@ class MaintenanceIssueListUnarchiveForm(forms.Form):
             .order_by("date")
         )
 
+    @defer_contracts_counters_updates()
     def save(self):
         for issue in self.cleaned_data["issues"]:
             issue.is_deleted = False
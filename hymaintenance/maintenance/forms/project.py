@@ -29,7 +29,7 @@ class ProjectForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.maintenance_types = MaintenanceType.objects.order_by("id")
+        self.maintenance_types = MaintenanceType.objects.get_cached()
         for index, maintenance_type in enumerate(self.maintenance_types):
             self.fields[f"contract{index}_counter_name"] = forms.CharField(
                 label=_("Counter name"),
@@ -251,3 +251,35 @@ class ProjectUpdateForm(ProjectForm):
 
         for index, maintenance_type in enumerate(self.maintenance_types):
             self.update_contract(index, self.contracts[index])
+
+
+class ProjectEventsExportForm(forms.Form):
+    start = forms.DateField(label=_("Start Date"), required=False)
+    end = forms.DateField(label=_("End Date"), required=False)
+    contracts = forms.ModelMultipleChoiceField(
+        label=_("Contracts"), required=False, queryset=MaintenanceContract.objects.none()
+    )
+
+    def __init__(self, *args, **kwargs):
+        # the contracts which can be exported, all of them when none is selected
+        self.contracts = kwargs.pop("contracts")
+        super().__init__(*args, **kwargs)
+        self.fields["contracts"].queryset = self.contracts
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get("start"), cleaned_data.get("end")
+        if start and end and start > end:
+            self.add_error("end", _("The end date must be after the start date."))
+        return cleaned_data
+
+    def get_events_filters(self):
+        filters = {}
+        if self.cleaned_data["start"]:
+            filters["date__gte"] = self.cleaned_data["start"]
+        if self.cleaned_data["end"]:
+            filters["date__lte"] = self.cleaned_data["end"]
+        return filters
+
+    def get_contracts(self):
+        return self.cleaned_data["contracts"] or self.contracts
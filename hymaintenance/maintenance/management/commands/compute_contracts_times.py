@@ -1,26 +1,195 @@
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from high_ui.models import mark_companies_dashboard_summaries_changed
+
 from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Mod
 from django.utils.timezone import now
 from django.utils.translation import gettext as _
 
 from ...models import MaintenanceContract
-from ...models.credit import calcul_credited_hours
-from ...models.issue import calcul_consumed_minutes
+from ...models import MaintenanceCredit
+from ...models import MaintenanceIssue
+from ...models.contract import COUNTERS_FIELDS
+from ...models.contract import COUNTERS_SUMS
+from ...models.contract import get_counters_sums_annotations
+
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# a contract whose stored counters differ from the ones computed from its issues and credits
+DriftedContract = namedtuple(
+    "DriftedContract",
+    (
+        "contract_id",
+        "company_id",
+        "stored_consumed_minutes",
+        "consumed_minutes",
+        "stored_credited_hours",
+        "credited_hours",
+    ),
+)
 
 
 class Command(BaseCommand):
     help = _(
-        """This command do for each contracts :
-           * check if remaining minutes reach the minutes minimum
-           * if yes, send an alert email to the client"""
+        """This command computes again the counters of the contracts from their issues and credits:
+           * the consumed minutes and the credited hours, with the carry-over of the reset date
+           * the drifted counters are written back, or only reported with --dry-run"""
     )
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--company",
+            action="append",
+            dest="companies",
+            metavar="SLUG_NAME",
+            help=_("Only the contracts of this company, can be repeated"),
+        )
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            metavar="YYYY-MM-DD",
+            help=_("Only the contracts with issues or credits dated on or after this date"),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=_("Number of contracts computed and written at once"),
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help=_("Number of processes, the contracts are shared between them by company"),
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help=_("Report the drifted counters without writing them")
+        )
+
     def handle(self, *args, **options):
-        compute_contracts_times()
+        drifted_contracts = compute_contracts_times(
+            companies=options["companies"],
+            since=options["since"],
+            chunk_size=options["chunk_size"],
+            processes=options["processes"],
+            dry_run=options["dry_run"],
+        )
+
+        for drifted in drifted_contracts:
+            self.stdout.write(
+                _(
+                    "Contract {contract_id} (company {company_id}): "
+                    "consumed minutes {stored_consumed_minutes} -> {consumed_minutes}, "
+                    "credited hours {stored_credited_hours} -> {credited_hours}"
+                ).format(**drifted._asdict())
+            )
+        if options["dry_run"]:
+            message = _("{} contracts have drifted counters.")
+        else:
+            message = _("{} contracts had drifted counters, they are fixed.")
+        self.stdout.write(self.style.SUCCESS(message.format(len(drifted_contracts))))
+
+
+def get_contracts_to_compute(companies=None, since=None, shard=None, shards_number=None):
+    contracts = MaintenanceContract._base_manager.all()
+    if companies:
+        contracts = contracts.filter(company__slug_name__in=companies)
+    if since is not None:
+        contracts = contracts.filter(
+            Q(id__in=MaintenanceIssue._base_manager.filter(date__gte=since).values("contract"))
+            | Q(id__in=MaintenanceCredit._base_manager.filter(date__gte=since).values("contract"))
+        )
+    if shard is not None:
+        contracts = contracts.annotate(shard=Mod("company_id", shards_number)).filter(shard=shard)
+    return contracts
+
+
+def compute_contracts_chunk(contract_ids, today, dry_run=False):
+    drifted_contracts = []
+    consumed_minutes_field = MaintenanceContract._meta.get_field("consumed_minutes")
+    credited_hours_field = MaintenanceContract._meta.get_field("credited_hours")
+
+    with transaction.atomic():
+        contracts = MaintenanceContract._base_manager.filter(id__in=contract_ids)
+        if not dry_run:
+            # locked until written, the events saved meanwhile update the counters once they are computed
+            contracts = contracts.select_for_update()
+        contracts = list(contracts.annotate(**get_counters_sums_annotations(today)).order_by("id"))
+        for contract in contracts:
+            stored_counters = (contract.consumed_minutes, contract.credited_hours)
+            contract.compute_and_set_counters({name: getattr(contract, name) for name in COUNTERS_SUMS})
+            # the values written by the database, the credited hours can be computed with a fraction
+            counters = (
+                consumed_minutes_field.get_prep_value(contract.consumed_minutes),
+                credited_hours_field.get_prep_value(contract.credited_hours),
+            )
+            if counters != stored_counters:
+                drifted_contracts.append(
+                    DriftedContract(
+                        contract.id,
+                        contract.company_id,
+                        stored_counters[0],
+                        counters[0],
+                        stored_counters[1],
+                        counters[1],
+                    )
+                )
+                contract.consumed_minutes, contract.credited_hours = counters
+
+        if not dry_run and drifted_contracts:
+            drifted_ids = {drifted.contract_id for drifted in drifted_contracts}
+            MaintenanceContract._base_manager.bulk_update(
+                [contract for contract in contracts if contract.id in drifted_ids], COUNTERS_FIELDS
+            )
+            # written without the signals, the dashboard displays the counters of the summaries
+            mark_companies_dashboard_summaries_changed({drifted.company_id for drifted in drifted_contracts})
+    return drifted_contracts
+
+
+def compute_contracts_shard(
+    companies=None, since=None, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, today=None, shard=None, shards_number=None
+):
+    if today is None:
+        today = now().date()
+    contract_ids = list(
+        get_contracts_to_compute(companies, since, shard, shards_number).order_by("id").values_list("id", flat=True)
+    )
+    drifted_contracts = []
+    for index in range(0, len(contract_ids), chunk_size):
+        drifted_contracts += compute_contracts_chunk(contract_ids[index:index + chunk_size], today, dry_run)
+    return drifted_contracts
+
+
+def _compute_contracts_shard_in_process(kwargs):
+    try:
+        return compute_contracts_shard(**kwargs)
+    finally:
+        connections.close_all()
+
 
+def compute_contracts_times(
+    companies=None, since=None, chunk_size=DEFAULT_CHUNK_SIZE, processes=1, dry_run=False, today=None
+):
+    if today is None:
+        today = now().date()
+    kwargs = {"companies": companies, "since": since, "chunk_size": chunk_size, "dry_run": dry_run, "today": today}
+    if processes <= 1:
+        return compute_contracts_shard(**kwargs)
 
-def compute_contracts_times(now_date=now().date()):
-    contracts = MaintenanceContract.objects.all()
-    for contract in contracts:
-        contract.consumed_minutes = calcul_consumed_minutes(contract=contract)
-        contract.credited_hours = calcul_credited_hours(contract=contract)
-        contract.save()
+    # the forked processes must not share the database connection of this one
+    connections.close_all()
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork")) as executor:
+        shards_drifted_contracts = executor.map(
+            _compute_contracts_shard_in_process,
+            [{**kwargs, "shard": shard, "shards_number": processes} for shard in range(processes)],
+        )
+        drifted_contracts = [drifted for shard_drifted in shards_drifted_contracts for drifted in shard_drifted]
+    return sorted(drifted_contracts, key=lambda drifted: drifted.contract_id)
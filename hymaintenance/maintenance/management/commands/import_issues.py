@@ -0,0 +1,221 @@
+import csv
+import json
+import os
+from datetime import date
+
+from customers.models import Company
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive
+from django.utils.timezone import make_aware
+from django.utils.translation import gettext as _
+
+from ...models import ContractMonthlyRollup
+from ...models import IncomingChannel
+from ...models import MaintenanceContract
+from ...models import MaintenanceIssue
+
+
+DEFAULT_CHUNK_SIZE = 1000
+
+CSV_FORMAT = "csv"
+JSON_LINES_FORMAT = "jsonl"
+
+TRUE_VALUES = ("1", "true", "yes")
+
+
+class Command(BaseCommand):
+    help = _(
+        """This command imports the issues of a company from a CSV or JSON lines file:
+           * the columns are subject, date, contract, number_minutes, consumer, operator, incoming_channel,
+             description, answer, resolution_date, shipping_date and is_deleted
+           * the contract is given by its counter name, the consumer by its name and the operator by its email
+           * nothing is imported if a line is invalid"""
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help=_("CSV or JSON lines file of the issues"))
+        parser.add_argument("--company", required=True, metavar="SLUG_NAME", help=_("Company of the issues"))
+        parser.add_argument(
+            "--format",
+            choices=(CSV_FORMAT, JSON_LINES_FORMAT),
+            help=_("Format of the file, guessed from its extension by default"),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=_("Number of issues created at once"),
+        )
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(slug_name=options["company"])
+        except Company.DoesNotExist:
+            raise CommandError(_("The company {} does not exist.").format(options["company"]))
+        if not os.path.isfile(options["path"]):
+            raise CommandError(_("The file {} does not exist.").format(options["path"]))
+        file_format = options["format"] or get_file_format(options["path"])
+
+        with open(options["path"], newline="", encoding="utf-8") as file:
+            try:
+                issues_number = import_issues(company, iter_rows(file, file_format), options["chunk_size"])
+            except IssueImportError as error:
+                raise CommandError(str(error))
+
+        self.stdout.write(self.style.SUCCESS(_("{} issues are imported.").format(issues_number)))
+
+
+class IssueImportError(Exception):
+    def __init__(self, line_number, message):
+        super().__init__(_("Line {}: {}").format(line_number, message))
+
+
+def get_file_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return CSV_FORMAT
+    if extension in (".jsonl", ".ndjson"):
+        return JSON_LINES_FORMAT
+    raise CommandError(_("The format of {} cannot be guessed, use --format.").format(path))
+
+
+def iter_rows(file, file_format):
+    """Yields the line number and the values of each issue, the file is read line by line."""
+    if file_format == CSV_FORMAT:
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                raise IssueImportError(line_number, error)
+            if not isinstance(row, dict):
+                raise IssueImportError(line_number, _("an object is expected"))
+            yield line_number, row
+
+
+class IssueBuilder:
+    """Builds the issues of a company from the values of the imported rows.
+
+    The contracts, consumers, operators and incoming channels are loaded once and found by name.
+    """
+
+    def __init__(self, company):
+        self.company = company
+        self.contracts = {
+            contract.get_counter_name(): contract for contract in MaintenanceContract.objects.filter(company=company)
+        }
+        self.consumers = dict(company.maintenanceconsumer_set.values_list("name", "id"))
+        self.operators = {email.lower(): user_id for user_id, email in company.managed_by.values_list("id", "email")}
+        # the names are not unique, the first channel of a name is kept
+        self.incoming_channels = dict(IncomingChannel.objects.order_by("-id").values_list("name", "id"))
+
+    def get_id(self, ids, name, label, line_number):
+        if not name:
+            return None
+        if name not in ids:
+            raise IssueImportError(line_number, _("unknown {} '{}'").format(label, name))
+        return ids[name]
+
+    def get_date(self, value, line_number):
+        try:
+            return date.fromisoformat(str(value))
+        except ValueError:
+            raise IssueImportError(line_number, _("invalid date '{}'").format(value))
+
+    def get_datetime(self, value, line_number):
+        if not value:
+            return None
+        try:
+            parsed_datetime = parse_datetime(str(value))
+        except ValueError:
+            parsed_datetime = None
+        if parsed_datetime is None:
+            raise IssueImportError(line_number, _("invalid date and time '{}'").format(value))
+        if is_naive(parsed_datetime):
+            parsed_datetime = make_aware(parsed_datetime)
+        return parsed_datetime
+
+    def get_number_minutes(self, value, line_number):
+        try:
+            number_minutes = int(value or 0)
+        except (TypeError, ValueError):
+            number_minutes = -1
+        if number_minutes < 0:
+            raise IssueImportError(line_number, _("invalid number of minutes '{}'").format(value))
+        return number_minutes
+
+    def build(self, line_number, row):
+        subject = row.get("subject")
+        if not subject:
+            raise IssueImportError(line_number, _("the subject is required"))
+        if len(subject) > MaintenanceIssue._meta.get_field("subject").max_length:
+            raise IssueImportError(line_number, _("the subject is too long"))
+        if not row.get("date"):
+            raise IssueImportError(line_number, _("the date is required"))
+        contract = self.contracts.get(row.get("contract"))
+        if contract is None:
+            raise IssueImportError(line_number, _("unknown contract '{}'").format(row.get("contract")))
+
+        return MaintenanceIssue(
+            company=self.company,
+            contract=contract,
+            subject=subject,
+            date=self.get_date(row["date"], line_number),
+            number_minutes=self.get_number_minutes(row.get("number_minutes"), line_number),
+            consumer_who_ask_id=self.get_id(self.consumers, row.get("consumer"), _("consumer"), line_number),
+            user_who_fix_id=self.get_id(
+                self.operators, (row.get("operator") or "").lower(), _("operator"), line_number
+            ),
+            incoming_channel_id=self.get_id(
+                self.incoming_channels, row.get("incoming_channel"), _("incoming channel"), line_number
+            ),
+            description=row.get("description") or None,
+            answer=row.get("answer") or None,
+            resolution_date=self.get_datetime(row.get("resolution_date"), line_number),
+            shipping_date=self.get_datetime(row.get("shipping_date"), line_number),
+            is_deleted=str(row.get("is_deleted") or "").lower() in TRUE_VALUES,
+        )
+
+
+def create_issues_chunk(company, issues):
+    numbers = Company.objects.allocate_issues_numbers(company.id, len(issues))
+    for number, issue in zip(numbers, issues):
+        issue.company_issue_number = number
+    MaintenanceIssue.objects.bulk_create(issues)
+
+
+@transaction.atomic
+def import_issues(company, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Creates the issues of the rows by chunks, without the signals of their save.
+
+    The counters and the monthly rollups of their contracts are computed once all the issues are created.
+    """
+    builder = IssueBuilder(company)
+    issues_number = 0
+    contracts = {}
+    chunk = []
+    for line_number, row in rows:
+        issue = builder.build(line_number, row)
+        contracts[issue.contract_id] = issue.contract
+        chunk.append(issue)
+        if len(chunk) >= chunk_size:
+            create_issues_chunk(company, chunk)
+            issues_number += len(chunk)
+            chunk = []
+    if chunk:
+        create_issues_chunk(company, chunk)
+        issues_number += len(chunk)
+
+    for contract in contracts.values():
+        contract.refresh_counters()
+    ContractMonthlyRollup.objects.rebuild(list(contracts))
+    return issues_number
@@ -1,25 +1,90 @@
+from high_ui.models import mark_companies_dashboard_summaries_changed
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils.timezone import now
 from django.utils.translation import gettext as _
 
+from ...models import ContractMonthlyRollup
 from ...models import MaintenanceContract
+from ...models import MaintenanceCredit
+from ...models.contract import COUNTERS_FIELDS
+from ...models.contract import RECURRENCE_FIELDS
+from ...models.contract import get_counters_sums_annotations
 
 
 class Command(BaseCommand):
     help = _(
-        """This command do for each contracts :
-           * check if remaining minutes reach the minutes minimum
-           * if yes, send an alert email to the client"""
+        """This command do for each contracts with a credit recurrence :
+           * check if the next occurrences of the recurrence are reached
+           * if yes, credit the hours of each of them and reset the counters if asked
+           * count the issues and credits dated in the future when saved whose date is reached"""
     )
 
     def handle(self, *args, **options):
         check_and_apply_credit_recurrence()
+        count_arrived_events()
 
 
-def check_and_apply_credit_recurrence(now_date=now().date()):
-    contracts = MaintenanceContract.objects.all()
+@transaction.atomic
+def check_and_apply_credit_recurrence(now_date=None):
+    """Applies all the occurrences reached at now_date of the credit recurrences, the missed ones included.
+
+    Only the due contracts are loaded, their credits are created at once and their counters are computed once.
+    The occurrences already credited are skipped, so it can be run again after a failure.
+    """
+    if now_date is None:
+        now_date = now().date()
+    contracts = list(
+        MaintenanceContract.objects.filter_due_credit_recurrences(now_date).select_for_update(of=("self",))
+    )
+    if not contracts:
+        return []
+
+    credits = []
+    for contract in contracts:
+        dates = list(contract.iter_recurrence_dates(now_date))
+        credits.extend(
+            credit for credit in (contract.build_credit_occurrence(date) for date in dates) if credit is not None
+        )
+        contract.recurrence_last_date = dates[-1]
+        contract.recurrence_next_date = contract.get_recurrence_next_date(dates[-1])
+        if contract.has_reset_recurrence:
+            contract.reset_date = contract.recurrence_last_date
+    MaintenanceCredit.objects.bulk_create(credits, ignore_conflicts=True)
+    MaintenanceContract.objects.bulk_update(contracts, RECURRENCE_FIELDS)
+
+    # the credits are created without the signals updating the counters and the rollups of their contract
+    contract_ids = [contract.id for contract in contracts]
+    counted_contracts = list(MaintenanceContract.objects.with_counters_sums(id__in=contract_ids))
+    for contract in counted_contracts:
+        contract.compute_and_set_counters()
+    MaintenanceContract.objects.bulk_update(counted_contracts, COUNTERS_FIELDS)
+    ContractMonthlyRollup.objects.rebuild(contract_ids)
+    mark_companies_dashboard_summaries_changed({contract.company_id for contract in contracts})
+    return contracts
+
+
+@transaction.atomic
+def count_arrived_events(now_date=None):
+    """Computes again the counters of the contracts with issues or credits reached since their last count.
+
+    The events dated in the future are left out of the counters when saved, so they are counted once their date
+    is reached, even if the command was not run on that day.
+    """
+    if now_date is None:
+        now_date = now().date()
+    contracts = list(
+        MaintenanceContract.objects.filter_arrived_events(now_date)
+        .select_for_update(of=("self",))
+        .annotate(**get_counters_sums_annotations(now_date))
+    )
     for contract in contracts:
-        if contract.has_credit_recurrence and now_date >= contract.recurrence_next_date:
-            contract.apply_recurrence_at(now_date)
-            contract.save()
+        contract.compute_and_set_counters()
+        contract.counted_until = now_date
+    MaintenanceContract.objects.bulk_update(contracts, COUNTERS_FIELDS + ("counted_until",))
+    if contracts:
+        mark_companies_dashboard_summaries_changed({contract.company_id for contract in contracts})
+    # the other contracts have no event reached since their last count
+    MaintenanceContract._base_manager.filter(counted_until__lt=now_date).update(counted_until=now_date)
+    return contracts
@@ -1,6 +1,6 @@
 from maintenance.models.contract import MaintenanceContract
-from toolkit.email import is_credited_hours_min_exceeded
-from toolkit.email import send_email_alert
+from toolkit.email import EMAIL_ALERTS_BATCH_SIZE
+from toolkit.email import send_email_alerts
 
 from django.core.management.base import BaseCommand
 from django.utils.translation import gettext as _
@@ -13,8 +13,23 @@ class Command(BaseCommand):
            * if yes, send an alert email to the client"""
     )
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=EMAIL_ALERTS_BATCH_SIZE,
+            help=_("Number of emails sent at once"),
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help=_("Seconds to wait between two batches of emails"),
+        )
+
     def handle(self, *args, **options):
-        contracts = MaintenanceContract.objects.all()
-        for contract in contracts:
-            if contract.recipient and contract.credited_hours_min and is_credited_hours_min_exceeded(contract):
-                send_email_alert(contract)
+        send_email_alerts(
+            MaintenanceContract.objects.filter_email_alerts(),
+            batch_size=options["batch_size"],
+            interval=options["interval"],
+        )
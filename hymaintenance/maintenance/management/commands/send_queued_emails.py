@@ -0,0 +1,38 @@
+import time
+
+from toolkit.email import EMAIL_ALERTS_BATCH_SIZE
+from toolkit.email import send_queued_emails
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext as _
+
+
+class Command(BaseCommand):
+    help = _(
+        """This command sends the queued emails:
+           * the emails which cannot be sent are tried again later
+           * with --loop, it waits for the next emails instead of stopping"""
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=EMAIL_ALERTS_BATCH_SIZE,
+            help=_("Number of emails sent through one connection"),
+        )
+        parser.add_argument(
+            "--loop",
+            type=float,
+            metavar="SECONDS",
+            help=_("Seconds to wait before looking for new emails, once all the queued emails are sent"),
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # a full batch means that more emails may be waiting
+            while send_queued_emails(options["batch_size"]) >= options["batch_size"]:
+                pass
+            if options["loop"] is None:
+                break
+            time.sleep(options["loop"])
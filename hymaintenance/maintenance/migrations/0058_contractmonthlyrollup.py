@@ -0,0 +1,42 @@
+# Generated by Django 3.2.13 on 2026-10-18 09:51
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0057_maintenancecontract_has_reset_recurrence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContractMonthlyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Month')),
+                ('consumed_minutes', models.PositiveIntegerField(default=0, verbose_name='Consumed minutes')),
+                ('credited_hours', models.PositiveIntegerField(default=0, verbose_name='Credited hours')),
+                ('event_count', models.PositiveIntegerField(default=0, verbose_name='Events number')),
+                (
+                    'contract',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='monthly_rollups',
+                        to='maintenance.maintenancecontract',
+                        verbose_name='Contract',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'Contract monthly rollup',
+                'verbose_name_plural': 'Contracts monthly rollups',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='contractmonthlyrollup',
+            constraint=models.UniqueConstraint(fields=('contract', 'month'), name='unique_contract_month_rollup'),
+        ),
+    ]
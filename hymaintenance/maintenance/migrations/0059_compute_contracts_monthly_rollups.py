@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+
+def do_nothing(apps, schema_editor):
+    pass
+
+
+def compute_contracts_monthly_rollups(apps, schema_editor):
+    MaintenanceIssue = apps.get_model("maintenance", "MaintenanceIssue")
+    MaintenanceCredit = apps.get_model("maintenance", "MaintenanceCredit")
+    ContractMonthlyRollup = apps.get_model("maintenance", "ContractMonthlyRollup")
+
+    rollups = {}
+    for events, value_field, rollup_field in (
+        (MaintenanceIssue.objects.filter(is_deleted=False), "number_minutes", "consumed_minutes"),
+        (MaintenanceCredit.objects.all(), "hours_number", "credited_hours"),
+    ):
+        months = (
+            events.annotate(month=TruncMonth("date"))
+            .order_by()
+            .values("contract_id", "month")
+            .annotate(value=Sum(value_field), count=Count("id"))
+        )
+        for month in months:
+            key = (month["contract_id"], month["month"])
+            if key not in rollups:
+                rollups[key] = ContractMonthlyRollup(contract_id=key[0], month=key[1])
+            setattr(rollups[key], rollup_field, month["value"] or 0)
+            rollups[key].event_count += month["count"]
+
+    ContractMonthlyRollup.objects.bulk_create(rollups.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("maintenance", "0058_contractmonthlyrollup")]
+
+    operations = [migrations.RunPython(compute_contracts_monthly_rollups, do_nothing)]
@@ -0,0 +1,86 @@
+from django.db import migrations
+
+
+# The search index is not a field of the issues, it is kept up to date by the database at each write, including the
+# issues created in bulk. See MaintenanceIssueManager.search.
+POSTGRESQL_CREATE_SEARCH_INDEX = [
+    "ALTER TABLE maintenance_maintenanceissue ADD COLUMN search_vector tsvector",
+    """UPDATE maintenance_maintenanceissue SET search_vector = to_tsvector(
+        'pg_catalog.simple', coalesce(subject, '') || ' ' || coalesce(description, '') || ' ' || coalesce(answer, '')
+    )""",
+    """CREATE INDEX maintenance_issue_search_vector_gin
+        ON maintenance_maintenanceissue USING gin(search_vector)""",
+    """CREATE TRIGGER maintenance_issue_search_vector_update
+        BEFORE INSERT OR UPDATE OF subject, description, answer ON maintenance_maintenanceissue
+        FOR EACH ROW EXECUTE PROCEDURE
+        tsvector_update_trigger(search_vector, 'pg_catalog.simple', subject, description, answer)""",
+]
+
+POSTGRESQL_DROP_SEARCH_INDEX = [
+    "DROP TRIGGER maintenance_issue_search_vector_update ON maintenance_maintenanceissue",
+    "DROP INDEX maintenance_issue_search_vector_gin",
+    "ALTER TABLE maintenance_maintenanceissue DROP COLUMN search_vector",
+]
+
+# external content table: only the index is stored, the texts are read from the issues table
+# the triggers are lost if the issues table is rebuilt by a later migration on SQLite, they have to be created again
+SQLITE_CREATE_SEARCH_INDEX = [
+    """CREATE VIRTUAL TABLE maintenance_maintenanceissue_search USING fts5(
+        subject, description, answer, content='maintenance_maintenanceissue', content_rowid='id', prefix='2 3 4'
+    )""",
+    """CREATE TRIGGER maintenance_issue_search_insert AFTER INSERT ON maintenance_maintenanceissue BEGIN
+        INSERT INTO maintenance_maintenanceissue_search(rowid, subject, description, answer)
+        VALUES (new.id, new.subject, new.description, new.answer);
+    END""",
+    """CREATE TRIGGER maintenance_issue_search_delete AFTER DELETE ON maintenance_maintenanceissue BEGIN
+        INSERT INTO maintenance_maintenanceissue_search(
+            maintenance_maintenanceissue_search, rowid, subject, description, answer
+        )
+        VALUES ('delete', old.id, old.subject, old.description, old.answer);
+    END""",
+    """CREATE TRIGGER maintenance_issue_search_update
+        AFTER UPDATE OF subject, description, answer ON maintenance_maintenanceissue BEGIN
+        INSERT INTO maintenance_maintenanceissue_search(
+            maintenance_maintenanceissue_search, rowid, subject, description, answer
+        )
+        VALUES ('delete', old.id, old.subject, old.description, old.answer);
+        INSERT INTO maintenance_maintenanceissue_search(rowid, subject, description, answer)
+        VALUES (new.id, new.subject, new.description, new.answer);
+    END""",
+    "INSERT INTO maintenance_maintenanceissue_search(maintenance_maintenanceissue_search) VALUES ('rebuild')",
+]
+
+SQLITE_DROP_SEARCH_INDEX = [
+    "DROP TRIGGER maintenance_issue_search_update",
+    "DROP TRIGGER maintenance_issue_search_delete",
+    "DROP TRIGGER maintenance_issue_search_insert",
+    "DROP TABLE maintenance_maintenanceissue_search",
+]
+
+VENDORS_STATEMENTS = {
+    "postgresql": (POSTGRESQL_CREATE_SEARCH_INDEX, POSTGRESQL_DROP_SEARCH_INDEX),
+    "sqlite": (SQLITE_CREATE_SEARCH_INDEX, SQLITE_DROP_SEARCH_INDEX),
+}
+
+
+def execute_statements(schema_editor, index):
+    statements = VENDORS_STATEMENTS.get(schema_editor.connection.vendor)
+    # the other databases search with the LIKE operator
+    if statements is not None:
+        for statement in statements[index]:
+            schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    execute_statements(schema_editor, 0)
+
+
+def drop_search_index(apps, schema_editor):
+    execute_statements(schema_editor, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("maintenance", "0059_compute_contracts_monthly_rollups")]
+
+    operations = [migrations.RunPython(create_search_index, drop_search_index)]
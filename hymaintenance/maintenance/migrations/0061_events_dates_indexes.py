@@ -0,0 +1,34 @@
+# Generated by Django 3.2.13 on 2026-10-18 10:56
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0060_maintenanceissue_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='maintenancecredit',
+            index=models.Index(fields=['contract', 'date'], name='credit_contract_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenancecredit',
+            index=models.Index(fields=['company', 'date'], name='credit_company_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenanceissue',
+            index=models.Index(
+                condition=models.Q(('is_deleted', False)), fields=['contract', 'date'], name='issue_contract_date_idx'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='maintenanceissue',
+            index=models.Index(
+                condition=models.Q(('is_deleted', False)), fields=['company', 'date'], name='issue_company_date_idx'
+            ),
+        ),
+    ]
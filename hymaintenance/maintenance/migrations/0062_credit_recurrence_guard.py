@@ -0,0 +1,35 @@
+# Generated by Django 3.2.13 on 2026-10-18 11:12
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0061_events_dates_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maintenancecredit',
+            name='is_recurrence',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Credit recurrence'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenancecontract',
+            index=models.Index(
+                condition=models.Q(('has_credit_recurrence', True)),
+                fields=['recurrence_next_date'],
+                name='contract_recurrence_next_idx',
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name='maintenancecredit',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('is_recurrence', True)),
+                fields=('contract', 'date'),
+                name='unique_contract_recurrence_credit',
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.13 on 2026-10-18 11:40
+
+import django.utils.timezone
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0062_credit_recurrence_guard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('subject', models.CharField(max_length=500, verbose_name='Subject')),
+                ('body', models.TextField(verbose_name='Body')),
+                ('from_email', models.CharField(max_length=254, verbose_name='Sender')),
+                ('recipients', models.JSONField(default=list, verbose_name='Recipients')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts number')),
+                (
+                    'next_attempt_at',
+                    models.DateTimeField(default=django.utils.timezone.now, verbose_name='Next attempt date'),
+                ),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last error')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Sending date')),
+            ],
+            options={
+                'verbose_name': 'Queued email',
+                'verbose_name_plural': 'Queued emails',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='queuedemail',
+            index=models.Index(
+                condition=models.Q(('sent_at__isnull', True)), fields=['next_attempt_at'], name='queued_email_due_idx'
+            ),
+        ),
+    ]
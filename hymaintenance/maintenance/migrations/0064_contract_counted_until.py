@@ -0,0 +1,19 @@
+# Generated by Django 3.2.13 on 2026-10-18 11:57
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maintenance', '0063_queuedemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maintenancecontract',
+            name='counted_until',
+            field=models.DateField(blank=True, null=True, verbose_name='Counters date'),
+        ),
+    ]
@@ -6,6 +6,8 @@ from .credit import MaintenanceCredit
 from .issue import MaintenanceIssue
 from .other_models import IncomingChannel
 from .other_models import MaintenanceType
+from .outbox import QueuedEmail
+from .rollup import ContractMonthlyRollup
 
 
 __all__ = [
@@ -15,4 +17,6 @@ __all__ = [
     "MaintenanceConsumer",
     "MaintenanceCredit",
     "MaintenanceIssue",
+    "ContractMonthlyRollup",
+    "QueuedEmail",
 ]
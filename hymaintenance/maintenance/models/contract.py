@@ -1,22 +1,40 @@
 from calendar import monthrange
+from datetime import date as datetime_date
+from functools import lru_cache
 
 from customers.models import Company
 
 from django.db import models
 from django.db.models import Case
-from django.db.models import CharField
+from django.db.models import Exists
 from django.db.models import F
+from django.db.models import IntegerField
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models import Subquery
+from django.db.models import Sum
 from django.db.models import Value
 from django.db.models import When
 from django.db.models.functions import Coalesce
+from django.db.models.functions import Greatest
+from django.db.models.functions import TruncMonth
 from django.utils.timezone import datetime
 from django.utils.timezone import now
 from django.utils.translation import pgettext_lazy
 from django.utils.translation import ugettext_lazy as _
 
+from .counters import ARRIVED_PERIOD
+from .counters import CURRENT_PERIOD
+from .counters import FUTURE_PERIOD
+from .counters import PRE_RESET_PERIOD
+from .counters import discard_deferred_counters_updates
 from .credit import MaintenanceCredit
 from .issue import MaintenanceIssue
 from .other_models import MaintenanceType
+from .other_models import get_css_class
+from .rollup import ContractMonthlyRollup
+from .rollup import get_months_bounds
+from .rollup import iter_months
 
 
 AVAILABLE_TOTAL_TIME = 0
@@ -25,39 +43,101 @@ CONSUMMED_TOTAL_TIME = 1
 MONTHLY = 0
 ANNUAL = 1
 
+COUNTERS_FIELDS = ("consumed_minutes", "credited_hours")
+# fields changing which events are counted and how, any modification requires to compute the counters again
+COUNTERS_SETTINGS_FIELDS = ("reset_date", "total_type")
+# number of occurrences of the projected schedule of a credit recurrence
+RECURRENCE_SCHEDULE_LENGTH = 12
+# fields advanced by each occurrence of a credit recurrence
+RECURRENCE_FIELDS = ("recurrence_last_date", "recurrence_next_date", "reset_date")
+# sums of the issues and credits before and after the reset date, from which the counters are computed
+COUNTERS_SUMS = ("current_consumed_minutes", "current_credited_hours", "old_consumed_minutes", "old_credited_hours")
+
+
+def get_event_sum_subquery(model, value_field, condition, **kwargs):
+    events = (
+        model._base_manager.filter(contract=OuterRef("pk"), **kwargs)
+        .order_by()
+        .values("contract")
+        .annotate(total=Sum(Case(When(condition, then=value_field), default=0, output_field=IntegerField())))
+        .values("total")
+    )
+    return Coalesce(Subquery(events, output_field=IntegerField()), 0)
+
+
+def get_counters_sums_annotations(today=None, reset_date=OuterRef("reset_date")):
+    if today is None:
+        today = now().date()
+    # without reset date, no event is before it and all the past ones are current
+    old = Q(date__lt=reset_date)
+    current = Q(date__lte=today, date__gte=Coalesce(reset_date, Value(datetime_date.min)))
+    if reset_date is None:
+        old = Q(pk__in=[])
+        current = Q(date__lte=today)
+    return {
+        "current_consumed_minutes": get_event_sum_subquery(
+            MaintenanceIssue, "number_minutes", current, is_deleted=False
+        ),
+        "current_credited_hours": get_event_sum_subquery(MaintenanceCredit, "hours_number", current),
+        "old_consumed_minutes": get_event_sum_subquery(MaintenanceIssue, "number_minutes", old, is_deleted=False),
+        "old_credited_hours": get_event_sum_subquery(MaintenanceCredit, "hours_number", old),
+    }
+
 
 class MaintenanceContractManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset()\
             .select_related("maintenance_type") \
-            .annotate(
-                displayed_counter_name=Coalesce(
-                    Case(
-                        When(counter_name__exact='', then=None),
-                        When(counter_name__isnull=False, then='counter_name'),
-                        default=None,
-                        output_field=CharField()
-                    ),
-                    "maintenance_type__name"
-                ),
-                css_class=Case(
-                    When(maintenance_type__id__exact=1, then=Value("type-maintenance", CharField())),
-                    When(maintenance_type__id__exact=2, then=Value("type-support", CharField())),
-                    When(maintenance_type__id__exact=3, then=Value("type-correction", CharField())),
-                    default=Value("type-maintenance", CharField()),
-                    output_field=CharField()
-                ),) \
             .order_by(F("maintenance_type__id").asc())
 
     def filter_enabled(self, **kwargs):
         return self.get_queryset().filter(disabled=False, **kwargs)
 
+    def with_counters_sums(self, today=None, **kwargs):
+        # one statement for any number of contracts, see MaintenanceContract.compute_and_set_counters
+        return self.get_queryset().filter(**kwargs).annotate(**get_counters_sums_annotations(today))
+
+    def filter_arrived_events(self, today, **kwargs):
+        """Returns the contracts with issues or credits dated after their counters date and reached at today.
+
+        These events were in the future when saved, so they are not counted yet, see update_contracts_counters.
+        """
+        arrived = Q(date__gt=OuterRef("counted_until"), date__lte=today)
+        return self.get_queryset().filter(
+            Q(counted_until__isnull=True)
+            | Exists(MaintenanceIssue._base_manager.filter(arrived, contract=OuterRef("pk"), is_deleted=False))
+            | Exists(MaintenanceCredit._base_manager.filter(arrived, contract=OuterRef("pk"))),
+            **kwargs,
+        )
+
     def filter_enabled_and_visible(self, **kwargs):
         return self.get_queryset().filter(disabled=False, visible=True, **kwargs)
 
     def filter_enabled_and_available_counter(self, **kwargs):
         return self.get_queryset().filter(disabled=False, total_type=AVAILABLE_TOTAL_TIME, **kwargs)
 
+    def filter_email_alerts(self, **kwargs):
+        """Returns the contracts whose remaining time reached the threshold of their email alert.
+
+        The remaining time is computed from the counters, see is_credited_hours_min_exceeded.
+        """
+        return (
+            self.get_queryset()
+            .filter(email_alert=True, recipient__isnull=False, total_type=AVAILABLE_TOTAL_TIME, **kwargs)
+            .exclude(credited_hours_min=0)
+            .alias(remaining_minutes=Coalesce(F("credited_hours"), 0) * 60 - F("consumed_minutes"))
+            .filter(remaining_minutes__lte=F("credited_hours_min") * 60)
+            .select_related("recipient", "company__contact")
+        )
+
+    def filter_due_credit_recurrences(self, today, **kwargs):
+        return self.get_queryset().filter(
+            has_credit_recurrence=True,
+            credit_recurrence__in=(MONTHLY, ANNUAL),
+            recurrence_next_date__lte=today,
+            **kwargs,
+        )
+
 
 class MaintenanceContract(models.Model):
     TYPE_CHOICES = (
@@ -95,6 +175,8 @@ class MaintenanceContract(models.Model):
 
     credited_hours = models.PositiveIntegerField(_("Credited hours"), null=True, blank=True)
     consumed_minutes = models.PositiveIntegerField(_("Credited hours"), default=0)
+    # the counters include the events dated until this date, the later ones are counted once reached
+    counted_until = models.DateField(_("Counters date"), null=True, blank=True)
 
     email_alert = models.BooleanField(_("Email alert"), default=False)
     credited_hours_min = models.IntegerField(_("Credited hours Threshold"), default=0)
@@ -109,6 +191,25 @@ class MaintenanceContract(models.Model):
 
     objects = MaintenanceContractManager()
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["recurrence_next_date"],
+                name="contract_recurrence_next_idx",
+                condition=Q(has_credit_recurrence=True),
+            )
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            field: value
+            for field, value in zip(field_names, values)
+            if field in COUNTERS_FIELDS + COUNTERS_SETTINGS_FIELDS
+        }
+        return instance
+
     def __str__(self):
         return "%s , %s" % (self.company, self.maintenance_type)
 
@@ -152,24 +253,30 @@ class MaintenanceContract(models.Model):
         else:
             return MaintenanceCredit.objects.none()
 
-    def get_delta_credits_minutes(self):
-        if self.reset_date:
-            consumed_min_sum = self.get_old_issues().aggregate(models.Sum("number_minutes"))
-            consumed_min_sum = consumed_min_sum["number_minutes__sum"]
-            if consumed_min_sum is None:
-                consumed_min_sum = 0
-
-            credit_hours_sum = self.get_old_credits().aggregate(models.Sum("hours_number"))
-            credit_hours_sum = credit_hours_sum["hours_number__sum"]
-            if credit_hours_sum is None:
-                credit_hours_sum = 0
-
-            return credit_hours_sum * 60 - consumed_min_sum
-        else:
-            return 0
+    def get_counters_sums(self, today=None):
+        if self.id is None:
+            return dict.fromkeys(COUNTERS_SUMS, 0)
+        # the reset date of the instance, it can be modified and not saved yet
+        reset_date = self._meta.get_field("reset_date").to_python(self.reset_date)
+        return (
+            MaintenanceContract._base_manager.filter(id=self.id)
+            .annotate(**get_counters_sums_annotations(today, reset_date))
+            .values(*COUNTERS_SUMS)
+            .get()
+        )
+
+    def get_delta_credits_minutes(self, sums=None):
+        if sums is None:
+            sums = self.get_counters_sums()
+        return sums["old_credited_hours"] * 60 - sums["old_consumed_minutes"]
 
     def get_counter_name(self):
-        return self.counter_name if self.counter_name != "" else self.maintenance_type.name
+        # the maintenance type is selected by the manager
+        return self.counter_name or self.maintenance_type.name
+
+    @property
+    def css_class(self):
+        return get_css_class(self.maintenance_type_id)
 
     def get_number_contract_hours(self) -> int:
         return self.credited_hours
@@ -190,55 +297,129 @@ class MaintenanceContract(models.Model):
     def get_number_remaining_hours(self) -> float:
         return self.get_number_remaining_minutes() / 60
 
+    def get_events_sums_by_month(self, model, start, end):
+        # a range of dates instead of the month and year of the date, so the index of the dates is used
+        date_field = model._meta.get_field("date")
+        start_month, end_month = get_months_bounds(date_field.to_python(start), date_field.to_python(end))
+        sums = dict.fromkeys(iter_months(start_month, end_month), 0)
+        months = (
+            model._base_manager.filter(
+                company=self.company_id,
+                contract=self,
+                date__gte=start_month,
+                date__lt=end_month,
+                **model.CONDITION_FIELDS,
+            )
+            .annotate(month=TruncMonth("date"))
+            .order_by()
+            .values("month")
+            .annotate(value=Sum(model.VALUE_FIELD))
+        )
+        for month in months:
+            sums[month["month"]] = month["value"] or 0
+        return sums
+
+    def get_number_consumed_minutes_by_month(self, start: datetime.date, end: datetime.date) -> dict:
+        """Returns the consumed minutes of each month from the month of start to the month of end, included."""
+        return self.get_events_sums_by_month(MaintenanceIssue, start, end)
+
+    def get_number_credited_hours_by_month(self, start: datetime.date, end: datetime.date) -> dict:
+        """Returns the credited hours of each month from the month of start to the month of end, included."""
+        return self.get_events_sums_by_month(MaintenanceCredit, start, end)
+
     def get_number_consumed_minutes_in_month(self, date: datetime.date) -> int:
-        consumed = MaintenanceIssue.objects.filter(
-            company=self.company, date__month=date.month, date__year=date.year, contract=self, is_deleted=False
-        ).aggregate(models.Sum("number_minutes"))
-        consumed = consumed["number_minutes__sum"]
-        return consumed if consumed is not None else 0
+        return sum(self.get_number_consumed_minutes_by_month(date, date).values())
 
     def get_number_consumed_hours_in_month(self, date: datetime.date) -> float:
         return self.get_number_consumed_minutes_in_month(date) / 60
 
     def get_number_credited_hours_in_month(self, date: datetime.date) -> int:
-        credited = MaintenanceCredit.objects.filter(
-            company=self.company, date__month=date.month, date__year=date.year, contract=self
-        ).aggregate(models.Sum("hours_number"))
-        credited = credited["hours_number__sum"]
-        if credited is None:
-            credited = 0
-        return credited
-
-    def compute_and_set_consumed_minutes(self):
-        minutes_sum = self.get_current_issues().aggregate(models.Sum("number_minutes"))
-        minutes_sum = minutes_sum["number_minutes__sum"]
-        if minutes_sum is None:
-            minutes_sum = 0
+        return sum(self.get_number_credited_hours_by_month(date, date).values())
+
+    def compute_and_set_consumed_minutes(self, sums=None):
+        if sums is None:
+            sums = self.get_counters_sums()
+        minutes_sum = sums["current_consumed_minutes"]
         if self.is_available_time_counter():
-            delta_time = self.get_delta_credits_minutes()
+            delta_time = self.get_delta_credits_minutes(sums)
             if delta_time < 0:
                 minutes_sum = minutes_sum - delta_time
         self.consumed_minutes = minutes_sum
 
-    def compute_and_set_credited_hours(self):
-        hours_sum = self.get_current_credits().aggregate(models.Sum("hours_number"))
-        hours_sum = hours_sum["hours_number__sum"]
-        if hours_sum is None:
-            hours_sum = 0
+    def compute_and_set_credited_hours(self, sums=None):
+        if sums is None:
+            sums = self.get_counters_sums()
+        hours_sum = sums["current_credited_hours"]
         if self.is_available_time_counter():
-            delta_time = self.get_delta_credits_minutes()
+            delta_time = self.get_delta_credits_minutes(sums)
             if delta_time > 0:
                 hours_sum = hours_sum + delta_time / 60
         self.credited_hours = hours_sum
 
-    def get_recurrence_next_date(self):
+    def compute_and_set_counters(self, sums=None):
+        """Compute the counters from the sums of the issues and credits, queried once for both.
+
+        Contracts from MaintenanceContract.objects.with_counters_sums() come with their sums,
+        so they are computed without any query.
+        """
+        if sums is None:
+            if all(hasattr(self, name) for name in COUNTERS_SUMS):
+                sums = {name: getattr(self, name) for name in COUNTERS_SUMS}
+            else:
+                sums = self.get_counters_sums()
+        self.compute_and_set_consumed_minutes(sums)
+        self.compute_and_set_credited_hours(sums)
+
+    def get_counted_period(self, date, today=None):
+        if today is None:
+            today = now().date()
+        date = MaintenanceIssue._meta.get_field("date").to_python(date)
+        reset_date = self._meta.get_field("reset_date").to_python(self.reset_date)
+        if reset_date and date < reset_date:
+            return PRE_RESET_PERIOD
+        if date > today:
+            return FUTURE_PERIOD
+        if self.counted_until is None or date > self.counted_until:
+            return ARRIVED_PERIOD
+        return CURRENT_PERIOD
+
+    def update_counters(self, **deltas):
+        MaintenanceContract._base_manager.filter(id=self.id).update(
+            **{field: Greatest(Coalesce(F(field), 0) + delta, 0) for field, delta in deltas.items()}
+        )
+        loaded_values = self.__dict__.setdefault("_loaded_values", {})
+        for field, delta in deltas.items():
+            value = max((getattr(self, field) or 0) + delta, 0)
+            setattr(self, field, value)
+            loaded_values[field] = value
+
+    def refresh_counters(self):
+        today = now().date()
+        self.compute_and_set_counters(self.get_counters_sums(today))
+        self.counted_until = today
+        self.save(update_fields=COUNTERS_FIELDS + ("counted_until",))
+
+    def _has_changed(self, fields):
+        loaded_values = self.__dict__.get("_loaded_values", {})
+        return any(field not in loaded_values or loaded_values[field] != getattr(self, field) for field in fields)
+
+    def get_recurrence_next_date(self, date=None):
+        if date is None:
+            date = self.recurrence_next_date
         if self.has_monthly_credit_recurrence():
-            return get_next_month_date(self.recurrence_start_date, self.recurrence_next_date)
+            return get_next_month_date(self.recurrence_start_date, date)
         elif self.has_annual_credit_recurrence():
-            return get_next_year_date(self.recurrence_start_date, self.recurrence_next_date)
+            return get_next_year_date(self.recurrence_start_date, date)
         else:
             return None
 
+    def iter_recurrence_dates(self, until):
+        """Yields the dates of the credit occurrences from the next one to until, included."""
+        date = self.recurrence_next_date
+        while date is not None and date <= until:
+            yield date
+            date = self.get_recurrence_next_date(date)
+
     def remove_recurrence(self):
         self.has_credit_recurrence = False
         self.save()
@@ -255,16 +436,63 @@ class MaintenanceContract(models.Model):
         self.set_recurrence_dates_and_create_all_old_credit_occurrences()
         self.save()
 
-    def create_credit_occurrence(self, date=None):
-        hours_number = self.hours_to_credit
-        if hours_number is not None and hours_number > 0 and date is not None:
-            MaintenanceCredit.objects.create(
-                contract=self,
-                company=self.company,
-                date=date,
-                hours_number=hours_number,
-                subject=_("{}'s credit recurrence".format(date.strftime("%B"))),
+    def get_recurrence_schedule(self, occurrences_number=RECURRENCE_SCHEDULE_LENGTH):
+        """Returns the next occurrences of the credit recurrence, with the counters projected after each of them.
+
+        No issue is expected meanwhile, and the credits of the occurrences are not created.
+        """
+        if not self.has_credit_recurrence or self.recurrence_next_date is None or self.credit_recurrence is None:
+            return []
+        credited_minutes = (self.credited_hours or 0) * 60
+        consumed_minutes = self.consumed_minutes
+        credit_minutes = (self.hours_to_credit or 0) * 60
+        schedule = []
+        for date in get_recurrence_dates(
+            self.credit_recurrence,
+            self.recurrence_start_date or self.recurrence_next_date,
+            self.recurrence_next_date,
+            occurrences_number,
+        ):
+            if self.has_reset_recurrence and self.is_available_time_counter():
+                # the remaining time before the reset is carried over, see compute_and_set_counters
+                remaining_minutes = credited_minutes - consumed_minutes
+                credited_minutes = credit_minutes + max(remaining_minutes, 0)
+                consumed_minutes = max(-remaining_minutes, 0)
+            elif self.has_reset_recurrence:
+                # only the events after the reset are counted
+                credited_minutes = credit_minutes
+                consumed_minutes = 0
+            else:
+                credited_minutes += credit_minutes
+            schedule.append(
+                {
+                    "date": date,
+                    "credited_hours": credited_minutes / 60,
+                    "remaining_hours": (credited_minutes - consumed_minutes) / 60,
+                }
             )
+        return schedule
+
+    def build_credit_occurrence(self, date):
+        """Returns the credit of the occurrence of the date, not saved, or None if there are no hours to credit."""
+        hours_number = self.hours_to_credit
+        if hours_number is None or hours_number <= 0:
+            return None
+        return MaintenanceCredit(
+            contract=self,
+            company_id=self.company_id,
+            date=date,
+            hours_number=hours_number,
+            subject=_("{}'s credit recurrence".format(date.strftime("%B"))),
+            is_recurrence=True,
+        )
+
+    def create_credit_occurrence(self, date=None):
+        if date is None:
+            return
+        credit = self.build_credit_occurrence(date)
+        if credit is not None and not self.maintenancecredit_set.filter(date=date, is_recurrence=True).exists():
+            credit.save()
 
     def apply_recurrence_at(self, date=None):
         if date is None:
@@ -274,29 +502,71 @@ class MaintenanceContract(models.Model):
         self.recurrence_next_date = self.get_recurrence_next_date()
         if self.has_reset_recurrence:
             self.reset_date = self.recurrence_last_date
-            self.compute_and_set_consumed_minutes()
-            self.compute_and_set_credited_hours()
+            self.compute_and_set_counters(self.get_counters_sums())
 
     def set_recurrence_dates_and_create_all_old_credit_occurrences(self, now_date=None):
+        """Creates at once the credits of the occurrences between the start date of the recurrence and now_date.
+
+        The counters are computed once all the credits are created, the contract has to be saved afterwards.
+        """
         if now_date is None:
             now_date = now().date()
-        old_contract = MaintenanceContract.objects.get(id=self.id)
-        if self.has_credit_recurrence and (
-            self.recurrence_next_date is None or self.recurrence_start_date != old_contract.recurrence_start_date
+        old_start_date = (
+            MaintenanceContract._base_manager.filter(id=self.id).values_list("recurrence_start_date", flat=True).get()
+        )
+        if not self.has_credit_recurrence or (
+            self.recurrence_next_date is not None and self.recurrence_start_date == old_start_date
         ):
-            self.recurrence_next_date = self.recurrence_start_date
-            while self.recurrence_next_date <= now_date:
-                self.apply_recurrence_at(self.recurrence_next_date)
+            return
+        self.recurrence_next_date = self.recurrence_start_date
+        dates = list(self.iter_recurrence_dates(now_date))
+        if not dates:
+            return
+
+        credits = [credit for credit in map(self.build_credit_occurrence, dates) if credit is not None]
+        MaintenanceCredit.objects.bulk_create(credits, ignore_conflicts=True)
+        self.recurrence_last_date = dates[-1]
+        self.recurrence_next_date = self.get_recurrence_next_date(dates[-1])
+        if self.has_reset_recurrence:
+            self.reset_date = self.recurrence_last_date
+        # the credits are created without the signals updating the counters and the rollups of the contract,
+        # the counters are computed by save when the reset date is modified
+        if not self._has_changed(COUNTERS_SETTINGS_FIELDS):
+            self.compute_and_set_counters(self.get_counters_sums())
+        ContractMonthlyRollup.objects.rebuild([self.id])
 
     def save(self, *args, **kwargs):
-        if self.id is not None:
-            self.compute_and_set_consumed_minutes()
-            self.compute_and_set_credited_hours()
+        update_fields = kwargs.get("update_fields")
+        if self._state.adding:
+            # a new contract has no issue nor credit yet, they will update the counters when created
+            self.consumed_minutes = 0
+            self.credited_hours = 0
+            self.counted_until = now().date()
+        elif update_fields is None:
+            if self._has_changed(COUNTERS_SETTINGS_FIELDS):
+                self.compute_and_set_counters(self.get_counters_sums())
+            elif not self._has_changed(COUNTERS_FIELDS):
+                # counters are kept up to date in the database by the issues and credits,
+                # do not overwrite them with the values of this instance
+                update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in COUNTERS_FIELDS
+                ]
+                kwargs["update_fields"] = update_fields
+        if update_fields is None or any(field in update_fields for field in COUNTERS_FIELDS):
+            # the written counters already include the events saved before in a deferred block
+            discard_deferred_counters_updates(self.id)
         super().save(*args, **kwargs)
 
+        loaded_values = self.__dict__.setdefault("_loaded_values", {})
+        for field in COUNTERS_FIELDS + COUNTERS_SETTINGS_FIELDS:
+            if update_fields is None or field in update_fields:
+                loaded_values[field] = getattr(self, field)
+
 
 def get_next_month_date(start_date, old_date):
-    next_month = (old_date.month + 1) % 12
+    next_month = old_date.month % 12 + 1
     next_year = old_date.year
     if next_month == 1:
         next_year = old_date.year + 1
@@ -314,6 +584,20 @@ def get_next_year_date(start_date, old_date):
     return datetime(day=next_day, month=old_date.month, year=next_year).date()
 
 
+@lru_cache(maxsize=1024)
+def get_recurrence_dates(credit_recurrence, start_date, next_date, occurrences_number):
+    """Returns the dates of the next occurrences of a recurrence, from its next date.
+
+    They only depend on the recurrence fields of the contracts, so they are kept until one of them is modified.
+    """
+    get_next_date = get_next_month_date if credit_recurrence == MONTHLY else get_next_year_date
+    dates = []
+    while len(dates) < occurrences_number:
+        dates.append(next_date)
+        next_date = get_next_date(start_date, next_date)
+    return tuple(dates)
+
+
 def is_valid_date(day, month, year):
     valid_date = True
     try:
@@ -0,0 +1,192 @@
+import threading
+from collections import defaultdict
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .rollup import ContractMonthlyRollup
+from .rollup import get_month
+
+
+CURRENT_PERIOD = "current"
+PRE_RESET_PERIOD = "pre_reset"
+FUTURE_PERIOD = "future"
+# reached since the last count of the contract: counted if saved since, not if saved while in the future
+ARRIVED_PERIOD = "arrived"
+
+# What an event adds to the counters of its contract: None when it is not counted at all (archived issue)
+CountedState = namedtuple("CountedState", ("contract_id", "date", "value"))
+
+# The event was loaded with deferred fields, so what is stored in the database is unknown
+UNKNOWN_STATE = object()
+
+_deferred = threading.local()
+
+
+class CountedEventMixin:
+    """Keeps track of the part of an issue/credit which is counted by its contract.
+
+    The state loaded from the database is compared to the saved one to update the contract counters
+    with deltas instead of aggregating again the whole contract history.
+    """
+
+    COUNTER_FIELD = None
+    VALUE_FIELD = None
+    CONDITION_FIELDS = {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted_state = instance._build_counted_state(dict(zip(field_names, values)))
+        return instance
+
+    def _build_counted_state(self, values):
+        state_fields = ("contract_id", "date", self.VALUE_FIELD, *self.CONDITION_FIELDS)
+        if any(field not in values for field in state_fields):
+            return UNKNOWN_STATE
+        if any(values[field] != value for field, value in self.CONDITION_FIELDS.items()):
+            return None
+        return CountedState(
+            values["contract_id"], self._meta.get_field("date").to_python(values["date"]), values[self.VALUE_FIELD] or 0
+        )
+
+    def get_counted_state(self):
+        return self._build_counted_state(self.__dict__)
+
+    def get_stored_counted_state(self, created=False):
+        if created:
+            return None
+        return self.__dict__.get("_counted_state", UNKNOWN_STATE)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and self.get_stored_counted_state() is UNKNOWN_STATE:
+            # the contract may be modified by this save, the stored one has to be counted again too
+            self._stored_contract_id = (
+                type(self)._base_manager.filter(pk=self.pk).values_list("contract", flat=True).first()
+            )
+        super().save(*args, **kwargs)
+
+    def update_contracts_counters(self, old_state, new_state):
+        # two unknown states may differ
+        if old_state is UNKNOWN_STATE or old_state != new_state:
+            update_contracts_counters(self, old_state, new_state)
+        self._counted_state = new_state
+
+
+class ContractsCountersUpdates:
+    """Counters modifications of the contracts touched by one or several events."""
+
+    def __init__(self):
+        self.contracts = {}
+        self.deltas = defaultdict(lambda: defaultdict(int))
+        self.contracts_to_refresh = set()
+        # the monthly rollups do not depend on the counters settings of the contracts, they are kept apart
+        self.rollups_deltas = defaultdict(lambda: defaultdict(int))
+        self.rollups_to_rebuild = set()
+
+    def add_delta(self, contract, field, delta):
+        self.contracts.setdefault(contract.id, contract)
+        self.deltas[contract.id][field] += delta
+
+    def add_refresh(self, contract):
+        self.contracts.setdefault(contract.id, contract)
+        self.contracts_to_refresh.add(contract.id)
+
+    def add_rollup_delta(self, contract_id, date, field, sign, value):
+        rollup_deltas = self.rollups_deltas[(contract_id, get_month(date))]
+        rollup_deltas[field] += sign * value
+        rollup_deltas["event_count"] += sign
+
+    def add_rollups_rebuild(self, contract_id):
+        self.rollups_to_rebuild.add(contract_id)
+
+    def discard(self, contract_id):
+        self.contracts.pop(contract_id, None)
+        self.deltas.pop(contract_id, None)
+        self.contracts_to_refresh.discard(contract_id)
+
+    def apply(self):
+        for contract_id, contract in self.contracts.items():
+            if contract_id in self.contracts_to_refresh:
+                contract.refresh_counters()
+                continue
+            deltas = {field: delta for field, delta in self.deltas[contract_id].items() if delta}
+            if deltas:
+                contract.update_counters(**deltas)
+        self.apply_rollups()
+
+    def apply_rollups(self):
+        for (contract_id, month), deltas in self.rollups_deltas.items():
+            if contract_id not in self.rollups_to_rebuild:
+                ContractMonthlyRollup.objects.add_deltas(contract_id, month, **deltas)
+        if self.rollups_to_rebuild:
+            ContractMonthlyRollup.objects.rebuild(self.rollups_to_rebuild)
+
+
+def get_deferred_counters_updates():
+    return getattr(_deferred, "updates", None)
+
+
+@contextmanager
+def defer_contracts_counters_updates():
+    """Groups the counters updates of all the events saved in the block, in one transaction.
+
+    Each touched contract is updated once when leaving the outermost block, inside its transaction
+    so the counters are committed with the events.
+    """
+    if get_deferred_counters_updates() is not None:
+        yield
+        return
+
+    updates = _deferred.updates = ContractsCountersUpdates()
+    try:
+        with transaction.atomic():
+            yield
+            _deferred.updates = None
+            updates.apply()
+    finally:
+        _deferred.updates = None
+
+
+def discard_deferred_counters_updates(contract_id):
+    updates = get_deferred_counters_updates()
+    if updates is not None:
+        updates.discard(contract_id)
+
+
+def update_contracts_counters(event, old_state, new_state):
+    from .contract import MaintenanceContract
+
+    deferred_updates = get_deferred_counters_updates()
+    updates = deferred_updates if deferred_updates is not None else ContractsCountersUpdates()
+
+    if old_state is UNKNOWN_STATE or new_state is UNKNOWN_STATE:
+        updates.add_refresh(event.contract)
+        updates.add_rollups_rebuild(event.contract_id)
+        stored_contract_id = event.__dict__.pop("_stored_contract_id", None)
+        if stored_contract_id is not None and stored_contract_id != event.contract_id:
+            updates.add_refresh(MaintenanceContract.objects.get(id=stored_contract_id))
+            updates.add_rollups_rebuild(stored_contract_id)
+    else:
+        contracts = {event.contract_id: event.contract}
+        for sign, state in ((-1, old_state), (1, new_state)):
+            if state is None:
+                continue
+            if state.contract_id not in contracts:
+                contracts[state.contract_id] = MaintenanceContract.objects.get(id=state.contract_id)
+            contract = contracts[state.contract_id]
+            updates.add_rollup_delta(contract.id, state.date, event.COUNTER_FIELD, sign, state.value)
+
+            period = contract.get_counted_period(state.date)
+            if period == CURRENT_PERIOD or (period == ARRIVED_PERIOD and sign > 0):
+                updates.add_delta(contract, event.COUNTER_FIELD, sign * state.value)
+            elif period == ARRIVED_PERIOD:
+                # the stored counters may or may not include the previous value, they have to be computed again
+                updates.add_refresh(contract)
+            elif period == PRE_RESET_PERIOD and contract.is_available_time_counter():
+                # the carry-over of an available time counter is not linear, it has to be computed again
+                updates.add_refresh(contract)
+
+    if deferred_updates is None:
+        updates.apply()
@@ -5,6 +5,7 @@ from customers.models import Company
 from django.db import models
 from django.db.models import BooleanField
 from django.db.models import Case
+from django.db.models import Q
 from django.db.models import Value
 from django.db.models import When
 from django.db.models.signals import post_delete
@@ -12,8 +13,8 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
+from .counters import CountedEventMixin
 from .utils import MaintenanceEventManager
-from .utils import get_counter_name
 
 
 class MaintenanceCreditManager(MaintenanceEventManager):
@@ -44,7 +45,10 @@ class MaintenanceCreditManager(MaintenanceEventManager):
         )
 
 
-class MaintenanceCredit(models.Model):
+class MaintenanceCredit(CountedEventMixin, models.Model):
+    COUNTER_FIELD = "credited_hours"
+    VALUE_FIELD = "hours_number"
+
     company = models.ForeignKey(Company, verbose_name=_("Company"), on_delete=models.PROTECT)
     date = models.DateField(_("Effective date"), default=datetime.date.today)
     contract = models.ForeignKey(
@@ -52,9 +56,22 @@ class MaintenanceCredit(models.Model):
     )
     hours_number = models.PositiveIntegerField(_("Quantity"), default=0)
     subject = models.CharField(_("Subject"), null=True, blank=True, max_length=500)
+    is_recurrence = models.BooleanField(_("Credit recurrence"), default=False, editable=False)
 
     objects = MaintenanceCreditManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["contract", "date"], name="credit_contract_date_idx"),
+            models.Index(fields=["company", "date"], name="credit_company_date_idx"),
+        ]
+        # a contract is credited once per occurrence of its recurrence, even when it is applied again
+        constraints = [
+            models.UniqueConstraint(
+                fields=["contract", "date"], condition=Q(is_recurrence=True), name="unique_contract_recurrence_credit"
+            )
+        ]
+
     def __str__(self):
         return "%s, the %s for %s and %s hours" % (
             self.company,
@@ -64,19 +81,18 @@ class MaintenanceCredit(models.Model):
         )
 
     def get_counter_name(self):
-        return get_counter_name(self)
+        # the contract and its maintenance type are selected with the event by its manager
+        return self.contract.get_counter_name()
 
 
 @receiver(post_save, sender=MaintenanceCredit, dispatch_uid="update_credited_hours")
-def update_credited_hours_after_save(sender, instance, **kwargs):
-    instance.contract.compute_and_set_credited_hours()
-    instance.contract.save()
+def update_credited_hours_after_save(sender, instance, created, **kwargs):
+    instance.update_contracts_counters(instance.get_stored_counted_state(created), instance.get_counted_state())
 
 
 @receiver(post_delete, sender=MaintenanceCredit, dispatch_uid="update_credited_hours")
 def update_credited_hours_after_delete(sender, instance, **kwargs):
-    instance.contract.compute_and_set_credited_hours()
-    instance.contract.save()
+    instance.update_contracts_counters(instance.get_stored_counted_state(), None)
 
 
 class MaintenanceCreditChoices(models.Model):
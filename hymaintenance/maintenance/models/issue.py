@@ -1,20 +1,29 @@
 import os
+import re
 
 from customers.models import Company
 from customers.models import MaintenanceUser
 
 from django.core.files.storage import FileSystemStorage
+from django.db import connections
 from django.db import models
 from django.db import transaction
+from django.db.models import BooleanField
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
 from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
 from .consumer import MaintenanceConsumer
+from .counters import CountedEventMixin
 from .other_models import IncomingChannel
 from .utils import MaintenanceEventManager
-from .utils import get_counter_name
+
+
+# the words of a search, without the operators of the full-text search syntaxes
+SEARCH_WORD_RE = re.compile(r"\w+")
 
 
 class MaintenanceIssueManager(MaintenanceEventManager):
@@ -33,6 +42,36 @@ class MaintenanceIssueManager(MaintenanceEventManager):
 
     SPECIFIC_FILTERS = {"is_deleted": False}
 
+    def search(self, text):
+        """Returns the issues whose subject, description or answer contain words starting with all the words of text.
+
+        The full-text index is created by the migration 0060 for PostgreSQL and SQLite.
+        """
+        words = SEARCH_WORD_RE.findall(text)
+        if not words:
+            return self.none()
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        if connection.vendor == "postgresql":
+            condition = RawSQL(
+                "{}.search_vector @@ to_tsquery('pg_catalog.simple', %s)".format(table),
+                [" & ".join("{}:*".format(word) for word in words)],
+                output_field=BooleanField(),
+            )
+        elif connection.vendor == "sqlite":
+            condition = RawSQL(
+                "{}.id IN (SELECT rowid FROM {search_table} WHERE {search_table} MATCH %s)".format(
+                    table, search_table="maintenance_maintenanceissue_search"
+                ),
+                [" ".join('"{}"*'.format(word) for word in words)],
+                output_field=BooleanField(),
+            )
+        else:
+            condition = Q()
+            for word in words:
+                condition &= Q(subject__icontains=word) | Q(description__icontains=word) | Q(answer__icontains=word)
+        return self.get_queryset().filter(condition)
+
 
 class MaintenanceIssueAttachmentStorage(FileSystemStorage):
     def _save(self, name, content):
@@ -56,7 +95,11 @@ def _get_resolution_file_path(instance, filename):
     )
 
 
-class MaintenanceIssue(models.Model):
+class MaintenanceIssue(CountedEventMixin, models.Model):
+    COUNTER_FIELD = "consumed_minutes"
+    VALUE_FIELD = "number_minutes"
+    CONDITION_FIELDS = {"is_deleted": False}
+
     company_issue_number = models.PositiveIntegerField(verbose_name=_("Issue number"))
     company = models.ForeignKey(Company, verbose_name=_("Company"), on_delete=models.PROTECT)
     consumer_who_ask = models.ForeignKey(
@@ -130,6 +173,11 @@ class MaintenanceIssue(models.Model):
         verbose_name = "Issue"
         verbose_name_plural = "Issues"
         unique_together = [["company_issue_number", "company"]]
+        # the counted issues of a contract or a company by date: the history, the counters and the last activity
+        indexes = [
+            models.Index(fields=["contract", "date"], name="issue_contract_date_idx", condition=Q(is_deleted=False)),
+            models.Index(fields=["company", "date"], name="issue_company_date_idx", condition=Q(is_deleted=False)),
+        ]
 
     def __str__(self):
         return _("Date: {date}, Subject: {subject}, For: {company} , Type: {contract} ").format(
@@ -140,7 +188,8 @@ class MaintenanceIssue(models.Model):
         )
 
     def get_counter_name(self):
-        return get_counter_name(self)
+        # the contract and its maintenance type are selected with the event by its manager
+        return self.contract.get_counter_name()
 
     def get_hours(self):
         return self.number_minutes / 60
@@ -154,23 +203,20 @@ class MaintenanceIssue(models.Model):
         self.is_deleted = True
         self.save()
 
-    @transaction.atomic
     def save(self, *args, **kwargs):
-        if self.id is None:
-            Company.objects.filter(id=self.company_id).update(issues_counter=models.F("issues_counter") + 1)
-            self.company_issue_number = (
-                Company.objects.filter(id=self.company_id).values_list("issues_counter", flat=True).first()
-            )
-        super().save(*args, **kwargs)
+        if self.id is None and self.company_issue_number is None:
+            # allocated before the transaction of the issue, not to lock the company until the issue is committed,
+            # the issues created in bulk can be given numbers allocated together
+            self.company_issue_number = Company.objects.allocate_issues_numbers(self.company_id)[0]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 
 @receiver(post_save, sender=MaintenanceIssue, dispatch_uid="update_consumed_minutes")
-def update_consumed_minutes_after_save(sender, instance, **kwargs):
-    instance.contract.compute_and_set_consumed_minutes()
-    instance.contract.save()
+def update_consumed_minutes_after_save(sender, instance, created, **kwargs):
+    instance.update_contracts_counters(instance.get_stored_counted_state(created), instance.get_counted_state())
 
 
 @receiver(post_delete, sender=MaintenanceIssue, dispatch_uid="update_consumed_minutes")
 def update_consumed_minutes_after_delete(sender, instance, **kwargs):
-    instance.contract.compute_and_set_consumed_minutes()
-    instance.contract.save()
+    instance.update_contracts_counters(instance.get_stored_counted_state(), None)
@@ -1,7 +1,22 @@
+from toolkit.cache import ReferenceDataCache
+
 from django.db import models
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
 
+class MaintenanceTypeManager(models.Manager):
+    def get_cached(self):
+        """Returns the list of all the maintenance types ordered by id, without querying them at each request."""
+        return maintenance_types_cache.get()
+
+    def get_cached_names(self):
+        """Returns the names of the cached maintenance types by id."""
+        return {maintenance_type.id: maintenance_type.name for maintenance_type in self.get_cached()}
+
+
 class MaintenanceType(models.Model):
     CSS_CLASSES = ("type-maintenance", "type-support", "type-correction")
     FORM_LABELS = (_("Green counter"), _("Blue counter"), _("Grey counter"))
@@ -9,21 +24,37 @@ class MaintenanceType(models.Model):
     name = models.CharField(_("Name"), max_length=255)
     default_visibility = models.BooleanField(_("Visible to manager"), default=True)
 
+    objects = MaintenanceTypeManager()
+
     class Meta:
         verbose_name = _("Maintenance's Type")
         verbose_name_plural = _("Maintenance's Types")
 
     def css_class(self):
-        return MaintenanceType.CSS_CLASSES[self.id - 1]
+        return get_css_class(self.id)
 
     @property
     def form_label(self):
-        return MaintenanceType.FORM_LABELS[self.id - 1]
+        return MaintenanceType.FORM_LABELS[(self.id - 1) % len(MaintenanceType.FORM_LABELS)]
 
     def __str__(self):
         return "%s" % self.name
 
 
+def get_css_class(maintenance_type_id):
+    # resolved from the id without querying the type, the classes are used again after the third type
+    return MaintenanceType.CSS_CLASSES[(maintenance_type_id - 1) % len(MaintenanceType.CSS_CLASSES)]
+
+
+maintenance_types_cache = ReferenceDataCache("maintenance_types", lambda: list(MaintenanceType.objects.order_by("id")))
+
+
+@receiver(post_save, sender=MaintenanceType, dispatch_uid="maintenance_type_changes_cache")
+@receiver(post_delete, sender=MaintenanceType, dispatch_uid="maintenance_type_deletion_changes_cache")
+def invalidate_maintenance_types_cache(sender, **kwargs):
+    maintenance_types_cache.invalidate_on_commit()
+
+
 class IncomingChannel(models.Model):
     name = models.CharField(_("Name of Incoming Channel"), max_length=255)
 
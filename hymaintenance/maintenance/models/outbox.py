@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+from django.core.mail import EmailMessage
+from django.db import models
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from django.utils.translation import ugettext_lazy as _
+
+
+QUEUED_EMAIL_MAX_ATTEMPTS = 8
+# delay before the second attempt, doubled at each next one
+QUEUED_EMAIL_RETRY_DELAY = timedelta(minutes=1)
+# delay during which the claimed emails are not due for the other workers, they are sent again after it
+# if the worker stopped before recording their delivery
+QUEUED_EMAIL_LEASE = timedelta(minutes=10)
+
+
+class QueuedEmailManager(models.Manager):
+    def enqueue(self, message):
+        return self.create(
+            subject=str(message.subject),
+            body=str(message.body),
+            from_email=message.from_email,
+            recipients=list(message.to),
+        )
+
+    def filter_due(self, at=None):
+        if at is None:
+            at = now()
+        return (
+            self.get_queryset()
+            .filter(sent_at__isnull=True, attempts__lt=QUEUED_EMAIL_MAX_ATTEMPTS, next_attempt_at__lte=at)
+            .order_by("next_attempt_at", "id")
+        )
+
+    def claim_due(self, number, at=None):
+        """Returns the next due emails, postponed by the lease so the other workers do not send them too."""
+        if at is None:
+            at = now()
+        with transaction.atomic():
+            emails = list(self.filter_due(at).select_for_update(skip_locked=True)[:number])
+            self.get_queryset().filter(id__in=[email.id for email in emails]).update(
+                next_attempt_at=at + QUEUED_EMAIL_LEASE
+            )
+        return emails
+
+
+class QueuedEmail(models.Model):
+    """Email written in the transaction of the request which asked for it, and sent later by a worker.
+
+    The emails which cannot be sent are tried again with an increasing delay, see send_queued_emails.
+    """
+
+    created_at = models.DateTimeField(_("Creation date"), auto_now_add=True)
+    subject = models.CharField(_("Subject"), max_length=500)
+    body = models.TextField(_("Body"))
+    from_email = models.CharField(_("Sender"), max_length=254)
+    recipients = models.JSONField(_("Recipients"), default=list)
+    attempts = models.PositiveIntegerField(_("Attempts number"), default=0)
+    next_attempt_at = models.DateTimeField(_("Next attempt date"), default=now)
+    last_error = models.TextField(_("Last error"), blank=True, default="")
+    sent_at = models.DateTimeField(_("Sending date"), null=True, blank=True)
+
+    objects = QueuedEmailManager()
+
+    class Meta:
+        verbose_name = "Queued email"
+        verbose_name_plural = "Queued emails"
+        indexes = [
+            models.Index(fields=["next_attempt_at"], name="queued_email_due_idx", condition=Q(sent_at__isnull=True))
+        ]
+
+    def __str__(self):
+        return "%s , %s" % (", ".join(self.recipients), self.subject)
+
+    def get_message(self, connection=None):
+        return EmailMessage(self.subject, self.body, self.from_email, self.recipients, connection=connection)
+
+    def save_delivery(self):
+        self.save(update_fields=["attempts", "next_attempt_at", "last_error", "sent_at"])
+
+    def set_sent(self, at):
+        self.sent_at = at
+        self.last_error = ""
+
+    def set_failed(self, error, at):
+        self.attempts += 1
+        self.last_error = str(error)
+        self.next_attempt_at = at + QUEUED_EMAIL_RETRY_DELAY * 2 ** (self.attempts - 1)
@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.db import IntegrityError
+from django.db import models
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Sum
+from django.db.models.functions import Greatest
+from django.db.models.functions import TruncMonth
+from django.utils.translation import ugettext_lazy as _
+
+
+ROLLUP_FIELDS = ("consumed_minutes", "credited_hours", "event_count")
+
+
+def get_month(date):
+    return date.replace(day=1)
+
+
+def get_next_month(date):
+    return (get_month(date) + timedelta(days=31)).replace(day=1)
+
+
+def get_months_bounds(start, end):
+    """Returns the half-open range of dates of the months from the month of start to the month of end."""
+    return get_month(start), get_next_month(end)
+
+
+def iter_months(start, end):
+    month = get_month(start)
+    while month < end:
+        yield month
+        month = get_next_month(month)
+
+
+class ContractMonthlyRollupManager(models.Manager):
+    def add_deltas(self, contract_id, month, **deltas):
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        updated = (
+            self.get_queryset()
+            .filter(contract_id=contract_id, month=month)
+            .update(**{field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()})
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                self.create(
+                    contract_id=contract_id, month=month, **{field: max(delta, 0) for field, delta in deltas.items()}
+                )
+        except IntegrityError:
+            # created meanwhile by a concurrent event of the same month
+            self.add_deltas(contract_id, month, **deltas)
+
+    def compute(self, contract_ids, **kwargs):
+        """Returns the rollups of the given contracts computed from their events, without saving them.
+
+        The keyword arguments filter the events, to compute the rollups of a part of a month.
+        """
+        from .credit import MaintenanceCredit
+        from .issue import MaintenanceIssue
+
+        rollups = {}
+        for model in (MaintenanceIssue, MaintenanceCredit):
+            months = (
+                model._base_manager.filter(contract_id__in=contract_ids, **model.CONDITION_FIELDS, **kwargs)
+                .annotate(month=TruncMonth("date"))
+                .order_by()
+                .values("contract_id", "month")
+                .annotate(value=Sum(model.VALUE_FIELD), count=Count("id"))
+            )
+            for month in months:
+                key = (month["contract_id"], month["month"])
+                if key not in rollups:
+                    rollups[key] = self.model(contract_id=key[0], month=key[1])
+                rollup = rollups[key]
+                setattr(rollup, model.COUNTER_FIELD, getattr(rollup, model.COUNTER_FIELD) + (month["value"] or 0))
+                rollup.event_count += month["count"]
+        return list(rollups.values())
+
+    def rebuild(self, contract_ids):
+        with transaction.atomic():
+            self.get_queryset().filter(contract_id__in=contract_ids).delete()
+            return self.bulk_create(self.compute(contract_ids))
+
+
+class ContractMonthlyRollup(models.Model):
+    """Sums of the counted issues and credits of a contract dated in a month.
+
+    They are updated with the counters of the contract when an event is saved or deleted,
+    so the history of a project does not need to aggregate its events month by month.
+    """
+
+    contract = models.ForeignKey(
+        "maintenance.MaintenanceContract",
+        verbose_name=_("Contract"),
+        on_delete=models.CASCADE,
+        related_name="monthly_rollups",
+    )
+    # first day of the month
+    month = models.DateField(_("Month"))
+    consumed_minutes = models.PositiveIntegerField(_("Consumed minutes"), default=0)
+    credited_hours = models.PositiveIntegerField(_("Credited hours"), default=0)
+    event_count = models.PositiveIntegerField(_("Events number"), default=0)
+
+    objects = ContractMonthlyRollupManager()
+
+    class Meta:
+        verbose_name = "Contract monthly rollup"
+        verbose_name_plural = "Contracts monthly rollups"
+        constraints = [models.UniqueConstraint(fields=["contract", "month"], name="unique_contract_month_rollup")]
+
+    def __str__(self):
+        return "%s , %s" % (self.contract_id, self.month.strftime("%m/%Y"))
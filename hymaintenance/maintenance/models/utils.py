@@ -1,16 +1,19 @@
-from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
 
 from django.db import models
-from django.db.models import Case
+from django.db.models import BooleanField
 from django.db.models import CharField
+from django.db.models import DateField
+from django.db.models import F
+from django.db.models import IntegerField
 from django.db.models import Value
-from django.db.models import When
-from django.db.models.functions import Coalesce
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Cast
+from django.db.models.functions import TruncMonth
 
-
-def get_counter_name(event):
-    counter_name = event.company.contracts.filter(maintenance_type=event.contract.maintenance_type).first().counter_name
-    return counter_name if counter_name != "" else event.contract.maintenance_type.name
+from .other_models import MaintenanceType
+from .other_models import get_css_class
 
 
 class MaintenanceEventManager(models.Manager):
@@ -29,44 +32,105 @@ class MaintenanceEventManager(models.Manager):
     TYPE_VALUE = "event"
 
     def get_queryset(self):
-        return super().get_queryset()\
-            .select_related("contract", "contract__maintenance_type") \
-            .annotate(
-            counter_name=Coalesce(
-                Case(
-                    When(contract__counter_name__exact='', then=None),
-                    When(contract__counter_name__isnull=False, then='contract__counter_name'),
-                    default=None,
-                    output_field=CharField()
-                ),
-                "contract__maintenance_type__name"
-            ),
-            css_class=Case(
-                When(contract__maintenance_type__id__exact=1, then=Value("type-maintenance", CharField())),
-                When(contract__maintenance_type__id__exact=2, then=Value("type-support", CharField())),
-                When(contract__maintenance_type__id__exact=3, then=Value("type-correction", CharField())),
-                default=Value("type-maintenance", CharField()),
-                output_field=CharField()
-            ),
+        # the counter name and the css class are resolved from the contract after the fetch, see get_home_event
+        return super().get_queryset().select_related("contract", "contract__maintenance_type")
+
+    def home_union_values(self, company, contracts, **kwargs):
+        """Returns the events selected with the columns of the union of the issues and credits.
+
+        The columns are annotated in the same order for both models, the missing ones are null.
+        """
+        annotations = {}
+        for field, output_field in HOME_UNION_VALUES.items():
+            if field in self.HOME_VALUES or field in HOME_CONTRACT_VALUES:
+                expression = F(field)
+            else:
+                expression = Cast(Value(None), output_field=output_field)
+            annotations[get_home_union_alias(field)] = expression
+        return (
+            self.get_queryset()
+            .filter(contract__in=contracts, company_id=company, **self.SPECIFIC_FILTERS, **kwargs)
+            .annotate(type=Value(self.TYPE_VALUE, CharField()))
+            .annotate(**annotations, month=TruncMonth("date"))
+            .values(*(get_home_union_alias(field) for field in HOME_UNION_VALUES), "month")
         )
 
-    def home_history_values(self, company, contracts, last_month):
-        return self.get_queryset()\
-            .filter(
-                contract__in=contracts,
-                company_id=company,
-                date__lte=datetime.now(),
-                date__gte=last_month,
-                **self.SPECIFIC_FILTERS,)\
-            .annotate(type=Value(self.TYPE_VALUE, CharField()),)\
-            .values(*self.HOME_VALUES)
-
-    def home_forecast_values(self, company, contracts):
-        return self.get_queryset() \
-            .filter(
-                contract__in=contracts,
-                company_id=company,
-                date__gt=datetime.now(),
-                **self.SPECIFIC_FILTERS,)\
-            .annotate(type=Value(self.TYPE_VALUE, CharField()),)\
-            .values(*self.HOME_VALUES)
+
+# columns of the issues and credits displayed in the history and forecast of a project
+HOME_UNION_VALUES = {
+    "type": CharField(),
+    "date": DateField(),
+    "number_minutes": IntegerField(),
+    "hours_number": IntegerField(),
+    "subject": CharField(),
+    "contract__counter_name": CharField(),
+    "contract__maintenance_type": IntegerField(),
+    "company_issue_number": IntegerField(),
+    "company__slug_name": CharField(),
+    "id": IntegerField(),
+    "contract": IntegerField(),
+    "is_available_time_counter": BooleanField(),
+}
+
+
+# columns of the contract of both models, the counter name and the css class of the events are resolved from them
+HOME_CONTRACT_VALUES = ("contract__counter_name", "contract__maintenance_type")
+
+
+def get_home_union_alias(field):
+    return "home_" + field.replace(LOOKUP_SEP, "_")
+
+
+def get_home_events_values(company, contracts, descending=False, **kwargs):
+    """Returns the issues and credits of the contracts in a single query, ordered by date.
+
+    The issues come before the credits of the same date, the issues are ordered by number and the credits by id.
+    """
+    from .credit import MaintenanceCredit
+    from .issue import MaintenanceIssue
+
+    issues = MaintenanceIssue.objects.home_union_values(company, contracts, **kwargs)
+    credits = MaintenanceCredit.objects.home_union_values(company, contracts, **kwargs)
+    date_ordering = "-home_date" if descending else "home_date"
+    return issues.union(credits, all=True).order_by(
+        date_ordering, "-home_type", "home_company_issue_number", "home_id"
+    )
+
+
+def iter_home_events_by_month(events):
+    """Yields each month and its events as the dicts of the HOME_VALUES of their model."""
+    home_values = get_home_values()
+    maintenance_types_names = MaintenanceType.objects.get_cached_names()
+    for month, month_events in groupby(events.iterator(), key=itemgetter("month")):
+        yield month, [get_home_event(event, home_values, maintenance_types_names) for event in month_events]
+
+
+def iter_home_events(events, chunk_size=2000):
+    """Yields the events as the dicts of the HOME_VALUES of their model, fetched by chunks."""
+    home_values = get_home_values()
+    maintenance_types_names = MaintenanceType.objects.get_cached_names()
+    for event in events.iterator(chunk_size=chunk_size):
+        yield get_home_event(event, home_values, maintenance_types_names)
+
+
+def get_home_values():
+    from .credit import MaintenanceCredit
+    from .issue import MaintenanceIssue
+
+    return {
+        manager.TYPE_VALUE: [(get_home_union_alias(field), field) for field in manager.HOME_VALUES]
+        for manager in (MaintenanceIssue.objects, MaintenanceCredit.objects)
+    }
+
+
+def get_home_event(event, home_values, maintenance_types_names):
+    maintenance_type_id = event[get_home_union_alias("contract__maintenance_type")]
+    resolved_values = {
+        "counter_name": event[get_home_union_alias("contract__counter_name")]
+        or maintenance_types_names.get(maintenance_type_id, ""),
+        "css_class": get_css_class(maintenance_type_id),
+    }
+    return {
+        field: resolved_values[field] if field in resolved_values else event[alias]
+        for alias, field in home_values[event["home_type"]]
+    }
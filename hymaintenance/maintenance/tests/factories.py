@@ -107,13 +107,20 @@ class MaintenanceContractFactory(factory.django.DjangoModelFactory):
         else:
             return None
 
+    @classmethod
+    def _create(cls, model_class, *args, **kwargs):
+        contract = super()._create(model_class, *args, **kwargs)
+        # counters of a new contract start at zero, the asked credited hours are added by its first credit
+        contract.initial_credited_hours = kwargs.get("credited_hours")
+        return contract
+
     @factory.post_generation
     def create_credit(self, create, extracted, **kwargs):
         if not create:
             return
         if self.total_type == AVAILABLE_TOTAL_TIME:
             MaintenanceCreditFactory(
-                hours_number=self.credited_hours, contract=self, date=self.start, company=self.company
+                hours_number=self.initial_credited_hours, contract=self, date=self.start, company=self.company
             )
         if self.has_credit_recurrence:
             self.set_recurrence_dates_and_create_all_old_credit_occurrences(
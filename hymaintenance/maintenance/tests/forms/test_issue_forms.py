@@ -8,7 +8,9 @@ from toolkit.tests import create_temporary_file
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 from django.utils.translation import gettext as _
 
@@ -545,3 +547,22 @@ class MaintenanceIssueListArchiveFormTestCase(TestCase):
         form.save()
         self.assertTrue(MaintenanceIssue.objects.get(pk=self.issue1.pk).is_deleted)
         self.assertFalse(MaintenanceIssue.objects.get(pk=self.issue2.pk).is_deleted)
+
+    def test_unarchive_form_updates_each_contract_counters_once(self):
+        issues = MaintenanceIssueFactory.create_batch(
+            company=self.company, contract=self.contract, number_minutes=10, is_deleted=True, size=5
+        )
+        form = MaintenanceIssueListUnarchiveForm(data={"issues": [issue.pk for issue in issues]}, company=self.company)
+        self.assertTrue(form.is_valid(), form.errors)
+
+        with CaptureQueriesContext(connection) as context:
+            form.save()
+
+        contract_updates = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith('UPDATE "maintenance_maintenancecontract"')
+        ]
+        self.assertEqual(1, len(contract_updates))
+        self.contract.refresh_from_db()
+        self.assertEqual(50, self.contract.consumed_minutes)
@@ -1,15 +1,24 @@
+from datetime import timedelta
+
 from customers.tests.factories import CompanyFactory
 from freezegun import freeze_time
 from maintenance.models import MaintenanceCredit
+from maintenance.models import MaintenanceIssue
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import datetime
 from django.utils.timezone import now
 
+from ...models import ContractMonthlyRollup
 from ...models import MaintenanceContract
+from ...models.contract import CONSUMMED_TOTAL_TIME
+from ...models.contract import COUNTERS_SUMS
 from ...models.contract import MONTHLY
 from ...models.contract import get_next_month_date
 from ...models.contract import get_next_year_date
+from ...models.counters import defer_contracts_counters_updates
 from ..factories import IncomingChannelFactory
 from ..factories import MaintenanceContractFactory
 from ..factories import MaintenanceCreditFactory
@@ -205,6 +214,40 @@ class MaintenanceContractTestCase(TestCase):
 
         self.assertEqual(20, contract.get_number_credited_hours_in_month(today))
 
+    def test_get_number_consumed_minutes_by_month(self):
+        company, contract, _, _ = create_project()
+        MaintenanceIssueFactory(company=company, contract=contract, date=datetime(2019, 11, 30), number_minutes=10)
+        MaintenanceIssueFactory(company=company, contract=contract, date=datetime(2019, 12, 1), number_minutes=20)
+        MaintenanceIssueFactory(company=company, contract=contract, date=datetime(2019, 12, 31), number_minutes=30)
+        MaintenanceIssueFactory(
+            company=company, contract=contract, date=datetime(2019, 12, 2), number_minutes=40, is_deleted=True
+        )
+        MaintenanceIssueFactory(company=company, contract=contract, date=datetime(2020, 2, 1), number_minutes=50)
+
+        with CaptureQueriesContext(connection) as queries:
+            consumed = contract.get_number_consumed_minutes_by_month(datetime(2019, 11, 15), datetime(2020, 1, 3))
+
+        self.assertEqual(1, len(queries))
+        self.assertEqual(
+            {
+                datetime(2019, 11, 1).date(): 10,
+                datetime(2019, 12, 1).date(): 50,
+                datetime(2020, 1, 1).date(): 0,
+            },
+            consumed,
+        )
+
+    def test_get_number_credited_hours_by_month(self):
+        company, contract, _, _ = create_project(contract1={"start": datetime(2018, 1, 1).date()})
+        MaintenanceCreditFactory(company=company, contract=contract, date=datetime(2019, 12, 1), hours_number=5)
+        MaintenanceCreditFactory(company=company, contract=contract, date=datetime(2019, 12, 31), hours_number=15)
+        MaintenanceCreditFactory(company=company, contract=contract, date=datetime(2020, 1, 1), hours_number=2)
+
+        self.assertEqual(
+            {datetime(2019, 12, 1).date(): 20},
+            contract.get_number_credited_hours_by_month(datetime(2019, 12, 10), datetime(2019, 12, 10)),
+        )
+
     def test_get_current_issues(self):
         time1 = datetime(day=1, month=2, year=2021)
         time2 = datetime(day=1, month=1, year=2021)
@@ -549,6 +592,285 @@ class MaintenanceContractComputeTimesTestCase(TestCase):
         self.assertEqual(float(expected), contract.credited_hours)
 
 
+class MaintenanceContractIncrementalCountersTestCase(TestCase):
+    def assertCountersAreUpToDate(self, contract):
+        contract.refresh_from_db()
+        stored_counters = (contract.consumed_minutes, contract.credited_hours)
+        contract.compute_and_set_consumed_minutes()
+        contract.compute_and_set_credited_hours()
+        self.assertEqual((contract.consumed_minutes, contract.credited_hours), stored_counters)
+
+    def test_update_issue_number_minutes(self):
+        company, contract, _, _ = create_project(contract1={"start": datetime(day=1, month=1, year=2022).date()})
+        MaintenanceIssueFactory(contract=contract, company=company, number_minutes=30)
+        issue = MaintenanceIssue.objects.get(contract=contract)
+
+        issue.number_minutes = 50
+        with self.assertNumQueries(5):
+            issue.save()
+
+        contract.refresh_from_db()
+        self.assertEqual(50, contract.consumed_minutes)
+        self.assertCountersAreUpToDate(contract)
+
+    def test_update_issue_without_counted_modifications(self):
+        company, contract, _, _ = create_project()
+        MaintenanceIssueFactory(contract=contract, company=company, number_minutes=30)
+        issue = MaintenanceIssue.objects.get(contract=contract)
+
+        issue.subject = "Nothing to count"
+        with self.assertNumQueries(3):
+            issue.save()
+
+        self.assertCountersAreUpToDate(contract)
+
+    def test_archive_and_unarchive_issue(self):
+        company, contract, _, _ = create_project()
+        issue = MaintenanceIssueFactory(contract=contract, company=company, number_minutes=30)
+        MaintenanceIssueFactory(contract=contract, company=company, number_minutes=10)
+
+        issue.archive()
+        contract.refresh_from_db()
+        self.assertEqual(10, contract.consumed_minutes)
+
+        issue.is_deleted = False
+        issue.save()
+        contract.refresh_from_db()
+        self.assertEqual(40, contract.consumed_minutes)
+        self.assertCountersAreUpToDate(contract)
+
+    def test_future_issue_is_not_counted(self):
+        company, contract, _, _ = create_project()
+        issue = MaintenanceIssueFactory(
+            contract=contract, company=company, number_minutes=30, date=now().date() + timedelta(days=10)
+        )
+        contract.refresh_from_db()
+        self.assertEqual(0, contract.consumed_minutes)
+
+        issue.date = now().date()
+        issue.save()
+        contract.refresh_from_db()
+        self.assertEqual(30, contract.consumed_minutes)
+        self.assertCountersAreUpToDate(contract)
+
+    def test_move_issue_to_another_contract(self):
+        company, contract1, contract2, _ = create_project()
+        issue = MaintenanceIssueFactory(contract=contract1, company=company, number_minutes=30)
+
+        issue.contract = contract2
+        issue.save()
+
+        contract1.refresh_from_db()
+        contract2.refresh_from_db()
+        self.assertEqual(0, contract1.consumed_minutes)
+        self.assertEqual(30, contract2.consumed_minutes)
+        self.assertCountersAreUpToDate(contract1)
+        self.assertCountersAreUpToDate(contract2)
+
+    def test_move_issue_across_reset_date(self):
+        reset_date = datetime(day=1, month=3, year=2022).date()
+        company, contract, _, _ = create_project(
+            contract1={"credit_counter": True, "start": datetime(day=1, month=1, year=2022).date()}
+        )
+        contract.reset_date = reset_date
+        contract.save()
+        issue = MaintenanceIssueFactory(
+            contract=contract, company=company, number_minutes=60, date=datetime(day=1, month=4, year=2022).date()
+        )
+        contract.refresh_from_db()
+        self.assertEqual((60, 20), (contract.consumed_minutes, contract.credited_hours))
+
+        issue.date = datetime(day=1, month=2, year=2022).date()
+        issue.save()
+        contract.refresh_from_db()
+        self.assertEqual((0, 19), (contract.consumed_minutes, contract.credited_hours))
+        self.assertCountersAreUpToDate(contract)
+
+        issue.date = reset_date
+        issue.save()
+        self.assertCountersAreUpToDate(contract)
+
+    def test_update_and_delete_credit(self):
+        company, contract, _, _ = create_project(contract1={"credit_counter": True})
+        credit = MaintenanceCreditFactory(contract=contract, company=company, hours_number=5)
+        contract.refresh_from_db()
+        self.assertEqual(25, contract.credited_hours)
+
+        credit.hours_number = 8
+        credit.save()
+        contract.refresh_from_db()
+        self.assertEqual(28, contract.credited_hours)
+
+        credit.delete()
+        contract.refresh_from_db()
+        self.assertEqual(20, contract.credited_hours)
+        self.assertCountersAreUpToDate(contract)
+
+    def test_save_contract_does_not_overwrite_counters(self):
+        company, contract, _, _ = create_project()
+        outdated_contract = MaintenanceContract.objects.get(id=contract.id)
+        MaintenanceIssueFactory(contract=contract, company=company, number_minutes=30)
+
+        outdated_contract.email_alert = True
+        outdated_contract.save()
+
+        contract.refresh_from_db()
+        self.assertTrue(contract.email_alert)
+        self.assertEqual(30, contract.consumed_minutes)
+
+    def test_refresh_counters(self):
+        company, contract, _, _ = create_project()
+        MaintenanceIssueFactory(contract=contract, company=company, number_minutes=30)
+        MaintenanceContract.objects.filter(id=contract.id).update(consumed_minutes=1000)
+
+        contract.refresh_from_db()
+        contract.refresh_counters()
+
+        self.assertEqual(30, contract.consumed_minutes)
+        self.assertCountersAreUpToDate(contract)
+
+
+class MaintenanceContractCountersSumsTestCase(TestCase):
+    def create_events(self, company, contract):
+        for days, number_minutes, hours_number in ((-60, 300, 2), (-20, 45, 10), (-5, 30, 1), (30, 90, 4)):
+            date = now().date() + timedelta(days=days)
+            MaintenanceIssueFactory(contract=contract, company=company, number_minutes=number_minutes, date=date)
+            MaintenanceCreditFactory(contract=contract, company=company, hours_number=hours_number, date=date)
+        MaintenanceIssueFactory(contract=contract, company=company, number_minutes=600, is_deleted=True)
+
+    def get_expected_sums(self, contract):
+        def sum_of(events, field):
+            return sum(getattr(event, field) for event in events)
+
+        return {
+            "current_consumed_minutes": sum_of(contract.get_current_issues(), "number_minutes"),
+            "current_credited_hours": sum_of(contract.get_current_credits(), "hours_number"),
+            "old_consumed_minutes": sum_of(contract.get_old_issues(), "number_minutes"),
+            "old_credited_hours": sum_of(contract.get_old_credits(), "hours_number"),
+        }
+
+    def test_with_counters_sums(self):
+        company, contract1, contract2, contract3 = create_project(
+            contract1={"reset_date": now().date() - timedelta(days=30), "credit_counter": True},
+            contract2={"reset_date": now().date() - timedelta(days=10)},
+        )
+        for contract in (contract1, contract2, contract3):
+            self.create_events(company, contract)
+
+        with self.assertNumQueries(1):
+            contracts = list(MaintenanceContract.objects.with_counters_sums(company=company))
+
+        self.assertEqual(3, len(contracts))
+        for contract in contracts:
+            self.assertEqual(
+                self.get_expected_sums(contract), {name: getattr(contract, name) for name in COUNTERS_SUMS}
+            )
+
+    def test_compute_and_set_counters_with_carry_over(self):
+        company, contract, _, _ = create_project(
+            contract1={"reset_date": now().date() - timedelta(days=30), "credit_counter": True}
+        )
+        self.create_events(company, contract)
+
+        annotated_contract = MaintenanceContract.objects.with_counters_sums(id=contract.id).get()
+        with self.assertNumQueries(0):
+            annotated_contract.compute_and_set_counters()
+
+        # 2 hours credited and 300 minutes consumed before the reset
+        self.assertEqual(45 + 30 + 180, annotated_contract.consumed_minutes)
+        # 20 hours are credited at the creation of the contract
+        self.assertEqual(20 + 10 + 1, annotated_contract.credited_hours)
+        self.assertEqual(-180, annotated_contract.get_delta_credits_minutes())
+
+    def test_compute_and_set_counters_with_unsaved_reset_date(self):
+        company, contract, _, _ = create_project(contract1={"credit_counter": True})
+        self.create_events(company, contract)
+        contract.reset_date = now().date() - timedelta(days=10)
+
+        with self.assertNumQueries(1):
+            contract.compute_and_set_counters()
+
+        self.assertEqual(self.get_expected_sums(contract), contract.get_counters_sums())
+        self.assertEqual(30, contract.consumed_minutes)
+        self.assertEqual(20 + 1 + (2 + 10) - (300 + 45) / 60, contract.credited_hours)
+
+    def test_refresh_counters_queries(self):
+        company, contract, _, _ = create_project(contract1={"reset_date": now().date() - timedelta(days=30)})
+        self.create_events(company, contract)
+
+        with self.assertNumQueries(2):
+            contract.refresh_counters()
+
+
+class DeferredContractsCountersUpdatesTestCase(TestCase):
+    def test_counters_are_updated_when_leaving_the_block(self):
+        company, contract1, contract2, _ = create_project()
+        issue = MaintenanceIssueFactory(contract=contract1, company=company, number_minutes=10)
+
+        with defer_contracts_counters_updates():
+            MaintenanceIssueFactory.create_batch(contract=contract1, company=company, number_minutes=20, size=3)
+            MaintenanceIssueFactory(contract=contract2, company=company, number_minutes=15)
+            issue.archive()
+            self.assertEqual(10, MaintenanceContract.objects.get(id=contract1.id).consumed_minutes)
+
+        contract1.refresh_from_db()
+        contract2.refresh_from_db()
+        self.assertEqual(60, contract1.consumed_minutes)
+        self.assertEqual(15, contract2.consumed_minutes)
+
+    def test_one_update_per_contract(self):
+        company, contract, _, _ = create_project()
+
+        with CaptureQueriesContext(connection) as context:
+            with defer_contracts_counters_updates():
+                MaintenanceIssueFactory.create_batch(contract=contract, company=company, number_minutes=20, size=5)
+
+        contract_updates = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith('UPDATE "maintenance_maintenancecontract"')
+        ]
+        self.assertEqual(1, len(contract_updates))
+        contract.refresh_from_db()
+        self.assertEqual(100, contract.consumed_minutes)
+
+    def test_nested_blocks(self):
+        company, contract, _, _ = create_project()
+
+        with defer_contracts_counters_updates():
+            with defer_contracts_counters_updates():
+                MaintenanceIssueFactory(contract=contract, company=company, number_minutes=20)
+            self.assertEqual(0, MaintenanceContract.objects.get(id=contract.id).consumed_minutes)
+
+        contract.refresh_from_db()
+        self.assertEqual(20, contract.consumed_minutes)
+
+    def test_nothing_is_updated_when_the_block_fails(self):
+        company, contract, _, _ = create_project()
+
+        with self.assertRaises(ValueError):
+            with defer_contracts_counters_updates():
+                MaintenanceIssueFactory(contract=contract, company=company, number_minutes=20)
+                raise ValueError()
+
+        contract.refresh_from_db()
+        self.assertEqual(0, contract.consumed_minutes)
+        self.assertFalse(MaintenanceIssue.objects.filter(contract=contract).exists())
+
+    def test_contract_computed_again_in_the_block(self):
+        company, contract, _, _ = create_project(contract1={"credit_counter": True})
+
+        with defer_contracts_counters_updates():
+            MaintenanceIssueFactory(contract=contract, company=company, number_minutes=30)
+            contract.reset_date = datetime(day=1, month=1, year=2000).date()
+            contract.save()
+            MaintenanceIssueFactory(contract=contract, company=company, number_minutes=15)
+
+        contract.refresh_from_db()
+        self.assertEqual(45, contract.consumed_minutes)
+        self.assertEqual(20, contract.credited_hours)
+
+
 class MaintenanceContractRecurrenceTestCase(TestCase):
     def test_has_annual_credit_recurrence(self):
         company, contract1, contract2, _ = create_project(
@@ -812,6 +1134,104 @@ class MaintenanceContractRecurrenceTestCase(TestCase):
         self.assertEqual(11, contract.recurrence_next_date.month)
         self.assertEqual(2021, contract.recurrence_next_date.year)
 
+    @freeze_time("2021/10/1")
+    def test_set_monthly_recurrence_of_a_year_creates_the_credits_at_once(self):
+        time = datetime(day=31, month=10, year=2020).date()
+        company, contract, _, _ = create_project(
+            contract1={
+                "credit_counter": True,
+                "start": time,
+                "recurrence_start_date": time,
+                "hours_to_credit": 2,
+                "has_reset_recurrence": True,
+            }
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            contract.set_monthly_recurrence()
+
+        self.assertLess(len(queries), 15)
+        credits = MaintenanceCredit.objects.filter(contract=contract, is_recurrence=True).order_by("date")
+        self.assertEqual(12, credits.count())
+        self.assertEqual(datetime(day=28, month=2, year=2021).date(), credits[4].date)
+        self.assertEqual(datetime(day=30, month=9, year=2021).date(), contract.reset_date)
+        self.assertEqual(datetime(day=31, month=10, year=2021).date(), contract.recurrence_next_date)
+        contract.refresh_from_db()
+        # the credit of the last occurrence and the remaining time before the reset
+        self.assertEqual(2 + 20 + 11 * 2, contract.credited_hours)
+        self.assertEqual(
+            2, ContractMonthlyRollup.objects.get(contract=contract, month=datetime(2021, 8, 1).date()).credited_hours
+        )
+
+    def test_get_recurrence_schedule(self):
+        time = datetime(day=30, month=11, year=2021).date()
+        company, contract, _, _ = create_project(contract1={"monthly_recurrence": True, "recurrence_start_date": time})
+        MaintenanceIssueFactory(company=company, contract=contract, number_minutes=25 * 60, date=contract.start)
+        contract.refresh_from_db()
+
+        with self.assertNumQueries(0):
+            schedule = contract.get_recurrence_schedule(3)
+
+        self.assertEqual(
+            [
+                {"date": time, "credited_hours": 40, "remaining_hours": 15},
+                {"date": datetime(day=30, month=12, year=2021).date(), "credited_hours": 60, "remaining_hours": 35},
+                {"date": datetime(day=30, month=1, year=2022).date(), "credited_hours": 80, "remaining_hours": 55},
+            ],
+            schedule,
+        )
+
+    def test_get_recurrence_schedule_with_reset(self):
+        time = datetime(day=31, month=1, year=2022).date()
+        company, contract, _, _ = create_project(
+            contract1={"monthly_recurrence": True, "recurrence_start_date": time, "has_reset_recurrence": True}
+        )
+        MaintenanceIssueFactory(company=company, contract=contract, number_minutes=25 * 60, date=contract.start)
+        contract.refresh_from_db()
+
+        self.assertEqual(
+            [
+                {"date": time, "credited_hours": 20, "remaining_hours": 15},
+                {"date": datetime(day=28, month=2, year=2022).date(), "credited_hours": 35, "remaining_hours": 35},
+            ],
+            contract.get_recurrence_schedule(2),
+        )
+
+    def test_get_recurrence_schedule_with_reset_of_a_consumed_time_counter(self):
+        time = datetime(day=31, month=1, year=2022).date()
+        company, contract, _, _ = create_project(
+            contract1={
+                "monthly_recurrence": True,
+                "recurrence_start_date": time,
+                "has_reset_recurrence": True,
+                "total_type": CONSUMMED_TOTAL_TIME,
+            }
+        )
+        MaintenanceIssueFactory(company=company, contract=contract, number_minutes=25 * 60, date=contract.start)
+        contract.refresh_from_db()
+
+        self.assertEqual(
+            [
+                {"date": time, "credited_hours": 20, "remaining_hours": 20},
+                {"date": datetime(day=28, month=2, year=2022).date(), "credited_hours": 20, "remaining_hours": 20},
+            ],
+            contract.get_recurrence_schedule(2),
+        )
+
+    def test_get_recurrence_schedule_follows_the_recurrence_fields(self):
+        time = datetime(day=2, month=12, year=2021).date()
+        company, contract, _, _ = create_project(contract1={"annual_recurrence": True, "recurrence_start_date": time})
+        self.assertEqual(time, contract.get_recurrence_schedule(1)[0]["date"])
+
+        contract.recurrence_next_date = datetime(day=2, month=12, year=2022).date()
+        self.assertEqual(
+            [datetime(day=2, month=12, year=2022).date(), datetime(day=2, month=12, year=2023).date()],
+            [occurrence["date"] for occurrence in contract.get_recurrence_schedule(2)],
+        )
+
+        contract.remove_recurrence()
+        self.assertEqual([], contract.get_recurrence_schedule())
+
 
 class NextDateTestCase(TestCase):
     def test_get_next_month_date(self):
@@ -828,6 +1248,13 @@ class NextDateTestCase(TestCase):
         self.assertEqual(1, next_time.month)
         self.assertEqual(2022, next_time.year)
 
+    def test_get_next_month_date_in_november(self):
+        time = datetime(day=30, month=11, year=2021)
+        next_time = get_next_month_date(time, time)
+        self.assertEqual(30, next_time.day)
+        self.assertEqual(12, next_time.month)
+        self.assertEqual(2021, next_time.year)
+
     def test_get_next_month_date_end_of_month(self):
         time = datetime(day=31, month=1, year=2022)
         next_time = get_next_month_date(time, time)
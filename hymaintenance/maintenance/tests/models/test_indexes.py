@@ -0,0 +1,77 @@
+import datetime
+
+from django.db import connection
+from django.db.models import Max
+from django.test import TestCase
+
+from ...models import MaintenanceIssue
+from ...models.utils import get_home_events_values
+from ..factories import MaintenanceCreditFactory
+from ..factories import MaintenanceIssueFactory
+from ..factories import create_project
+
+
+class EventsIndexesTestCase(TestCase):
+    """The hot queries of the issues and credits are planned with their indexes, whatever the size of the tables."""
+
+    def setUp(self):
+        if connection.vendor not in ("postgresql", "sqlite"):
+            self.skipTest("the plans are only checked for PostgreSQL and SQLite")
+        if connection.vendor == "postgresql":
+            # the tables of the tests are too small for the planner to prefer an index
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+            self.addCleanup(self.reset_seqscan)
+        self.company, self.contract, self.other_contract, _ = create_project()
+        MaintenanceIssueFactory(company=self.company, contract=self.contract, date=datetime.date(2019, 4, 2))
+        MaintenanceCreditFactory(company=self.company, contract=self.contract, date=datetime.date(2019, 4, 2))
+
+    def reset_seqscan(self):
+        with connection.cursor() as cursor:
+            cursor.execute("RESET enable_seqscan")
+
+    def assertUsesIndexes(self, queryset, *indexes_names):
+        plan = queryset.explain()
+        for index_name in indexes_names:
+            self.assertIn(index_name, plan)
+
+    def test_current_issues_of_a_contract(self):
+        self.assertUsesIndexes(self.contract.get_current_issues(), "issue_contract_date_idx")
+
+    def test_consumed_minutes_of_a_month(self):
+        self.assertUsesIndexes(
+            MaintenanceIssue.objects.filter(
+                contract=self.contract,
+                is_deleted=False,
+                date__gte=datetime.date(2019, 4, 1),
+                date__lt=datetime.date(2019, 5, 1),
+            ),
+            "issue_contract_date_idx",
+        )
+
+    def test_history_events(self):
+        self.assertUsesIndexes(
+            get_home_events_values(
+                self.company,
+                [self.contract, self.other_contract],
+                date__gte=datetime.date(2019, 4, 1),
+                date__lt=datetime.date(2019, 5, 1),
+            ),
+            "issue_company_date_idx",
+            "credit_company_date_idx",
+        )
+
+    def test_credits_of_a_contract(self):
+        self.assertUsesIndexes(
+            self.contract.maintenancecredit_set.filter(date__gte=datetime.date(2019, 4, 1)).order_by("date"),
+            "credit_contract_date_idx",
+        )
+
+    def test_last_activity_date_of_a_company(self):
+        self.assertUsesIndexes(
+            MaintenanceIssue._base_manager.filter(company=self.company, is_deleted=False)
+            .order_by()
+            .values("company")
+            .annotate(last_date=Max("date")),
+            "issue_company_date_idx",
+        )
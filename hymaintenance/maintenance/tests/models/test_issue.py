@@ -7,6 +7,7 @@ from freezegun import freeze_time
 
 from django.conf import settings
 from django.core.files import File
+from django.db import connection
 from django.test import TestCase
 from django.utils.timezone import datetime
 from django.utils.timezone import now
@@ -106,6 +107,20 @@ class MaintenanceIssueTestCase(TestCase):
         issue.archive()
         self.assertTrue(MaintenanceIssue.objects.get(pk=issue.pk).is_deleted)
 
+    def test_get_counter_name(self):
+        company, contract, _, _ = create_project(contract1={"counter_name": "Custom"})
+        MaintenanceIssueFactory(company=company, contract=contract)
+        issue = MaintenanceIssue.objects.get(contract=contract)
+
+        with self.assertNumQueries(0):
+            self.assertEqual("Custom", issue.get_counter_name())
+
+        contract.counter_name = ""
+        contract.save()
+        issue = MaintenanceIssue.objects.get(contract=contract)
+        with self.assertNumQueries(0):
+            self.assertEqual("Maintenance", issue.get_counter_name())
+
     def test_contract_consumed_minutes_update(self):
         company, contract, _, _ = create_project()
         self.assertEqual(0, contract.consumed_minutes)
@@ -123,6 +138,19 @@ class MaintenanceIssueTestCase(TestCase):
         contract.refresh_from_db()
         self.assertEqual(0, contract.consumed_minutes)
 
+    def test_issue_loaded_with_deferred_fields_moved_to_another_contract(self):
+        company, contract, other_contract, _ = create_project()
+        issue = MaintenanceIssue.objects.create(company=company, date=now(), contract=contract, number_minutes=40)
+
+        issue = MaintenanceIssue._base_manager.defer("number_minutes").get(id=issue.id)
+        issue.contract = other_contract
+        issue.save()
+
+        contract.refresh_from_db()
+        other_contract.refresh_from_db()
+        self.assertEqual(0, contract.consumed_minutes)
+        self.assertEqual(40, other_contract.consumed_minutes)
+
     @freeze_time("2021-02-02")
     def test_contract_consumed_minutes_update_when_old_issues(self):
         start_date = datetime(day=4, month=4, year=2019).date()
@@ -136,3 +164,59 @@ class MaintenanceIssueTestCase(TestCase):
         MaintenanceIssue.objects.create(company=company, date=time2, contract=contract, number_minutes=20 * 60 + 40)
         contract.refresh_from_db()
         self.assertEqual(80, contract.consumed_minutes)
+
+
+class MaintenanceIssueSearchTestCase(TestCase):
+    def setUp(self):
+        self.company, self.contract, _, _ = create_project()
+
+    def create_issue(self, **kwargs):
+        return MaintenanceIssueFactory(company=self.company, contract=self.contract, **kwargs)
+
+    def search(self, text):
+        return set(MaintenanceIssue.objects.search(text).values_list("subject", flat=True))
+
+    def test_search_subject_description_and_answer(self):
+        self.create_issue(subject="Portal gun", description="The blue portal does not open")
+        self.create_issue(subject="Turrets", answer="The turrets are calibrated")
+        self.create_issue(subject="Cake")
+
+        self.assertEqual({"Portal gun"}, self.search("portal"))
+        self.assertEqual({"Turrets"}, self.search("CALIBRATED turret"))
+        self.assertEqual({"Portal gun", "Turrets"}, self.search("the"))
+        self.assertEqual({"Portal gun"}, self.search('blue "open'))
+        self.assertEqual(set(), self.search("portal turrets"))
+        self.assertEqual(set(), self.search(" ' * "))
+
+    def test_search_triggers_exist_after_all_migrations(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("the search index is only kept by triggers with SQLite")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                [MaintenanceIssue._meta.db_table],
+            )
+            triggers = {row[0] for row in cursor.fetchall()}
+        self.assertLessEqual(
+            {"maintenance_issue_search_insert", "maintenance_issue_search_delete", "maintenance_issue_search_update"},
+            triggers,
+        )
+
+    def test_search_follows_the_modifications_of_the_issues(self):
+        issue = self.create_issue(subject="Portal gun")
+        # without the signals of the save
+        MaintenanceIssue.objects.bulk_create(
+            [
+                MaintenanceIssue(
+                    company=self.company, contract=self.contract, company_issue_number=2, subject="Portal", date=now()
+                )
+            ]
+        )
+
+        issue.subject = "Turrets"
+        issue.save()
+        self.assertEqual({"Portal"}, self.search("portal"))
+        self.assertEqual({"Turrets"}, self.search("turrets"))
+
+        issue.delete()
+        self.assertEqual(set(), self.search("turrets"))
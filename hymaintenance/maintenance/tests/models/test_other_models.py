@@ -1,3 +1,8 @@
+from toolkit.tests import ReferenceDataCachesTestMixin
+
+from django.core.signals import request_started
+from django.db import DatabaseError
+from django.db import transaction
 from django.test import TestCase
 
 from ...models import IncomingChannel
@@ -5,7 +10,7 @@ from ...models import MaintenanceType
 from ..factories import IncomingChannelFactory
 
 
-class MaintenanceTypeTestCase(TestCase):
+class MaintenanceTypeTestCase(ReferenceDataCachesTestMixin, TestCase):
     def test_i_can_create_a_maintenance_type(self):
         MaintenanceType.objects.all().delete()
         MaintenanceType.objects.create(name="Support")
@@ -14,6 +19,71 @@ class MaintenanceTypeTestCase(TestCase):
     def test_str_is_good_for_maintenance_typ(self):
         self.assertEqual("Maintenance", str(MaintenanceType.objects.order_by("id").first()))
 
+    def test_get_cached(self):
+        maintenance_types = MaintenanceType.objects.get_cached()
+        self.assertEqual(list(MaintenanceType.objects.order_by("id")), maintenance_types)
+
+        with self.assertNumQueries(0):
+            self.assertIs(maintenance_types, MaintenanceType.objects.get_cached())
+
+    def test_get_cached_after_modifications(self):
+        MaintenanceType.objects.get_cached()
+
+        maintenance_type = MaintenanceType.objects.get(id=2)
+        maintenance_type.name = "Assistance"
+        maintenance_type.save()
+        self.assertEqual("Assistance", MaintenanceType.objects.get_cached()[1].name)
+
+        maintenance_type.delete()
+        self.assertEqual([1, 3], [maintenance_type.id for maintenance_type in MaintenanceType.objects.get_cached()])
+
+    def test_get_cached_loaded_again_by_each_request(self):
+        MaintenanceType.objects.get_cached()
+        # as by another process
+        MaintenanceType.objects.filter(id=1).update(name="Upkeep")
+        self.assertEqual("Maintenance", MaintenanceType.objects.get_cached()[0].name)
+
+        request_started.send(sender=self.__class__)
+
+        self.assertEqual("Upkeep", MaintenanceType.objects.get_cached()[0].name)
+
+    def test_get_cached_after_a_rollback(self):
+        MaintenanceType.objects.get_cached()
+
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                MaintenanceType.objects.filter(id=1).update(name="Upkeep")
+                MaintenanceType.objects.get(id=1).save()
+                self.assertEqual("Upkeep", MaintenanceType.objects.get_cached()[0].name)
+                raise DatabaseError()
+
+        with self.assertNumQueries(0):
+            self.assertEqual("Maintenance", MaintenanceType.objects.get_cached()[0].name)
+
+    def test_get_cached_after_a_commit(self):
+        MaintenanceType.objects.get_cached()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            maintenance_type = MaintenanceType.objects.get(id=1)
+            maintenance_type.name = "Upkeep"
+            maintenance_type.save()
+            self.assertEqual("Upkeep", MaintenanceType.objects.get_cached()[0].name)
+
+        self.assertEqual("Upkeep", MaintenanceType.objects.get_cached()[0].name)
+
+    def test_get_cached_names(self):
+        MaintenanceType.objects.get_cached()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                {1: "Maintenance", 2: "Support", 3: "Corrective"}, MaintenanceType.objects.get_cached_names()
+            )
+
+    def test_css_class_and_form_label_of_more_than_three_types(self):
+        maintenance_type = MaintenanceType.objects.create(id=4, name="Hosting")
+        self.assertEqual("type-maintenance", maintenance_type.css_class())
+        self.assertEqual(MaintenanceType.FORM_LABELS[0], maintenance_type.form_label)
+        self.assertEqual("type-correction", MaintenanceType.objects.get(id=3).css_class())
+
 
 class IncomingChannelTestCase(TestCase):
     def test_i_can_create_an_incoming_channel(self):
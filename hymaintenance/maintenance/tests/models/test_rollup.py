@@ -0,0 +1,117 @@
+import datetime
+
+from django.test import TestCase
+
+from ...models import ContractMonthlyRollup
+from ...models import MaintenanceCredit
+from ...models import MaintenanceIssue
+from ...models.counters import defer_contracts_counters_updates
+from ..factories import MaintenanceCreditFactory
+from ..factories import MaintenanceIssueFactory
+from ..factories import create_project
+
+
+class ContractMonthlyRollupTestCase(TestCase):
+    def setUp(self):
+        self.company, self.contract, self.other_contract, _ = create_project(
+            contract1={"start": datetime.date(2012, 12, 21), "credit_counter": True}
+        )
+
+    def get_rollups(self, contract=None):
+        return {
+            rollup.month: (rollup.consumed_minutes, rollup.credited_hours, rollup.event_count)
+            for rollup in ContractMonthlyRollup.objects.filter(contract=contract or self.contract)
+        }
+
+    def test_events_are_summed_in_the_rollup_of_their_month(self):
+        MaintenanceIssueFactory(
+            company=self.company, contract=self.contract, date=datetime.date(2019, 4, 2), number_minutes=30
+        )
+        MaintenanceIssueFactory(
+            company=self.company, contract=self.contract, date=datetime.date(2019, 4, 30), number_minutes=15
+        )
+        MaintenanceCreditFactory(
+            company=self.company, contract=self.contract, date=datetime.date(2019, 4, 12), hours_number=8
+        )
+        MaintenanceIssueFactory(
+            company=self.company, contract=self.contract, date=datetime.date(2019, 5, 1), number_minutes=10
+        )
+
+        self.assertEqual(
+            {
+                datetime.date(2012, 12, 1): (0, 20, 1),
+                datetime.date(2019, 4, 1): (45, 8, 3),
+                datetime.date(2019, 5, 1): (10, 0, 1),
+            },
+            self.get_rollups(),
+        )
+
+    def test_rollups_follow_the_modifications_of_the_events(self):
+        issue = MaintenanceIssueFactory(
+            company=self.company, contract=self.contract, date=datetime.date(2019, 4, 2), number_minutes=30
+        )
+
+        issue.number_minutes = 50
+        issue.save()
+        self.assertEqual((50, 0, 1), self.get_rollups()[datetime.date(2019, 4, 1)])
+
+        issue.date = datetime.date(2019, 6, 5)
+        issue.save()
+        self.assertEqual((0, 0, 0), self.get_rollups()[datetime.date(2019, 4, 1)])
+        self.assertEqual((50, 0, 1), self.get_rollups()[datetime.date(2019, 6, 1)])
+
+        issue.contract = self.other_contract
+        issue.save()
+        self.assertEqual((0, 0, 0), self.get_rollups()[datetime.date(2019, 6, 1)])
+        self.assertEqual({datetime.date(2019, 6, 1): (50, 0, 1)}, self.get_rollups(self.other_contract))
+
+        issue.archive()
+        self.assertEqual({datetime.date(2019, 6, 1): (0, 0, 0)}, self.get_rollups(self.other_contract))
+
+    def test_rollups_follow_the_deletion_of_the_events(self):
+        credit = MaintenanceCreditFactory(
+            company=self.company, contract=self.contract, date=datetime.date(2019, 4, 12), hours_number=8
+        )
+        credit.delete()
+
+        self.assertEqual((0, 0, 0), self.get_rollups()[datetime.date(2019, 4, 1)])
+
+    def test_deferred_events_update_each_rollup_once(self):
+        with defer_contracts_counters_updates():
+            for day in range(1, 4):
+                MaintenanceCredit.objects.create(
+                    company=self.company, contract=self.contract, date=datetime.date(2019, 4, day), hours_number=2
+                )
+            self.assertNotIn(datetime.date(2019, 4, 1), self.get_rollups())
+
+        self.assertEqual((0, 6, 3), self.get_rollups()[datetime.date(2019, 4, 1)])
+
+    def test_events_loaded_with_deferred_fields_rebuild_the_rollups(self):
+        MaintenanceIssueFactory(
+            company=self.company, contract=self.contract, date=datetime.date(2019, 4, 2), number_minutes=30
+        )
+        ContractMonthlyRollup.objects.filter(contract=self.contract).update(consumed_minutes=1000)
+
+        issue = MaintenanceIssue._base_manager.defer("is_deleted").get(contract=self.contract)
+        issue.archive()
+
+        self.assertEqual({datetime.date(2012, 12, 1): (0, 20, 1)}, self.get_rollups())
+
+    def test_rebuild_computes_the_rollups_from_the_events(self):
+        MaintenanceIssueFactory(
+            company=self.company, contract=self.contract, date=datetime.date(2019, 4, 2), number_minutes=30
+        )
+        MaintenanceIssueFactory(
+            company=self.company,
+            contract=self.contract,
+            date=datetime.date(2019, 4, 3),
+            number_minutes=20,
+            is_deleted=True,
+        )
+        expected_rollups = self.get_rollups()
+        ContractMonthlyRollup.objects.all().delete()
+
+        ContractMonthlyRollup.objects.rebuild([self.contract.id])
+
+        self.assertEqual(expected_rollups, self.get_rollups())
+        self.assertEqual((30, 0, 1), expected_rollups[datetime.date(2019, 4, 1)])
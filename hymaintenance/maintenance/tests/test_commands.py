@@ -1,19 +1,49 @@
+import json
+import os
+import tempfile
+from datetime import date
+from datetime import timedelta
+from io import StringIO
+
 from customers.tests.factories import ManagerUserFactory
+from customers.tests.factories import OperatorUserFactory
+from freezegun import freeze_time
+from high_ui.models import CompanyDashboardSummary
+from high_ui.models import GeneralInformation
 
 from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import CommandError
 from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.test.utils import override_settings
 from django.utils.timezone import datetime
 from django.utils.timezone import now
 from django.utils.timezone import utc
 
+from ..management.commands.compute_contracts_times import compute_contracts_shard
+from ..management.commands.compute_contracts_times import compute_contracts_times
 from ..management.commands.recurrence import check_and_apply_credit_recurrence
+from ..management.commands.recurrence import count_arrived_events
+from ..models import ContractMonthlyRollup
+from ..models import MaintenanceContract
+from ..models import MaintenanceIssue
 from ..models.contract import AVAILABLE_TOTAL_TIME
+from .factories import IncomingChannelFactory
+from .factories import MaintenanceConsumerFactory
+from .factories import MaintenanceCreditFactory
+from .factories import MaintenanceIssueFactory
 from .factories import create_project
 
 
 class SendEmailAlertsCommandTestCase(TestCase):
+    def setUp(self):
+        # the backends are created by the command, they count on their class
+        BatchesEmailBackend.batches = []
+        BatchesEmailBackend.opened_connections = 0
+
     @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
     def test_if_email_alert_is_sent_when_minimum_is_reached(self):
         manager = ManagerUserFactory(
@@ -76,6 +106,66 @@ class SendEmailAlertsCommandTestCase(TestCase):
 
         self.assertEqual(0, len(mail.outbox))
 
+    def create_alerted_projects(self, projects_number):
+        if not hasattr(self, "recipient"):
+            self.recipient = ManagerUserFactory(email="cave.johnson@aperture-science.com")
+        contracts = []
+        for _ in range(projects_number):
+            company, contract, _, _ = create_project(
+                contract1={
+                    "credited_hours": 30,
+                    "credited_hours_min": 20,
+                    "total_type": AVAILABLE_TOTAL_TIME,
+                    "recipient": self.recipient,
+                    "email_alert": True,
+                }
+            )
+            MaintenanceIssueFactory(company=company, contract=contract, number_minutes=11 * 60, date=now().date())
+            contracts.append(contract)
+        return contracts
+
+    def test_contracts_are_selected_from_their_counters(self):
+        contract, not_reached_contract = self.create_alerted_projects(2)
+        MaintenanceIssue.objects.filter(contract=not_reached_contract).delete()
+
+        self.assertEqual([contract], list(MaintenanceContract.objects.filter_email_alerts()))
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+    def test_queries_do_not_depend_on_the_number_of_alerts(self):
+        self.create_alerted_projects(1)
+        GeneralInformation.objects.get_cached()
+        with CaptureQueriesContext(connection) as queries:
+            call_command("send_email_alerts")
+
+        self.create_alerted_projects(3)
+        with self.assertNumQueries(len(queries)):
+            call_command("send_email_alerts")
+        self.assertEqual(5, len(mail.outbox))
+
+    @override_settings(EMAIL_BACKEND="maintenance.tests.test_commands.BatchesEmailBackend")
+    def test_emails_are_sent_by_batches_through_one_connection(self):
+        self.create_alerted_projects(3)
+
+        call_command("send_email_alerts", "--batch-size", "2")
+
+        self.assertEqual([2, 1], BatchesEmailBackend.batches)
+        self.assertEqual(1, BatchesEmailBackend.opened_connections)
+
+
+class BatchesEmailBackend(locmem.EmailBackend):
+    """Keeps the size of each batch of sent emails and the number of opened connections."""
+
+    batches = []
+    opened_connections = 0
+
+    def open(self):
+        BatchesEmailBackend.opened_connections += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        self.batches.append(len(messages))
+        return super().send_messages(messages)
+
 
 class RecurrenceCommandTestCase(TestCase):
     def test_annual_recurrence_reached(self):
@@ -153,3 +243,305 @@ class RecurrenceCommandTestCase(TestCase):
         self.assertEqual(next_date.day, contract.recurrence_next_date.day)
         self.assertEqual(next_date.month, contract.recurrence_next_date.month)
         self.assertEqual(next_date.year, contract.recurrence_next_date.year)
+
+    def test_missed_occurrences_are_all_applied(self):
+        time = datetime(day=30, month=11, year=2021, tzinfo=utc).date()
+        _, contract, _, _ = create_project(contract1={"monthly_recurrence": True, "recurrence_start_date": time})
+
+        check_and_apply_credit_recurrence(date(2022, 3, 1))
+        contract.refresh_from_db()
+
+        credits = contract.maintenancecredit_set.filter(is_recurrence=True).order_by("date")
+        self.assertEqual(
+            [date(2021, 11, 30), date(2021, 12, 30), date(2022, 1, 30), date(2022, 2, 28)],
+            list(credits.values_list("date", flat=True)),
+        )
+        self.assertEqual(date(2022, 2, 28), contract.recurrence_last_date)
+        self.assertEqual(date(2022, 3, 30), contract.recurrence_next_date)
+        self.assertEqual(100, contract.credited_hours)
+        self.assertEqual(
+            20, ContractMonthlyRollup.objects.get(contract=contract, month=date(2022, 1, 1)).credited_hours
+        )
+
+    def test_recurrence_applied_again_does_not_credit_twice(self):
+        time = datetime(day=1, month=2, year=2021, tzinfo=utc).date()
+        _, contract, _, _ = create_project(contract1={"monthly_recurrence": True, "recurrence_start_date": time})
+        # credited by a run which failed before advancing the dates of the contract
+        MaintenanceCreditFactory(
+            company=contract.company, contract=contract, date=time, hours_number=20, is_recurrence=True
+        )
+
+        check_and_apply_credit_recurrence(date(2021, 3, 1))
+        check_and_apply_credit_recurrence(date(2021, 3, 1))
+        contract.refresh_from_db()
+
+        self.assertEqual(2, contract.maintenancecredit_set.filter(is_recurrence=True).count())
+        self.assertEqual(date(2021, 4, 1), contract.recurrence_next_date)
+        self.assertEqual(60, contract.credited_hours)
+
+    def test_queries_do_not_depend_on_the_number_of_contracts(self):
+        time = datetime(day=1, month=2, year=2021, tzinfo=utc).date()
+        create_project(contract1={"monthly_recurrence": True, "recurrence_start_date": time})
+        with CaptureQueriesContext(connection) as queries:
+            check_and_apply_credit_recurrence(date(2021, 3, 1))
+
+        for _ in range(3):
+            create_project(
+                contract1={"monthly_recurrence": True, "recurrence_start_date": time},
+                contract2={"annual_recurrence": True, "recurrence_start_date": time, "has_reset_recurrence": True},
+            )
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(6, len(check_and_apply_credit_recurrence(date(2021, 3, 1))))
+
+    def test_future_events_are_counted_once_reached(self):
+        with freeze_time("2021-03-01"):
+            company, contract, _, _ = create_project()
+            MaintenanceIssueFactory(company=company, contract=contract, number_minutes=60, date=date(2021, 3, 6))
+            contract.refresh_from_db()
+            self.assertEqual(0, contract.consumed_minutes)
+
+        with freeze_time("2021-03-06"):
+            MaintenanceIssueFactory(company=company, contract=contract, number_minutes=30, date=date(2021, 3, 6))
+            call_command("recurrence")
+            contract.refresh_from_db()
+            self.assertEqual(90, contract.consumed_minutes)
+            self.assertEqual(date(2021, 3, 6), contract.counted_until)
+
+    def test_future_events_deleted_before_being_counted(self):
+        with freeze_time("2021-03-01"):
+            company, contract, _, _ = create_project()
+            MaintenanceIssueFactory(company=company, contract=contract, number_minutes=30, date=date(2021, 3, 1))
+            issue = MaintenanceIssueFactory(
+                company=company, contract=contract, number_minutes=60, date=date(2021, 3, 6)
+            )
+
+        with freeze_time("2021-03-07"):
+            issue.delete()
+            contract.refresh_from_db()
+            self.assertEqual(30, contract.consumed_minutes)
+
+            call_command("recurrence")
+            contract.refresh_from_db()
+            self.assertEqual(30, contract.consumed_minutes)
+
+    def test_future_events_are_counted_when_days_are_missed(self):
+        with freeze_time("2021-03-01"):
+            company, contract, other_contract, _ = create_project()
+            MaintenanceIssueFactory(company=company, contract=contract, number_minutes=60, date=date(2021, 3, 6))
+            MaintenanceIssueFactory(company=company, contract=contract, number_minutes=45, date=date(2021, 3, 20))
+            call_command("recurrence")
+
+        with freeze_time("2021-03-10"):
+            self.assertEqual([contract], count_arrived_events())
+            contract.refresh_from_db()
+            other_contract.refresh_from_db()
+            self.assertEqual(60, contract.consumed_minutes)
+            self.assertEqual(date(2021, 3, 10), contract.counted_until)
+            self.assertEqual(date(2021, 3, 10), other_contract.counted_until)
+            self.assertEqual([], count_arrived_events())
+
+
+class ComputeContractsTimesCommandTestCase(TestCase):
+    def create_drifted_project(self, consumed_minutes=1000, **kwargs):
+        company, contract1, contract2, contract3 = create_project(contract1={"credit_counter": True}, **kwargs)
+        MaintenanceIssueFactory(company=company, contract=contract1, number_minutes=30, date=now().date())
+        MaintenanceIssueFactory(company=company, contract=contract2, number_minutes=45, date=now().date())
+        MaintenanceContract.objects.filter(id=contract1.id).update(consumed_minutes=consumed_minutes)
+        return company, contract1, contract2, contract3
+
+    def test_drifted_counters_are_fixed(self):
+        company, contract1, contract2, _ = self.create_drifted_project()
+        MaintenanceContract.objects.filter(id=contract2.id).update(credited_hours=12)
+
+        drifted_contracts = compute_contracts_times()
+
+        self.assertEqual(
+            [(contract1.id, company.id, 1000, 30, 20, 20), (contract2.id, company.id, 45, 45, 12, 0)],
+            [tuple(drifted) for drifted in drifted_contracts],
+        )
+        contract1.refresh_from_db()
+        contract2.refresh_from_db()
+        self.assertEqual((30, 20), (contract1.consumed_minutes, contract1.credited_hours))
+        self.assertEqual((45, 0), (contract2.consumed_minutes, contract2.credited_hours))
+        self.assertEqual([], compute_contracts_times())
+
+    def test_dashboard_summaries_of_the_fixed_contracts_are_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            company, _, _, _ = self.create_drifted_project()
+        CompanyDashboardSummary.objects.rebuild([company.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            compute_contracts_times(dry_run=True)
+        self.assertFalse(CompanyDashboardSummary.objects.get(company=company).is_stale())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            compute_contracts_times()
+        self.assertTrue(CompanyDashboardSummary.objects.get(company=company).is_stale())
+
+    def test_dry_run(self):
+        _, contract1, _, _ = self.create_drifted_project()
+        out = StringIO()
+
+        call_command("compute_contracts_times", "--dry-run", stdout=out)
+
+        self.assertIn("consumed minutes 1000 -> 30", out.getvalue())
+        self.assertIn("1 contracts have drifted counters.", out.getvalue())
+        contract1.refresh_from_db()
+        self.assertEqual(1000, contract1.consumed_minutes)
+
+    def test_company_filter(self):
+        company1, contract1, _, _ = self.create_drifted_project()
+        company2, contract2, _, _ = self.create_drifted_project()
+
+        call_command("compute_contracts_times", "--company", company2.slug_name, stdout=StringIO())
+
+        contract1.refresh_from_db()
+        contract2.refresh_from_db()
+        self.assertEqual(1000, contract1.consumed_minutes)
+        self.assertEqual(30, contract2.consumed_minutes)
+
+    def test_since_filter(self):
+        _, contract1, _, _ = self.create_drifted_project()
+        company2, contract2, _, _ = self.create_drifted_project()
+        future_date = now().date() + timedelta(days=30)
+        MaintenanceCreditFactory(company=company2, contract=contract2, hours_number=2, date=future_date)
+
+        since = (now().date() + timedelta(days=1)).isoformat()
+        call_command("compute_contracts_times", "--since", since, stdout=StringIO())
+
+        contract1.refresh_from_db()
+        contract2.refresh_from_db()
+        self.assertEqual(1000, contract1.consumed_minutes)
+        self.assertEqual(30, contract2.consumed_minutes)
+
+    def test_chunks_queries(self):
+        for _ in range(3):
+            self.create_drifted_project()
+
+        # the ids, then for each of the 2 chunks of the 9 contracts: savepoint, computation, update and release
+        with self.assertNumQueries(1 + 2 * 4):
+            drifted_contracts = compute_contracts_times(chunk_size=5)
+
+        self.assertEqual(3, len(drifted_contracts))
+
+    def test_shards_share_the_contracts_by_company(self):
+        companies_drifted_contracts = {}
+        for _ in range(3):
+            company, contract1, _, _ = self.create_drifted_project()
+            companies_drifted_contracts[company.id] = contract1.id
+
+        for shard in range(2):
+            drifted_contracts = compute_contracts_shard(dry_run=True, shard=shard, shards_number=2)
+            self.assertEqual(
+                sorted(
+                    contract_id
+                    for company_id, contract_id in companies_drifted_contracts.items()
+                    if company_id % 2 == shard
+                ),
+                [drifted.contract_id for drifted in drifted_contracts],
+            )
+
+
+class ImportIssuesCommandTestCase(TestCase):
+    def setUp(self):
+        self.company, self.contract, self.other_contract, _ = create_project(contract2={"counter_name": "Hotline"})
+        self.consumer = MaintenanceConsumerFactory(company=self.company, name="Chell")
+        self.operator = OperatorUserFactory(email="gordon.freeman@blackmesa.com")
+        self.operator.operator_for.add(self.company)
+        self.channel = IncomingChannelFactory(name="Carrier pigeon")
+        MaintenanceIssueFactory(company=self.company, contract=self.contract, number_minutes=10)
+
+    def write_file(self, extension, content):
+        file_descriptor, path = tempfile.mkstemp(suffix=extension)
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def call_import(self, path, *args):
+        out = StringIO()
+        call_command("import_issues", path, "--company", self.company.slug_name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        path = self.write_file(
+            ".csv",
+            "subject,date,contract,number_minutes,consumer,operator,incoming_channel,resolution_date,is_deleted\n"
+            "Portal gun,2019-04-02,Maintenance,30,Chell,Gordon.Freeman@blackmesa.com,Carrier pigeon,"
+            "2019-04-03T10:00:00,\n"
+            "Turrets,2019-04-20,Hotline,45,,,,,\n"
+            "Cake,2019-05-01,Maintenance,20,,,,,true\n",
+        )
+
+        out = self.call_import(path, "--chunk-size", "2")
+
+        self.assertIn("3 issues are imported.", out)
+        issues = list(MaintenanceIssue.objects.filter(company=self.company).order_by("company_issue_number"))
+        self.assertEqual([1, 2, 3, 4], [issue.company_issue_number for issue in issues])
+        issue = issues[1]
+        self.assertEqual(("Portal gun", date(2019, 4, 2), 30), (issue.subject, issue.date, issue.number_minutes))
+        self.assertEqual(
+            (self.contract.id, self.consumer.id, self.operator.id, self.channel.id),
+            (issue.contract_id, issue.consumer_who_ask_id, issue.user_who_fix_id, issue.incoming_channel_id),
+        )
+        self.assertEqual(date(2019, 4, 3), issue.resolution_date.date())
+        self.assertEqual(self.other_contract.id, issues[2].contract_id)
+        self.assertTrue(issues[3].is_deleted)
+
+        self.company.refresh_from_db()
+        self.assertEqual(4, self.company.issues_counter)
+        self.contract.refresh_from_db()
+        self.other_contract.refresh_from_db()
+        self.assertEqual(40, self.contract.consumed_minutes)
+        self.assertEqual(45, self.other_contract.consumed_minutes)
+        self.assertEqual(
+            (30, 1), ContractMonthlyRollup.objects.filter(contract=self.contract, month=date(2019, 4, 1))
+            .values_list("consumed_minutes", "event_count").get()
+        )
+
+    def test_import_json_lines(self):
+        path = self.write_file(
+            ".jsonl",
+            json.dumps({"subject": "Portal gun", "date": "2019-04-02", "contract": "Maintenance", "number_minutes": 30})
+            + "\n\n"
+            + json.dumps({"subject": "Turrets", "date": "2019-04-20", "contract": "Hotline", "is_deleted": False})
+            + "\n",
+        )
+
+        out = self.call_import(path)
+
+        self.assertIn("2 issues are imported.", out)
+        self.assertEqual(
+            [("Portal gun", 2), ("Turrets", 3)],
+            list(
+                MaintenanceIssue.objects.filter(company=self.company, company_issue_number__gt=1)
+                .order_by("company_issue_number")
+                .values_list("subject", "company_issue_number")
+            ),
+        )
+        self.other_contract.refresh_from_db()
+        self.assertEqual(0, self.other_contract.consumed_minutes)
+
+    def test_invalid_line_imports_nothing(self):
+        path = self.write_file(
+            ".csv",
+            "subject,date,contract,consumer\n"
+            "Portal gun,2019-04-02,Maintenance,Chell\n"
+            "Turrets,2019-04-20,Maintenance,Wheatley\n",
+        )
+
+        with self.assertRaisesMessage(CommandError, "Line 3: unknown consumer 'Wheatley'"):
+            self.call_import(path)
+
+        self.assertEqual(1, MaintenanceIssue.objects.filter(company=self.company).count())
+        self.company.refresh_from_db()
+        self.assertEqual(1, self.company.issues_counter)
+
+    def test_unknown_contract_and_format(self):
+        path = self.write_file(".csv", "subject,date,contract\nPortal gun,2019-04-02,Hosting\n")
+        with self.assertRaisesMessage(CommandError, "Line 2: unknown contract 'Hosting'"):
+            self.call_import(path)
+
+        path = self.write_file(".txt", "")
+        with self.assertRaisesMessage(CommandError, "use --format"):
+            self.call_import(path)
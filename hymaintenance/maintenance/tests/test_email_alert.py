@@ -1,18 +1,29 @@
+import smtplib
+
 from customers.tests.factories import ManagerUserFactory
 from customers.tests.factories import OperatorUserFactory
 from high_ui.models import GeneralInformation
 from high_ui.tests.utils import SetDjangoLanguage
 from toolkit.email import create_email_alert
 from toolkit.email import is_credited_hours_min_exceeded
+from toolkit.email import send_queued_emails
 
 from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends import locmem
+from django.core.management import call_command
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.utils.timezone import now
 
 from ..forms.issue import MaintenanceIssueCreateForm
+from ..models import MaintenanceIssue
+from ..models import QueuedEmail
 from ..models.contract import AVAILABLE_TOTAL_TIME
 from ..models.contract import CONSUMMED_TOTAL_TIME
+from ..models.outbox import QUEUED_EMAIL_LEASE
+from ..models.outbox import QUEUED_EMAIL_MAX_ATTEMPTS
+from ..models.outbox import QUEUED_EMAIL_RETRY_DELAY
 from .factories import IncomingChannelFactory
 from .factories import MaintenanceConsumerFactory
 from .factories import MaintenanceIssueFactory
@@ -182,7 +193,24 @@ class SendEmailAlertTestCase(TestCase):
         form = MaintenanceIssueCreateForm(company=self.company, data=dict_for_post)
         self.assertTrue(form.is_valid())
         self.assertTrue(form.save())
-        self.assertNotEqual(0, len(mail.outbox))
+        self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(1, QueuedEmail.objects.count())
+
+        self.assertEqual(1, send_queued_emails())
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual([self.manager.email], mail.outbox[0].to)
+
+    def test_issue_is_not_saved_when_the_email_alert_cannot_be_queued(self):
+        self.contract.recipient = None
+        self.contract.save()
+        dict_for_post = self.__get_dict_for_post("subject of the issue", None)
+
+        form = MaintenanceIssueCreateForm(company=self.company, data=dict_for_post)
+        self.assertTrue(form.is_valid())
+        with self.assertRaises(AttributeError):
+            form.save()
+        self.assertFalse(MaintenanceIssue.objects.filter(contract=self.contract).exists())
+        self.assertEqual(0, QueuedEmail.objects.count())
 
     @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
     def test_if_email_alert_is_not_sended_when_minimum_is_not_reached(self):
@@ -194,4 +222,153 @@ class SendEmailAlertTestCase(TestCase):
         form = MaintenanceIssueCreateForm(company=self.company, data=dict_for_post)
         self.assertTrue(form.is_valid())
         self.assertTrue(form.save())
-        self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(0, QueuedEmail.objects.count())
+
+
+class FailingEmailBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+
+class RejectingEmailBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        if any(message.subject == "Rejected" for message in messages):
+            raise smtplib.SMTPDataError(554, "Message rejected")
+        return super().send_messages(messages)
+
+
+class DisconnectingEmailBackend(locmem.EmailBackend):
+    disconnected = False
+
+    def close(self):
+        self.disconnected = False
+
+    def send_messages(self, messages):
+        if self.disconnected:
+            raise smtplib.SMTPServerDisconnected("please run connect() first")
+        if any(message.subject == "Disconnecting" for message in messages):
+            self.disconnected = True
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        return super().send_messages(messages)
+
+
+class BrokenEmailBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        if any(message.subject == "Broken" for message in messages):
+            raise ValueError("Header values may not contain linefeed or carriage return characters")
+        return super().send_messages(messages)
+
+
+class SendQueuedEmailsTestCase(TestCase):
+    def queue_email(self, subject="Alert"):
+        return QueuedEmail.objects.enqueue(
+            EmailMessage(subject, "Body", "gordon.freeman@blackmesa.com", ["cave.johnson@aperture-science.com"])
+        )
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+    def test_queued_emails_are_sent_once(self):
+        self.queue_email("First")
+        self.queue_email("Second")
+
+        self.assertEqual(2, send_queued_emails())
+        self.assertEqual(0, send_queued_emails())
+
+        self.assertEqual(["First", "Second"], [email.subject for email in mail.outbox])
+        self.assertEqual(["cave.johnson@aperture-science.com"], mail.outbox[0].to)
+        self.assertFalse(QueuedEmail.objects.filter(sent_at__isnull=True).exists())
+
+    @override_settings(EMAIL_BACKEND="maintenance.tests.test_email_alert.FailingEmailBackend")
+    def test_failed_emails_are_tried_again_later(self):
+        email = self.queue_email()
+        start = now()
+
+        self.assertEqual(0, send_queued_emails())
+        email.refresh_from_db()
+        self.assertEqual(1, email.attempts)
+        self.assertEqual("Connection unexpectedly closed", email.last_error)
+        self.assertGreaterEqual(email.next_attempt_at, start + QUEUED_EMAIL_RETRY_DELAY)
+        self.assertEqual(0, QueuedEmail.objects.filter_due().count())
+
+        self.assertEqual([email], list(QueuedEmail.objects.filter_due(email.next_attempt_at)))
+        with override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"):
+            QueuedEmail.objects.filter(id=email.id).update(next_attempt_at=start)
+            self.assertEqual(1, send_queued_emails())
+        email.refresh_from_db()
+        self.assertIsNotNone(email.sent_at)
+        self.assertEqual("", email.last_error)
+
+    @override_settings(EMAIL_BACKEND="maintenance.tests.test_email_alert.RejectingEmailBackend")
+    def test_delivery_of_each_email_is_recorded(self):
+        first = self.queue_email("First")
+        rejected = self.queue_email("Rejected")
+        last = self.queue_email("Last")
+
+        self.assertEqual(2, send_queued_emails())
+
+        self.assertEqual(["First", "Last"], [email.subject for email in mail.outbox])
+        for email in (first, rejected, last):
+            email.refresh_from_db()
+        self.assertIsNotNone(first.sent_at)
+        self.assertIsNotNone(last.sent_at)
+        self.assertIsNone(rejected.sent_at)
+        self.assertEqual(1, rejected.attempts)
+        self.assertIn("Message rejected", rejected.last_error)
+
+    @override_settings(EMAIL_BACKEND="maintenance.tests.test_email_alert.DisconnectingEmailBackend")
+    def test_connection_is_reopened_after_a_disconnection(self):
+        disconnecting = self.queue_email("Disconnecting")
+        self.queue_email("Last")
+
+        self.assertEqual(1, send_queued_emails())
+
+        self.assertEqual(["Last"], [email.subject for email in mail.outbox])
+        disconnecting.refresh_from_db()
+        self.assertIsNone(disconnecting.sent_at)
+        self.assertEqual("Connection unexpectedly closed", disconnecting.last_error)
+
+    @override_settings(EMAIL_BACKEND="maintenance.tests.test_email_alert.BrokenEmailBackend")
+    def test_unexpected_errors_are_recorded(self):
+        broken = self.queue_email("Broken")
+        self.queue_email("Last")
+
+        self.assertEqual(1, send_queued_emails())
+
+        self.assertEqual(["Last"], [email.subject for email in mail.outbox])
+        broken.refresh_from_db()
+        self.assertIsNone(broken.sent_at)
+        self.assertEqual(1, broken.attempts)
+        self.assertIn("linefeed", broken.last_error)
+
+    def test_claimed_emails_are_not_due_until_the_end_of_the_lease(self):
+        email = self.queue_email()
+        start = now()
+
+        self.assertEqual([email], QueuedEmail.objects.claim_due(10, start))
+        self.assertEqual([], QueuedEmail.objects.claim_due(10, start))
+        # the worker which claimed it stopped before recording its delivery
+        self.assertEqual([email], QueuedEmail.objects.claim_due(10, start + QUEUED_EMAIL_LEASE))
+
+    def test_delay_is_doubled_at_each_attempt(self):
+        email = self.queue_email()
+        start = now()
+
+        email.set_failed("error", start)
+        email.set_failed("error", start)
+        email.set_failed("error", start)
+
+        self.assertEqual(start + QUEUED_EMAIL_RETRY_DELAY * 4, email.next_attempt_at)
+
+    def test_emails_are_not_tried_after_the_last_attempt(self):
+        email = self.queue_email()
+        QueuedEmail.objects.filter(id=email.id).update(attempts=QUEUED_EMAIL_MAX_ATTEMPTS)
+
+        self.assertEqual(0, QueuedEmail.objects.filter_due().count())
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+    def test_command_sends_all_the_queued_emails(self):
+        for index in range(5):
+            self.queue_email(str(index))
+
+        call_command("send_queued_emails", "--batch-size", "2")
+
+        self.assertEqual(5, len(mail.outbox))
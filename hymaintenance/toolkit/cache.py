@@ -0,0 +1,67 @@
+import threading
+import weakref
+
+from django.core.signals import request_started
+from django.db import transaction
+from django.dispatch import receiver
+
+
+# all the caches of reference data, they are reset at the start of each request
+REFERENCE_DATA_CACHES = []
+
+
+class PendingInvalidation:
+    """Invalidation of a cache registered by a transaction modifying its data, until the transaction is committed.
+
+    Only the transaction references it with its other on_commit callbacks, so it is released if they are discarded
+    by a rollback.
+    """
+
+    def __init__(self, reference_data_cache):
+        self.reference_data_cache = reference_data_cache
+
+    def __call__(self):
+        self.reference_data_cache.local.pending_invalidations.discard(self)
+        self.reference_data_cache.invalidate()
+
+
+class ReferenceDataCache:
+    """Data loaded from a rarely modified table, kept during a request instead of being queried at each access.
+
+    Each request loads the data again at its first access, so the modifications of the other processes are seen
+    by the next request without sharing anything between the processes.
+    A transaction modifying the data loads it at each access until committed, uncommitted data is never kept.
+    """
+
+    def __init__(self, name, load):
+        self.name = name
+        self.load = load
+        self.local = threading.local()
+        REFERENCE_DATA_CACHES.append(self)
+
+    def get_pending_invalidations(self):
+        if not hasattr(self.local, "pending_invalidations"):
+            self.local.pending_invalidations = weakref.WeakSet()
+        return self.local.pending_invalidations
+
+    def get(self):
+        if self.get_pending_invalidations():
+            return self.load()
+        if not hasattr(self.local, "data"):
+            self.local.data = self.load()
+        return self.local.data
+
+    def invalidate(self):
+        self.local.__dict__.pop("data", None)
+
+    def invalidate_on_commit(self):
+        pending_invalidation = PendingInvalidation(self)
+        self.get_pending_invalidations().add(pending_invalidation)
+        # run at once without a transaction
+        transaction.on_commit(pending_invalidation)
+
+
+@receiver(request_started, dispatch_uid="reset_reference_data_caches")
+def reset_reference_data_caches(**kwargs):
+    for reference_data_cache in REFERENCE_DATA_CACHES:
+        reference_data_cache.invalidate()
@@ -1,8 +1,14 @@
+import smtplib
+import time
+
 from high_ui.models import GeneralInformation
+from maintenance.models import QueuedEmail
 from maintenance.models.contract import AVAILABLE_TOTAL_TIME
 from toolkit.pretty_print import pretty_print_minutes
 
 from django.core.mail import EmailMessage
+from django.core.mail import get_connection
+from django.utils.timezone import now
 from django.utils.translation import pgettext_lazy
 
 
@@ -21,8 +27,9 @@ def is_credited_hours_min_exceeded(contract):
     return False
 
 
-def create_email_alert(contract):
-    general_info = GeneralInformation.objects.all().order_by("id").first()
+def create_email_alert(contract, general_info=None):
+    if general_info is None:
+        general_info = GeneralInformation.objects.get_cached()
     hours = pretty_print_minutes(contract.get_number_remaining_minutes())
     counter = contract.get_counter_name()
     name = general_info.name
@@ -44,3 +51,59 @@ def create_email_alert(contract):
 def send_email_alert(contract):
     email = create_email_alert(contract)
     email.send()
+
+
+def queue_email_alert(contract):
+    """Writes the email alert of the contract in the current transaction, it is sent by send_queued_emails."""
+    return QueuedEmail.objects.enqueue(create_email_alert(contract))
+
+
+EMAIL_ALERTS_BATCH_SIZE = 50
+
+
+def send_email_alerts(contracts, batch_size=EMAIL_ALERTS_BATCH_SIZE, interval=0):
+    """Sends the email alerts of the contracts through a single connection, by batches spaced by interval seconds.
+
+    The contracts are expected with their recipient and the contact of their company, see
+    MaintenanceContractManager.filter_email_alerts. Returns the number of sent emails.
+    """
+    general_info = GeneralInformation.objects.get_cached()
+    emails = [create_email_alert(contract, general_info) for contract in contracts]
+    sent_number = 0
+    with get_connection() as connection:
+        for index in range(0, len(emails), batch_size):
+            if index and interval:
+                time.sleep(interval)
+            sent_number += connection.send_messages(emails[index:index + batch_size]) or 0
+    return sent_number
+
+
+def send_queued_emails(batch_size=EMAIL_ALERTS_BATCH_SIZE):
+    """Sends the queued emails due for delivery through a single connection, and returns the number of sent ones.
+
+    An email which cannot be sent is tried again later, with a delay doubled at each attempt. The emails are claimed
+    before being sent, so several workers can send the queued emails at the same time, and the delivery of each one
+    is recorded once sent, without any transaction kept open during the sending.
+    """
+    emails = QueuedEmail.objects.claim_due(batch_size)
+    if not emails:
+        return 0
+    sent_number = 0
+    connection = get_connection()
+    try:
+        for email in emails:
+            try:
+                connection.send_messages([email.get_message()])
+            except Exception as error:
+                # an email which cannot be built or sent must not stop the delivery of the other ones
+                if isinstance(error, smtplib.SMTPServerDisconnected):
+                    # reopened by the next sending
+                    connection.close()
+                email.set_failed(error, now())
+            else:
+                email.set_sent(now())
+                sent_number += 1
+            email.save_delivery()
+    finally:
+        connection.close()
+    return sent_number
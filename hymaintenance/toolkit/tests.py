@@ -2,6 +2,8 @@ from tempfile import NamedTemporaryFile
 
 from PIL import Image
 
+from .cache import reset_reference_data_caches
+
 
 def create_temporary_file(content=b"I am not empty"):
     tmp_file = NamedTemporaryFile(dir=None, delete=True)
@@ -17,3 +19,12 @@ def create_temporary_image():
     img.save(tmp_file)
     tmp_file.seek(0)
     return open(tmp_file.name, "rb")
+
+
+class ReferenceDataCachesTestMixin:
+    """Resets the caches of reference data after each test, its modifications are rolled back without invalidating
+    them."""
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(reset_reference_data_caches)